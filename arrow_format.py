@@ -0,0 +1,116 @@
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+# Accept header values mapped to the columnar formats they select
+MEDIA_TYPES = {
+    ARROW_STREAM_MEDIA_TYPE: "arrow",
+    "application/x-arrow-stream": "arrow",
+    PARQUET_MEDIA_TYPE: "parquet",
+    "application/x-parquet": "parquet",
+}
+
+
+def negotiate_format(accept):
+    """
+    Pick "arrow", "parquet" or "json" from an Accept header, honouring q-values.
+    """
+    best, best_q = "json", 0.0
+    for part in (accept or "").split(","):
+        fields = [field.strip() for field in part.split(";")]
+        media_type = fields[0].lower()
+        q = 1.0
+        for field in fields[1:]:
+            if field.startswith("q="):
+                try:
+                    q = float(field[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type in MEDIA_TYPES and q > best_q:
+            best, best_q = MEDIA_TYPES[media_type], q
+    return best
+
+
+def build_schema(columns):
+    """
+    Build an Arrow schema from (name, kind) pairs, where kind is "timestamp"
+    (epoch seconds), "int", "float", "string" or "dictionary"
+    (low-cardinality strings).
+    """
+    types = {
+        "timestamp": pa.timestamp("s"),
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "string": pa.string(),
+        "dictionary": pa.dictionary(pa.int32(), pa.string()),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def rows_to_batch(schema, rows):
+    """
+    Transpose row tuples into a columnar, dictionary-encoded record batch.
+    """
+    arrays = []
+    for index, field in enumerate(schema):
+        values = [row[index] for row in rows]
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(values, type=pa.string()).dictionary_encode().cast(field.type))
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _Drain(io.RawIOBase):
+    """
+    Write-only sink whose buffered bytes are handed out and released by take().
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_batches(schema, row_pages, fmt):
+    """
+    Encode an iterator of row pages as an Arrow IPC stream or a Parquet file,
+    yielding bytes after every page so only one page is held in memory.
+    Each page becomes one record batch (Arrow) or one row group (Parquet).
+    """
+    sink = _Drain()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        write = lambda batch: writer.write_table(pa.Table.from_batches([batch]))
+    else:
+        options = pa.ipc.IpcWriteOptions(compression="zstd")
+        writer = pa.ipc.new_stream(sink, schema, options=options)
+        write = writer.write_batch
+
+    for rows in row_pages:
+        if rows:
+            write(rows_to_batch(schema, rows))
+        chunk = sink.take()
+        if chunk:
+            yield chunk
+    writer.close()
+    yield sink.take()
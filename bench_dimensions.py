@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from bench_storage import copy_database, time_query
+from dimensions import DIMENSIONS, ENCODED_TABLES, dimension_table, key_column
+from generate_dataset import generate_database
+from migrations import EPOCH_COLUMNS, apply_migrations
+from rollups import rebuild_rollups
+
+DEFAULT_ROWS = 1000000
+DEFAULT_ITERATIONS = 10
+DEFAULT_DATA_DIR = "bench_data"
+DEFAULT_OUTPUT = "bench_dimensions.json"
+
+# Generated window of the benchmark data
+BENCH_START = "2025-03-01"
+BENCH_DAYS = 92
+
+# Schema version before dictionary encoding
+TEXT_VERSION = 4
+
+# GROUP BY queries timed on both layouts as (name, table, dimensions,
+# measures, days): `days` bounds the query to that many days in the middle
+# of the data, None reads every row.
+GROUP_QUERIES = [
+    ("sales_by_product", "sales_metrics", ["product"], ["SUM(revenue)", "SUM(profit)"], None),
+    ("sales_by_salesperson_product", "sales_metrics", ["salesperson", "product"], ["SUM(revenue)", "COUNT(*)"], None),
+    ("sales_by_country_endpoint", "sales_metrics", ["country", "endpoint"], ["SUM(revenue)"], 7),
+    ("weblogs_by_endpoint", "weblogs", ["endpoint"], ["COUNT(*)", "SUM(response_time_ms)"], None),
+    ("weblogs_by_user_agent", "weblogs", ["user_agent"], ["COUNT(*)"], None),
+    ("weblogs_by_country_method", "weblogs", ["country", "method"], ["COUNT(*)"], 7),
+]
+
+
+def build_text_database(source, db_file):
+    """
+    Copy a current database into the schema version 4 layout, where the
+    low-cardinality columns are stored as TEXT in every row.
+    """
+    apply_migrations(db_file, target=TEXT_VERSION)
+    connection = sqlite3.connect(db_file)
+    connection.execute("ATTACH DATABASE ? AS source", (source,))
+    with connection:
+        for table, columns in EPOCH_COLUMNS.items():
+            names = ", ".join(column for column, _ in columns)
+            connection.execute(f"INSERT INTO {table} ({names}) SELECT {names} FROM source.{table} ORDER BY id")
+        rebuild_rollups(connection)
+    connection.execute("DETACH DATABASE source")
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("ANALYZE")
+    connection.execute("VACUUM")
+    connection.close()
+
+
+def table_bytes(db_file):
+    """
+    Return the bytes each table takes together with its indexes, from the
+    dbstat table ({} where SQLite was built without it).
+    """
+    connection = sqlite3.connect(db_file)
+    try:
+        rows = connection.execute(
+            "SELECT m.tbl_name, SUM(s.pgsize) FROM dbstat s JOIN sqlite_master m ON m.name = s.name GROUP BY m.tbl_name"
+        ).fetchall()
+        return dict(rows)
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        connection.close()
+
+
+def bytes_per_row(before_db, after_db, rows):
+    """
+    Compare the bytes per row of each encoded table, indexes included. The
+    encoded side counts the fact table and the dimension tables it uses;
+    dimensions shared by both tables are counted in full for each.
+    """
+    before = table_bytes(before_db)
+    after = table_bytes(after_db)
+    result = {}
+    for table, (fact, encoded) in ENCODED_TABLES.items():
+        if table not in before or fact not in after:
+            continue
+        dimension_bytes = sum(after.get(dimension_table(column), 0) for column in encoded)
+        result[table] = {
+            "before_bytes": before[table],
+            "after_bytes": after[fact] + dimension_bytes,
+            "dimension_bytes": dimension_bytes,
+            "before_bytes_per_row": round(before[table] / rows, 2),
+            "after_bytes_per_row": round((after[fact] + dimension_bytes) / rows, 2),
+        }
+        print(f"  {table:<14} {result[table]['before_bytes_per_row']:>8.2f} -> "
+              f"{result[table]['after_bytes_per_row']:>8.2f} bytes/row ({dimension_bytes} bytes of dimensions)")
+    return result
+
+
+# Helper function to write one GROUP BY query three ways: over the TEXT
+# columns, through the decoding view, and grouped by key with the values
+# joined back afterwards
+def group_sql(table, dimensions, measures, ranged):
+    where = " WHERE timestamp >= ? AND timestamp < ?" if ranged else ""
+    order = ", ".join(str(position + 1) for position in range(len(dimensions)))
+    text = (f"SELECT {', '.join(dimensions + measures)} FROM {table}{where}"
+            f" GROUP BY {', '.join(dimensions)} ORDER BY {order}")
+    fact = ENCODED_TABLES[table][0]
+    keys = [key_column(column) for column in dimensions]
+    grouped = (f"SELECT {', '.join(keys)}, {', '.join(f'{measure} AS m{i}' for i, measure in enumerate(measures))}"
+               f" FROM {fact}{where} GROUP BY {', '.join(keys)}")
+    joins = " ".join(f"LEFT JOIN {dimension_table(column)} {column} ON {column}.id = g.{key_column(column)}"
+                     for column in dimensions)
+    by_key = (f"SELECT {', '.join(f'{column}.value' for column in dimensions)}, "
+              f"{', '.join(f'g.m{i}' for i in range(len(measures)))} FROM ({grouped}) g {joins} ORDER BY {order}")
+    return text, by_key
+
+
+def bench_groups(before_db, after_db, iterations):
+    """
+    Time every GROUP BY query on the TEXT layout, through the decoding view
+    and grouped by key on the encoded layout, checking that all three return
+    the same rows.
+    """
+    before = sqlite3.connect(before_db)
+    after = sqlite3.connect(after_db)
+    results = {}
+    try:
+        first, last = after.execute("SELECT MIN(timestamp), MAX(timestamp) FROM sales_facts").fetchone()
+        middle = (first + last) // 2
+        for name, table, dimensions, measures, days in GROUP_QUERIES:
+            params = (middle - days * 43200, middle + days * 43200) if days else ()
+            text_sql, key_sql = group_sql(table, dimensions, measures, bool(days))
+            expected = before.execute(text_sql, params).fetchall()
+            if after.execute(text_sql, params).fetchall() != expected or after.execute(key_sql, params).fetchall() != expected:
+                raise RuntimeError(f"{name} differs between the two layouts")
+            result = results[name] = {
+                "groups": len(expected),
+                "before_ms": time_query(before, text_sql, params, iterations),
+                "view_ms": time_query(after, text_sql, params, iterations),
+                "by_key_ms": time_query(after, key_sql, params, iterations),
+            }
+            print(f"  {name:<30} p50 {result['before_ms']['p50']:>9.3f} ms -> view {result['view_ms']['p50']:>9.3f} ms, "
+                  f"by key {result['by_key_ms']['p50']:>9.3f} ms")
+    finally:
+        before.close()
+        after.close()
+    return results
+
+
+# Helper function to time a full rollup rebuild, which reads every raw row
+def time_rebuild(db_file):
+    connection = sqlite3.connect(db_file)
+    try:
+        started = time.perf_counter()
+        with connection:
+            rebuild_rollups(connection, list(ENCODED_TABLES))
+        return round(time.perf_counter() - started, 3)
+    finally:
+        connection.close()
+
+
+def run_benchmark(rows, iterations, data_dir, seed=42):
+    """
+    Build a database with TEXT dimension columns, dictionary-encode a copy
+    of it through the migrations, and compare bytes per row, GROUP BY
+    latency and the rollup rebuild.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    source_db = os.path.join(data_dir, f"dimensions_source_{rows}_{seed}.db")
+    before_db = os.path.join(data_dir, "dimensions_before.db")
+    after_db = os.path.join(data_dir, "dimensions_after.db")
+    for path in (before_db, after_db):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    if not os.path.exists(source_db):
+        print(f"Generating {source_db} ...")
+        generate_database(source_db, rows, seed, start=BENCH_START, days=BENCH_DAYS)
+    print(f"Building the TEXT-dimension layout in {before_db} ...")
+    build_text_database(source_db, before_db)
+
+    print(f"Encoding a copy in {after_db} ...")
+    copy_database(before_db, after_db)
+    started = time.perf_counter()
+    apply_migrations(after_db)
+    migrate_seconds = round(time.perf_counter() - started, 3)
+    connection = sqlite3.connect(after_db)
+    connection.execute("ANALYZE")
+    connection.execute("VACUUM")
+    values = {column: connection.execute(f"SELECT COUNT(*) FROM {dimension_table(column)}").fetchone()[0]
+              for column in DIMENSIONS}
+    connection.close()
+
+    report = {
+        "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        "rows": rows,
+        "seed": seed,
+        "iterations": iterations,
+        "migrate_seconds": migrate_seconds,
+        "dimension_values": values,
+        "file_bytes": {"before": os.path.getsize(before_db), "after": os.path.getsize(after_db)},
+    }
+    print(f"Database size: {report['file_bytes']['before']} -> {report['file_bytes']['after']} bytes")
+    print("Bytes per row:")
+    report["bytes_per_row"] = bytes_per_row(before_db, after_db, rows)
+    print("GROUP BY queries:")
+    report["queries"] = bench_groups(before_db, after_db, iterations)
+    report["rollup_rebuild_seconds"] = {"before": time_rebuild(before_db), "after": time_rebuild(after_db)}
+    print(f"Rollup rebuild: {report['rollup_rebuild_seconds']['before']}s -> {report['rollup_rebuild_seconds']['after']}s")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare TEXT and dictionary-encoded dimension columns: bytes per row and GROUP BY latency")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="Rows per table of the generated database")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="Timed runs per query")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Where the benchmark databases are kept")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the generated database")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.rows, args.iterations, args.data_dir, args.seed)
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nWrote {args.out}.")
@@ -0,0 +1,288 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import fastapi_app
+from check_query_plans import FILTER_SALES_PARAM_SETS, PARAM_SETS, kpi_routes
+from generate_dataset import generate_database
+
+# Rows per table of each benchmark database
+SCALES = [10000, 1000000, 10000000]
+
+# Generated window; it covers the DATE_RANGE used by the parameter sets
+BENCH_START = "2025-03-01"
+BENCH_DAYS = 92
+
+DEFAULT_ITERATIONS = 20
+DEFAULT_DATA_DIR = "bench_data"
+DEFAULT_OUTPUT = "bench_results.json"
+
+# A case fails the baseline comparison when its p95 grows by more than the
+# threshold and by more than the noise floor
+DEFAULT_THRESHOLD = 0.25
+NOISE_FLOOR_MS = 2.0
+
+# /filter-sales without a limit returns every matching row, which at 10M rows
+# measures JSON encoding rather than the query, so the benchmark times the
+# first 1000-row page of each filter combination
+FILTER_SALES_PAGE = 1000
+
+# SQLite's default selectivity for range constraints without stat4:
+# one bound keeps about 1/4 of the rows, two bounds about 1/64
+RANGE_SELECTIVITY = {1: 4, 2: 64}
+
+# Table access step of an EXPLAIN QUERY PLAN line: operation, table, index, constraints
+PLAN_ACCESS = re.compile(r"^(SCAN|SEARCH) (\w+)(?: AS \w+)?(?: USING (?:COVERING )?(?:INDEX (\w+)|INTEGER PRIMARY KEY))?(?: \((.*)\))?")
+
+
+def bench_cases():
+    """
+    Return (path, params) for every /kpis endpoint with each KPI parameter set
+    and for /filter-sales with each filter combination.
+    """
+    cases = []
+    for path in kpi_routes():
+        if path.startswith("/kpis/"):
+            cases.extend((path, params) for params in PARAM_SETS)
+        elif path == "/filter-sales":
+            cases.extend((path, {"limit": FILTER_SALES_PAGE, **params}) for params in FILTER_SALES_PARAM_SETS)
+    return cases
+
+
+def case_name(path, params):
+    query = "&".join(f"{name}={value}" for name, value in sorted(params.items()))
+    return f"{path}?{query}" if query else path
+
+
+def seed_database(data_dir, rows, seed):
+    """
+    Return the benchmark database for `rows`, generating it on first use.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    db_file = os.path.join(data_dir, f"bench_{rows}_{seed}.db")
+    if not os.path.exists(db_file):
+        print(f"Generating {db_file} ...")
+        generate_database(db_file, rows, seed, start=BENCH_START, days=BENCH_DAYS)
+    return db_file
+
+
+def percentiles(samples):
+    """
+    Summarize latencies in seconds as milliseconds.
+    """
+    values = np.array(samples) * 1000
+    return {
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "mean": round(float(values.mean()), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+
+def capture_statements(client, path, params):
+    """
+    Call the endpoint once and return the SELECT statements it ran, with
+    their parameters bound.
+    """
+    statements = []
+
+    def trace(sql):
+        if sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append(sql)
+
+    fastapi_app.kpi_cache.clear()
+    fastapi_app.pool.set_trace_callback(trace)
+    try:
+        response = client.get(path, params=params)
+    finally:
+        fastapi_app.pool.set_trace_callback(None)
+    if response.status_code != 200:
+        raise RuntimeError(f"{path} {params} returned HTTP {response.status_code}: {response.text}")
+    return statements
+
+
+def time_asgi(client, path, params, iterations):
+    """
+    Time full requests through the ASGI app. The KPI cache is cleared before
+    each one, so every sample computes the result.
+    """
+    samples = []
+    for _ in range(iterations):
+        fastapi_app.kpi_cache.clear()
+        started = time.perf_counter()
+        response = client.get(path, params=params)
+        response.content  # the whole body is part of the sample
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+
+def time_sql(connection, statements, iterations):
+    """
+    Time the endpoint's statements run back to back on a plain connection.
+    """
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        for sql in statements:
+            connection.execute(sql).fetchall()
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+
+class PlanEstimator:
+    """
+    Estimates the rows each EXPLAIN QUERY PLAN step reads, the way the planner
+    does: full scans read the whole table, index searches read the rows left
+    after the equality prefix (from sqlite_stat1) narrowed by any range bounds.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._table_rows = {}
+        self._index_stats = {}
+        try:
+            for table, index, stat in connection.execute("SELECT tbl, idx, stat FROM sqlite_stat1"):
+                numbers = [int(value) for value in stat.split() if value.isdigit()]
+                if index is None:
+                    self._table_rows[table] = numbers[0]
+                else:
+                    self._index_stats[index] = numbers
+                    self._table_rows.setdefault(table, numbers[0])
+        except sqlite3.OperationalError:
+            pass  # never analyzed
+
+    def table_rows(self, table):
+        if table not in self._table_rows:
+            self._table_rows[table] = self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return self._table_rows[table]
+
+    def step_rows(self, detail):
+        match = PLAN_ACCESS.match(detail)
+        if not match:
+            return 0
+        operation, table, index, constraints = match.groups()
+        total = self.table_rows(table)
+        if operation == "SCAN":
+            return total
+        terms = [term.strip() for term in (constraints or "").split(" AND ") if term.strip()]
+        equalities = sum(1 for term in terms if term.endswith("=?") and not term.endswith(("<=?", ">=?")))
+        ranges = len(terms) - equalities
+        stats = self._index_stats.get(index)
+        if equalities and stats and len(stats) > equalities:
+            rows = stats[equalities]
+        elif equalities:
+            rows = max(total // 10 ** equalities, 1)
+        else:
+            rows = total
+        return max(rows // RANGE_SELECTIVITY.get(min(ranges, 2), 1), 1)
+
+    def explain(self, sql):
+        """
+        Return (plan lines, estimated rows read) for one statement.
+        """
+        plan = [row[3] for row in self.connection.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        return plan, sum(self.step_rows(detail) for detail in plan)
+
+
+def bench_scale(db_file, iterations):
+    """
+    Benchmark every case against one database and return {case: result}.
+    """
+    fastapi_app.use_database(db_file)
+    client = TestClient(fastapi_app.app)
+    connection = sqlite3.connect(db_file)
+    estimator = PlanEstimator(connection)
+    results = {}
+    try:
+        for path, params in bench_cases():
+            name = case_name(path, params)
+            statements = capture_statements(client, path, params)
+            queries = []
+            for sql in statements:
+                plan, rows = estimator.explain(sql)
+                queries.append({"sql": " ".join(sql.split()), "plan": plan, "estimated_rows_scanned": rows})
+            result = results[name] = {
+                "asgi_ms": time_asgi(client, path, params, iterations),
+                "sql_ms": time_sql(connection, statements, iterations),
+                "estimated_rows_scanned": sum(query["estimated_rows_scanned"] for query in queries),
+                "queries": queries,
+            }
+            print(f"  {name:<70} p50 {result['asgi_ms']['p50']:>9.3f} ms  "
+                  f"p95 {result['asgi_ms']['p95']:>9.3f} ms  sql p50 {result['sql_ms']['p50']:>9.3f} ms  "
+                  f"rows~{result['estimated_rows_scanned']}")
+    finally:
+        connection.close()
+        fastapi_app.pool.close()
+    return results
+
+
+def run_benchmarks(scales, iterations, data_dir, seed=42):
+    """
+    Seed (or reuse) one database per scale and benchmark each of them.
+    """
+    report = {
+        "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        "iterations": iterations,
+        "seed": seed,
+        "scales": {},
+    }
+    for rows in scales:
+        db_file = seed_database(data_dir, rows, seed)
+        print(f"Scale {rows} rows per table ({db_file})")
+        report["scales"][str(rows)] = bench_scale(db_file, iterations)
+    return report
+
+
+def compare_to_baseline(report, baseline, threshold=DEFAULT_THRESHOLD, noise_floor_ms=NOISE_FLOOR_MS):
+    """
+    Return (scale, case, baseline p95, current p95) for every case whose
+    ASGI p95 regressed beyond `threshold` and the noise floor.
+    """
+    regressions = []
+    for scale, cases in report["scales"].items():
+        baseline_cases = baseline.get("scales", {}).get(scale, {})
+        for case, result in cases.items():
+            if case not in baseline_cases:
+                continue
+            before = baseline_cases[case]["asgi_ms"]["p95"]
+            after = result["asgi_ms"]["p95"]
+            if after > before * (1 + threshold) and after - before > noise_floor_ms:
+                regressions.append((scale, case, before, after))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the KPI and filter endpoints across data scales")
+    parser.add_argument("--scales", type=int, nargs="+", default=SCALES, help="Rows per table of each database")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="Timed runs per case")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Where the generated databases are kept")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the generated databases")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed p95 slowdown, e.g. 0.25 for 25%%")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.scales, args.iterations, args.data_dir, args.seed)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.out}.")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.threshold)
+        for scale, case, before, after in regressions:
+            print(f"[SLOWER] {scale} rows {case}: p95 {before:.3f} ms -> {after:.3f} ms")
+        if regressions:
+            print(f"\n{len(regressions)} cases regressed by more than {args.threshold:.0%}.")
+            sys.exit(1)
+        print(f"\nNo case regressed by more than {args.threshold:.0%} against {args.baseline}.")
@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from bench_kpis import percentiles
+from date_range import epoch_text, timestamp_text
+from generate_dataset import generate_database
+from migrate_timestamps import migrate_online
+from migrations import EPOCH_COLUMNS, apply_migrations
+from rollups import GRAINS, ROLLUPS, rollup_table
+
+DEFAULT_ROWS = 1000000
+DEFAULT_ITERATIONS = 20
+DEFAULT_DATA_DIR = "bench_data"
+DEFAULT_OUTPUT = "bench_storage.json"
+
+# Generated window of the benchmark data
+BENCH_START = "2025-03-01"
+BENCH_DAYS = 92
+
+# Range lengths in seconds, each centered on the middle of the data
+WINDOWS = {"15min": 900, "1day": 86400, "7days": 7 * 86400, "30days": 30 * 86400}
+
+# Range queries timed on both layouts as (name, window, sql). `{timestamp}`
+# is what the query returns for the timestamp column: the stored text before,
+# the compatibility expression after, so both return the same rows.
+RANGE_QUERIES = [
+    ("weblogs_count", "1day", "SELECT COUNT(*) FROM weblogs WHERE timestamp >= ? AND timestamp < ?"),
+    ("weblogs_count", "30days", "SELECT COUNT(*) FROM weblogs WHERE timestamp >= ? AND timestamp < ?"),
+    ("weblogs_unique_visitors", "1day", "SELECT COUNT(DISTINCT ip) FROM weblogs WHERE timestamp >= ? AND timestamp < ?"),
+    ("sales_by_salesperson", "7days",
+     "SELECT salesperson, SUM(revenue), SUM(profit) FROM sales_metrics WHERE timestamp >= ? AND timestamp < ? GROUP BY salesperson"),
+    ("sales_revenue", "15min", "SELECT SUM(revenue) FROM sales_metrics WHERE timestamp >= ? AND timestamp < ?"),
+    ("leads_by_status", "30days", "SELECT lead_status, COUNT(*) FROM leads WHERE timestamp >= ? AND timestamp < ? GROUP BY lead_status"),
+    ("sales_page", "7days",
+     "SELECT id, {timestamp}, product, salesperson, revenue, profit, country FROM sales_metrics"
+     " WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp DESC, id DESC LIMIT 1000"),
+]
+
+
+def build_legacy_database(source, db_file):
+    """
+    Copy a current database into the schema version 3 layout (TEXT
+    timestamps, weblogs.access_time) that logs.db files had before
+    migration 4, rollups included.
+    """
+    apply_migrations(db_file, target=3)
+    connection = sqlite3.connect(db_file)
+    connection.execute("ATTACH DATABASE ? AS source", (source,))
+    with connection:
+        for table, columns in EPOCH_COLUMNS.items():
+            names = [column for column, _ in columns]
+            select = [timestamp_text() if name == "timestamp" else name for name in names]
+            if table == "weblogs":
+                names.append("access_time")
+                select.append("strftime('%H:%M:%S', timestamp, 'unixepoch')")
+            connection.execute(
+                f"INSERT INTO {table} ({', '.join(names)}) SELECT {', '.join(select)} FROM source.{table} ORDER BY id"
+            )
+        for table in ROLLUPS:
+            for grain in GRAINS:
+                connection.execute(f"INSERT INTO {rollup_table(table, grain)} SELECT * FROM source.{rollup_table(table, grain)}")
+    connection.execute("DETACH DATABASE source")
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("ANALYZE")
+    connection.execute("VACUUM")
+    connection.close()
+
+
+# Helper function to copy a database consistently, even while it is in use
+def copy_database(source, target):
+    source_connection = sqlite3.connect(source)
+    target_connection = sqlite3.connect(target)
+    try:
+        source_connection.backup(target_connection)
+    finally:
+        source_connection.close()
+        target_connection.close()
+
+
+def storage_sizes(db_file):
+    """
+    Return the file size and, where SQLite has the dbstat table, the bytes
+    each raw table takes together with its indexes.
+    """
+    sizes = {"file_bytes": os.path.getsize(db_file), "tables": {}}
+    connection = sqlite3.connect(db_file)
+    try:
+        rows = connection.execute(
+            "SELECT m.tbl_name, SUM(s.pgsize) FROM dbstat s JOIN sqlite_master m ON m.name = s.name GROUP BY m.tbl_name"
+        ).fetchall()
+        sizes["tables"] = {table: size for table, size in rows if table in EPOCH_COLUMNS}
+    except sqlite3.OperationalError:
+        pass
+    finally:
+        connection.close()
+    return sizes
+
+
+def time_query(connection, sql, params, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        connection.execute(sql, params).fetchall()
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+
+def bench_ranges(before_db, after_db, iterations):
+    """
+    Time every range query on the TEXT layout and on the epoch layout, with
+    the same windows, and check that both return the same rows.
+    """
+    before = sqlite3.connect(before_db)
+    after = sqlite3.connect(after_db)
+    results = {}
+    try:
+        first, last = after.execute("SELECT MIN(timestamp), MAX(timestamp) FROM sales_metrics").fetchone()
+        middle = (first + last) // 2
+        for name, window, sql in RANGE_QUERIES:
+            start, end = middle - WINDOWS[window] // 2, middle + WINDOWS[window] // 2
+            text_bounds = (epoch_text(start), epoch_text(end))
+            before_sql = sql.format(timestamp="timestamp")
+            after_sql = sql.format(timestamp=timestamp_text())
+            if before.execute(before_sql, text_bounds).fetchall() != after.execute(after_sql, (start, end)).fetchall():
+                raise RuntimeError(f"{name} over {window} differs between the two layouts")
+            result = results[f"{name}_{window}"] = {
+                "before_ms": time_query(before, before_sql, text_bounds, iterations),
+                "after_ms": time_query(after, after_sql, (start, end), iterations),
+            }
+            result["p50_speedup"] = round(result["before_ms"]["p50"] / result["after_ms"]["p50"], 2) if result["after_ms"]["p50"] else None
+            print(f"  {name + ' ' + window:<34} p50 {result['before_ms']['p50']:>9.3f} ms -> {result['after_ms']['p50']:>9.3f} ms  "
+                  f"p95 {result['before_ms']['p95']:>9.3f} ms -> {result['after_ms']['p95']:>9.3f} ms")
+    finally:
+        before.close()
+        after.close()
+    return results
+
+
+def run_benchmark(rows, iterations, data_dir, seed=42, legacy_db=None):
+    """
+    Build (or copy) a TEXT-timestamp database, migrate a copy of it online to
+    epoch seconds, and compare their sizes and range-query latencies.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    before_db = os.path.join(data_dir, "storage_before.db")
+    after_db = os.path.join(data_dir, "storage_after.db")
+    for path in (before_db, after_db):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    if legacy_db:
+        copy_database(legacy_db, before_db)
+        connection = sqlite3.connect(before_db)
+        rows = connection.execute("SELECT COUNT(*) FROM sales_metrics").fetchone()[0]
+        connection.close()
+    else:
+        source_db = os.path.join(data_dir, f"storage_source_{rows}_{seed}.db")
+        if not os.path.exists(source_db):
+            print(f"Generating {source_db} ...")
+            generate_database(source_db, rows, seed, start=BENCH_START, days=BENCH_DAYS)
+        print(f"Building the TEXT-timestamp layout in {before_db} ...")
+        build_legacy_database(source_db, before_db)
+
+    print(f"Migrating a copy to epoch seconds in {after_db} ...")
+    copy_database(before_db, after_db)
+    migration = migrate_online(after_db, vacuum=True)
+    connection = sqlite3.connect(after_db)
+    connection.execute("ANALYZE")
+    connection.close()
+
+    report = {
+        "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        "rows": rows,
+        "seed": seed,
+        "iterations": iterations,
+        "migration": migration,
+        "before": storage_sizes(before_db),
+        "after": storage_sizes(after_db),
+    }
+    report["file_bytes_saved"] = report["before"]["file_bytes"] - report["after"]["file_bytes"]
+    print(f"Database size: {report['before']['file_bytes']} -> {report['after']['file_bytes']} bytes "
+          f"({report['file_bytes_saved'] / report['before']['file_bytes']:.1%} smaller)")
+    for table, size in report["before"]["tables"].items():
+        print(f"  {table:<14} {size:>12} -> {report['after']['tables'].get(table, 0):>12} bytes with indexes")
+    print("Range queries:")
+    report["queries"] = bench_ranges(before_db, after_db, iterations)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare TEXT and epoch-second timestamp storage: size and range-query latency")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="Rows per table of the generated database")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="Timed runs per query")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Where the benchmark databases are kept")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the generated database")
+    parser.add_argument("--legacy-db", help="Benchmark a copy of this TEXT-timestamp logs.db instead of generated data")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.rows, args.iterations, args.data_dir, args.seed, args.legacy_db)
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nWrote {args.out}.")
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+DEFAULT_CAPACITY = 1024
+
+
+class ChangeFeed:
+    """
+    Ring buffer of recently committed writes, each numbered by a monotonically
+    increasing cursor.
+
+    Readers ask for everything after the cursor they last saw. A cursor that
+    has already fallen out of the buffer is answered with reset=True so the
+    client knows to reload everything instead of applying deltas. Waiting
+    readers park on an asyncio.Event and cost nothing until a write lands.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=capacity)
+        # Start from the wall clock so cursors handed out before a restart
+        # fall below the buffer and read as stale instead of as current
+        self._cursor = int(time.time() * 1000)
+        self._waiters = set()  # (loop, asyncio.Event)
+
+    @property
+    def cursor(self):
+        with self._lock:
+            return self._cursor
+
+    def publish(self, changes):
+        """
+        Append one committed write, where `changes` maps each written table to
+        the summary returned by storage.insert_logs, and wake every waiter.
+        Safe to call from any thread.
+        """
+        with self._lock:
+            self._cursor += 1
+            event = {
+                "cursor": self._cursor,
+                "time": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                "tables": changes,
+            }
+            self._events.append(event)
+            waiters, self._waiters = self._waiters, set()
+        for loop, wakeup in waiters:
+            loop.call_soon_threadsafe(wakeup.set)
+        return event
+
+    def since(self, cursor):
+        """
+        Return (events after `cursor`, latest cursor, reset). `reset` is True
+        when `cursor` is unknown or older than the oldest buffered event.
+        """
+        with self._lock:
+            latest = self._cursor
+            if cursor is None:
+                return [], latest, False
+            if cursor > latest or cursor < 0:
+                return [], latest, True
+            oldest = self._events[0]["cursor"] if self._events else latest + 1
+            if cursor < oldest - 1:
+                return [], latest, True
+            return [event for event in self._events if event["cursor"] > cursor], latest, False
+
+    async def wait(self, cursor, timeout):
+        """
+        Wait up to `timeout` seconds for an event after `cursor`, then return
+        since(cursor).
+        """
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        waiter = (loop, wakeup)
+        with self._lock:
+            pending = self._cursor == cursor
+            if pending:
+                self._waiters.add(waiter)
+        if pending:
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._lock:
+                    self._waiters.discard(waiter)
+        return self.since(cursor)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cursor": self._cursor,
+                "buffered": len(self._events),
+                "capacity": self._events.maxlen,
+                "oldest_cursor": self._events[0]["cursor"] if self._events else None,
+                "waiters": len(self._waiters),
+            }
@@ -0,0 +1,190 @@
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+from fastapi.testclient import TestClient
+
+import fastapi_app
+from date_range import epoch_seconds
+from latency_histograms import GRAINS as HISTOGRAM_GRAINS, histogram_table
+from migrations import apply_migrations
+from rollups import GRAINS, ROLLUPS
+from visitor_sketches import GRAINS as SKETCH_GRAINS, sketch_table
+
+# Tables that must never be read with a bare full table scan
+CHECKED_TABLES = {"sales_metrics", "leads", "weblogs", "sales_facts", "weblog_facts"}
+
+# Tables a date-ranged request must only read through a range search
+RANGED_TABLES = (CHECKED_TABLES
+                 | {f"{rollup['prefix']}_rollup_{grain}" for rollup in ROLLUPS.values() for grain in GRAINS}
+                 | {histogram_table(grain) for grain in HISTOGRAM_GRAINS}
+                 | {sketch_table(grain) for grain in SKETCH_GRAINS})
+
+# "SCAN sales_metrics" (no index) is a regression; "SCAN ... USING [COVERING] INDEX" is fine
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+# Any scan, with or without an index, reads the whole table whatever the range
+ANY_SCAN = re.compile(r"^SCAN (\w+)")
+
+# Whole days (daily rollups), whole hours (hourly rollups) and bounds inside
+# an hour (raw rows)
+DATE_RANGE = {"start_date": "2025-05-01", "end_date": "2025-05-31"}
+HOUR_RANGE = {"start_date": "2025-05-01T06:00:00Z", "end_date": "2025-05-31T18:00:00+02:00"}
+RAW_RANGE = {"start_date": "2025-05-01T06:30:00", "end_date": "2025-05-31 18:15:00"}
+
+# Representative parameter combinations, mirroring what the dashboard sends
+PARAM_SETS = [
+    {},
+    DATE_RANGE,
+    HOUR_RANGE,
+    RAW_RANGE,
+]
+FILTER_SALES_PARAM_SETS = [
+    {},
+    DATE_RANGE,
+    {**DATE_RANGE, "salesperson": "Alice"},
+    {**DATE_RANGE, "product": "AI Assistant"},
+    {**DATE_RANGE, "country": "USA"},
+    {**DATE_RANGE, "salesperson": "Alice", "product": "AI Assistant", "country": "USA"},
+    {**DATE_RANGE, "salesperson": "Alice", "limit": 100},
+    {**RAW_RANGE, "product": "AI Assistant"},
+]
+
+
+def seed_sample_database(db_file):
+    """
+    Create a small database with the current schema and a few rows per table.
+    """
+    apply_migrations(db_file)
+    connection = sqlite3.connect(db_file)
+    with connection:
+        connection.executemany(
+            "INSERT INTO sales_metrics (timestamp, product, salesperson, revenue, profit, country, endpoint) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(epoch_seconds("2025-05-09 08:59:46"), "AI Assistant", "Alice", 500, 100, "USA", "/demo"),
+             (epoch_seconds("2025-05-10 10:00:00"), "Demo Session", "Bob", 300, 50, "UK", "/home")],
+        )
+        connection.executemany(
+            "INSERT INTO leads (timestamp, lead_source, lead_status) VALUES (?, ?, ?)",
+            [(epoch_seconds("2025-05-09 08:59:46"), "Website", "Closed"), (epoch_seconds("2025-05-10 10:00:00"), "Referral", "New")],
+        )
+        connection.executemany(
+            "INSERT INTO weblogs (timestamp, ip, endpoint, method, status_code, response_time_ms, user_agent) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(epoch_seconds("2025-05-09 08:59:46"), "8.8.8.8", "/demo", "GET", 200, 120, "Mozilla/5.0"),
+             (epoch_seconds("2025-05-10 10:00:00"), "1.1.1.1", "/home", "GET", 200, 340, "curl/7.64.1")],
+        )
+    connection.close()
+
+
+def kpi_routes():
+    """
+    Return the paths of every GET endpoint that queries the KPI tables.
+    """
+    paths = []
+    for route in fastapi_app.app.routes:
+        path = getattr(route, "path", "")
+        if "GET" in getattr(route, "methods", set()) and (path.startswith("/kpis/") or path.startswith("/filter-")):
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def collect_statements(client):
+    """
+    Call every KPI endpoint with each parameter set and return the SELECT
+    statements it ran as {sql: [(path, params), ...]}.
+    """
+    statements = {}
+    current = {}
+
+    def trace(sql):
+        if sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.setdefault(sql, []).append((current["path"], current["params"]))
+
+    fastapi_app.pool.set_trace_callback(trace)
+    try:
+        for path in kpi_routes():
+            param_sets = FILTER_SALES_PARAM_SETS if path.startswith("/filter-sales") else PARAM_SETS
+            for params in param_sets:
+                current["path"], current["params"] = path, params
+                response = client.get(path, params=params)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{path} {params} returned HTTP {response.status_code}: {response.text}")
+    finally:
+        fastapi_app.pool.set_trace_callback(None)
+    return statements
+
+
+def full_table_scans(connection, sql):
+    """
+    Return the plan lines of `sql` that scan one of the KPI tables without an index.
+    """
+    scans = []
+    for _, _, _, detail in connection.execute(f"EXPLAIN QUERY PLAN {sql}"):
+        match = FULL_SCAN.match(detail)
+        if match and match.group(1) in CHECKED_TABLES:
+            scans.append(detail)
+    return scans
+
+
+def unbounded_range_reads(connection, sql):
+    """
+    Return the plan lines of `sql` that scan a KPI or rollup table instead of
+    searching it, i.e. that ignore the request's date range.
+    """
+    scans = []
+    for _, _, _, detail in connection.execute(f"EXPLAIN QUERY PLAN {sql}"):
+        match = ANY_SCAN.match(detail)
+        if match and match.group(1) in RANGED_TABLES:
+            scans.append(detail)
+    return scans
+
+
+def check_query_plans(db_file):
+    """
+    Run the plan check against `db_file` and return the list of failures.
+    """
+    fastapi_app.use_database(db_file)
+    client = TestClient(fastapi_app.app)
+    statements = collect_statements(client)
+
+    failures = []
+    connection = sqlite3.connect(db_file)
+    try:
+        for sql, callers in statements.items():
+            scans = full_table_scans(connection, sql)
+            if any("start_date" in params or "end_date" in params for _, params in callers):
+                scans += [detail for detail in unbounded_range_reads(connection, sql) if detail not in scans]
+            path, params = callers[0]
+            status = "FAIL" if scans else "ok"
+            print(f"[{status}] {path} {params}\n       {' '.join(sql.split())}")
+            for detail in scans:
+                print(f"       -> {detail}")
+            if scans:
+                failures.append((path, params, sql, scans))
+    finally:
+        connection.close()
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fail if any KPI query regresses to a full table scan or reads past its date range"
+    )
+    parser.add_argument("--db", help="Check an existing database instead of a scratch one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        db_file = args.db
+        if db_file is None:
+            db_file = os.path.join(scratch, "plan_check.db")
+            seed_sample_database(db_file)
+        failures = check_query_plans(db_file)
+        fastapi_app.pool.close()
+
+    if failures:
+        print(f"\n{len(failures)} KPI queries use a full table scan or ignore their date range.")
+        sys.exit(1)
+    print("\nAll KPI queries use an index, and ranged ones a range search.")
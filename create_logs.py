@@ -1,37 +1,34 @@
 import sqlite3
 import random
 from datetime import datetime, timezone
-import geoip2.database
-from geoip2.errors import AddressNotFoundError
+from geoip_ranges import RangeIndex
+from latency_histograms import rebuild_histograms
+from migrations import apply_migrations
+from rollups import rebuild_rollups
+from visitor_sketches import rebuild_sketches
 
 # Path to your GeoLite2-Country database in the 'data' directory
 GEOIP_DB_PATH = "data/GeoLite2-Country.mmdb"
 
-# Function to extract valid IP addresses and countries from the MMDB file
-def extract_ip_addresses_and_countries_from_mmdb():
-    ip_country_map = []
+# Number of distinct visitor IPs sampled from the MMDB
+IP_SAMPLE_SIZE = 1000
+
+# Function to sample realistic public IP addresses and their countries from the MMDB
+def extract_ip_addresses_and_countries_from_mmdb(sample_size=IP_SAMPLE_SIZE):
     try:
-        with geoip2.database.Reader(GEOIP_DB_PATH) as reader:
-            for i in range(1, 256):
-                for j in range(1, 256):
-                    ip = f"192.0.{i}.{j}"  # Replace with public IP ranges if needed
-                    try:
-                        response = reader.country(ip)
-                        if response.country.iso_code:  # Check if a country is associated with the IP
-                            ip_country_map.append((ip, response.country.iso_code))
-                    except AddressNotFoundError:
-                        continue
+        # Built once from the MMDB's network tree and reused from disk afterwards
+        index = RangeIndex.open(GEOIP_DB_PATH)
+        return index.sample(sample_size)
     except Exception as e:
         print(f"Error reading MMDB file: {e}")
-    return ip_country_map
+        return []
 
 # Generate random data for the weblogs table
 def generate_weblog_entry(ip, country, log_id):
     current_time = datetime.now(timezone.utc)
     return {
         "id": log_id,
-        "timestamp": current_time.strftime("%Y-%m-%d %H:%M:%S"),
-        "access_time": current_time.strftime("%H:%M:%S"),
+        "timestamp": int(current_time.timestamp()),
         "ip": ip,
         "country": country,
         "endpoint": random.choice(["/home", "/about", "/products", "/services", "/contact"]),
@@ -50,7 +47,7 @@ def generate_sales_metric_entry(log_id, country, endpoint):
     current_time = datetime.now(timezone.utc)
     return {
         "id": log_id,
-        "timestamp": current_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "timestamp": int(current_time.timestamp()),
         "product": random.choice(["AI Assistant", "Rapid Prototyping", "Demo Session", "Event Participant Package", "Enterprise AI Package"]),
         "salesperson": random.choice(["Alice", "Bob", "Charlie", "Diana"]),
         "revenue": random.randint(100, 1000),
@@ -64,7 +61,7 @@ def generate_lead_entry(log_id):
     current_time = datetime.now(timezone.utc)
     return {
         "id": log_id,
-        "timestamp": current_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "timestamp": int(current_time.timestamp()),
         "lead_source": random.choice(["Website", "Social Media", "Email Campaign", "Referral"]),
         "lead_status": random.choice(["New", "Contacted", "Closed"])
     }
@@ -74,50 +71,21 @@ def reset_and_restructure_database():
     conn = sqlite3.connect("logs.db")
     cursor = conn.cursor()
 
-    # Delete existing data
-    cursor.execute("DROP TABLE IF EXISTS weblogs")
-    cursor.execute("DROP TABLE IF EXISTS sales_metrics")
-    cursor.execute("DROP TABLE IF EXISTS leads")
-
-    # Create the tables with matching schemas
-    cursor.execute("""
-    CREATE TABLE weblogs (
-        id INTEGER PRIMARY KEY,
-        timestamp TEXT,
-        access_time TEXT,
-        ip TEXT,
-        country TEXT,
-        endpoint TEXT,
-        method TEXT,
-        status_code INTEGER,
-        response_time_ms INTEGER,
-        user_agent TEXT
-    )
-    """)
-    cursor.execute("""
-    CREATE TABLE sales_metrics (
-        id INTEGER PRIMARY KEY,
-        timestamp TEXT,
-        product TEXT,
-        salesperson TEXT,
-        revenue INTEGER,
-        profit INTEGER,
-        country TEXT,
-        endpoint TEXT
-    )
-    """)
-    cursor.execute("""
-    CREATE TABLE leads (
-        id INTEGER PRIMARY KEY,
-        timestamp TEXT,
-        lead_source TEXT,
-        lead_status TEXT
-    )
-    """)
+    # Delete existing data: the views over the dictionary-encoded tables
+    # first, then every table (raw, dimension, rollup and schema_migrations)
+    for object_type in ("view", "table"):
+        names = cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = ? AND name NOT LIKE 'sqlite_%'", (object_type,)
+        ).fetchall()
+        for (name,) in names:
+            cursor.execute(f"DROP {object_type.upper()} IF EXISTS {name}")
 
     conn.commit()
     conn.close()
 
+    # Recreate the tables and their indexes from the versioned migrations
+    apply_migrations("logs.db")
+
 # Function to save logs to the database
 def save_logs_to_db(logs, table_name):
     conn = sqlite3.connect("logs.db")
@@ -127,12 +95,11 @@ def save_logs_to_db(logs, table_name):
         try:
             if table_name == "weblogs":
                 cursor.execute("""
-                    INSERT INTO weblogs (id, timestamp, access_time, ip, country, endpoint, method, status_code, response_time_ms, user_agent)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    INSERT INTO weblogs (id, timestamp, ip, country, endpoint, method, status_code, response_time_ms, user_agent)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, (
                     log["id"],
                     log["timestamp"],
-                    log["access_time"],
                     log["ip"],
                     log["country"],
                     log["endpoint"],
@@ -203,5 +170,13 @@ if __name__ == "__main__":
     save_logs_to_db(sales_metrics, "sales_metrics")
     save_logs_to_db(leads, "leads")
 
+    # Step 5: Rebuild the KPI rollups, visitor sketches and latency histograms from the fresh raw data
+    conn = sqlite3.connect("logs.db")
+    with conn:
+        rebuild_rollups(conn)
+        rebuild_sketches(conn)
+        rebuild_histograms(conn)
+    conn.close()
+
     print(f"Generated {len(weblogs)} weblogs, {len(sales_metrics)} sales metrics, and {len(leads)} leads, and saved them to the database.")
     
@@ -0,0 +1,143 @@
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+# Raw timestamps are stored as INTEGER seconds since the Unix epoch (UTC).
+# Range bounds, rollup buckets and API responses use UTC text in this format,
+# so text order is time order.
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+class DateRange(NamedTuple):
+    """
+    Half-open UTC range [start, end) as TIMESTAMP_FORMAT text; None leaves
+    that side open.
+    """
+
+    start: Optional[str] = None
+    end: Optional[str] = None
+
+    @property
+    def grain(self):
+        """
+        The coarsest rollup grain both bounds align to: "daily" when they
+        fall on midnight, "hourly" on the hour, None inside an hour (the
+        range then has to be answered from raw rows).
+        """
+        bounds = [bound for bound in self if bound is not None]
+        if all(bound.endswith(" 00:00:00") for bound in bounds):
+            return "daily"
+        if all(bound.endswith(":00:00") for bound in bounds):
+            return "hourly"
+        return None
+
+
+# Helper function to parse one bound into a naive UTC datetime
+def parse_bound(value, name):
+    if DATE_PATTERN.match(value):
+        return datetime.strptime(value, "%Y-%m-%d")
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"{name} must be a YYYY-MM-DD date or an ISO 8601 date-time, got {value!r}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.replace(microsecond=0)
+
+
+def date_range(start_date=None, end_date=None):
+    """
+    Turn the start_date/end_date query parameters into a half-open DateRange.
+
+    Dates are whole UTC days, so an end date includes that entire day (the
+    exclusive bound is the next midnight). Date-times may carry a UTC
+    offset and are converted to UTC; without one they are taken as UTC.
+    A date-time end bound is exclusive. Raises ValueError for malformed or
+    inverted bounds.
+    """
+    start = parse_bound(start_date, "start_date") if start_date else None
+    end = None
+    if end_date:
+        end = parse_bound(end_date, "end_date")
+        if DATE_PATTERN.match(end_date):
+            end += timedelta(days=1)
+    if start is not None and end is not None and start >= end:
+        raise ValueError("start_date must be before end_date")
+    return DateRange(
+        start.strftime(TIMESTAMP_FORMAT) if start is not None else None,
+        end.strftime(TIMESTAMP_FORMAT) if end is not None else None,
+    )
+
+
+@lru_cache(maxsize=65536)
+def _text_to_epoch(value):
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def epoch_seconds(value):
+    """
+    Return a stored timestamp for `value`: epoch seconds are passed through,
+    datetimes (naive ones taken as UTC) and ISO 8601 text are converted.
+    Raises ValueError for text that is not a date-time.
+    """
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    return _text_to_epoch(value)
+
+
+def epoch_text(seconds):
+    """
+    Format a stored timestamp as TIMESTAMP_FORMAT UTC text.
+    """
+    if seconds is None:
+        return None
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def timestamp_text(column="timestamp"):
+    """
+    Return the SQL expression presenting a stored timestamp column as
+    TIMESTAMP_FORMAT text, the format the API has always returned.
+    """
+    return f"strftime('%Y-%m-%d %H:%M:%S', {column}, 'unixepoch')"
+
+
+def timestamp_clause(requested, column="timestamp"):
+    """
+    Return (" AND ..." clause, params) bounding the epoch-seconds `column`
+    to the range. The column is compared bare against integer bounds, so an
+    index on it serves the range.
+    """
+    clause = ""
+    params = []
+    if requested.start is not None:
+        clause += f" AND {column} >= ?"
+        params.append(epoch_seconds(requested.start))
+    if requested.end is not None:
+        clause += f" AND {column} < ?"
+        params.append(epoch_seconds(requested.end))
+    return clause, params
+
+
+def bucket_clause(requested, grain):
+    """
+    Return (" AND ..." clause, params) bounding a rollup's bucket column,
+    with the bounds written in that grain's bucket format.
+    """
+    clause = ""
+    params = []
+    for operator, bound in ((">=", requested.start), ("<", requested.end)):
+        if bound is not None:
+            clause += f" AND bucket {operator} ?"
+            params.append(bound[:10] if grain == "daily" else bound)
+    return clause, params
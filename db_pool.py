@@ -0,0 +1,167 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Default tuning for every pooled connection
+DEFAULT_CACHE_SIZE_KIB = 64 * 1024          # 64 MiB page cache per connection
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024       # 256 MiB memory-mapped I/O
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+
+
+class ConnectionPool:
+    """
+    Pool of tuned SQLite connections for a single database file.
+
+    Readers get one long-lived, query-only connection per thread, opened on
+    first use and reused afterwards. Writes go through a single shared writer
+    connection guarded by a lock. All connections run in WAL mode with
+    synchronous=NORMAL, a sized page cache and mmap enabled.
+    """
+
+    def __init__(self, db_file, cache_size_kib=DEFAULT_CACHE_SIZE_KIB,
+                 mmap_size=DEFAULT_MMAP_SIZE, busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS):
+        self.db_file = db_file
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writer_lock = threading.Lock()
+        self._writer = None
+        self._readers = []
+        self._generation = 0
+        self._trace_callback = None
+        self._wait_observer = None
+
+        self._reader_checkouts = 0
+        self._writer_checkouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _open(self, read_only):
+        connection = sqlite3.connect(
+            self.db_file,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            isolation_level=None if read_only else "DEFERRED",
+        )
+        connection.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        if not read_only:
+            # journal_mode is persistent in the file, so the writer sets it once
+            connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")
+        connection.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        connection.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            connection.execute("PRAGMA query_only = ON")
+        connection.set_trace_callback(self._trace_callback)
+        return connection
+
+    def _record_checkout(self, started, writer):
+        waited = time.perf_counter() - started
+        with self._lock:
+            if writer:
+                self._writer_checkouts += 1
+            else:
+                self._reader_checkouts += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        if self._wait_observer is not None:
+            self._wait_observer("writer" if writer else "reader", waited)
+
+    def _writer_connection(self):
+        # Callers must hold self._writer_lock
+        if self._writer is None:
+            self._writer = self._open(read_only=False)
+        return self._writer
+
+    @contextmanager
+    def reader(self):
+        """
+        Check out this thread's read-only connection.
+        Reads run in autocommit mode, so nothing is committed after a SELECT.
+        """
+        started = time.perf_counter()
+        connection = getattr(self._local, "connection", None)
+        if connection is None or getattr(self._local, "generation", None) != self._generation:
+            if self._writer is None:
+                # Make sure the file exists and is in WAL mode before opening readers
+                with self._writer_lock:
+                    self._writer_connection()
+            connection = self._open(read_only=True)
+            with self._lock:
+                self._readers.append(connection)
+            self._local.connection = connection
+            self._local.generation = self._generation
+        self._record_checkout(started, writer=False)
+        yield connection
+
+    @contextmanager
+    def writer(self):
+        """
+        Check out the shared writer connection inside a transaction.
+        The transaction is committed on success and rolled back on error.
+        """
+        started = time.perf_counter()
+        with self._writer_lock:
+            connection = self._writer_connection()
+            self._record_checkout(started, writer=True)
+            try:
+                yield connection
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+
+    def set_trace_callback(self, callback):
+        """
+        Install `callback(sql)` on every open and future pooled connection.
+        SQLite passes each statement with its parameters bound; None removes it.
+        """
+        with self._writer_lock, self._lock:
+            self._trace_callback = callback
+            for connection in self._readers:
+                connection.set_trace_callback(callback)
+            if self._writer is not None:
+                self._writer.set_trace_callback(callback)
+
+    def set_wait_observer(self, callback):
+        """
+        Install `callback(role, seconds)`, called after every checkout with
+        "reader" or "writer" and how long it waited; None removes it.
+        """
+        self._wait_observer = callback
+
+    def stats(self):
+        """
+        Return checkout counts, wait times and open connection counts.
+        """
+        with self._lock:
+            checkouts = self._reader_checkouts + self._writer_checkouts
+            return {
+                "db_file": self.db_file,
+                "open_connections": len(self._readers) + (1 if self._writer is not None else 0),
+                "open_readers": len(self._readers),
+                "writer_open": self._writer is not None,
+                "reader_checkouts": self._reader_checkouts,
+                "writer_checkouts": self._writer_checkouts,
+                "total_wait_ms": round(self._total_wait * 1000, 3),
+                "avg_wait_ms": round(self._total_wait * 1000 / checkouts, 3) if checkouts else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+            }
+
+    def close(self):
+        """
+        Close every pooled connection. Threads reopen their reader on next use.
+        """
+        with self._writer_lock, self._lock:
+            for connection in self._readers:
+                connection.close()
+            self._readers = []
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._generation += 1
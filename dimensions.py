@@ -0,0 +1,130 @@
+import threading
+
+# Dictionary-encoded raw tables: the table holding the encoded rows and the
+# low-cardinality string columns stored as keys into dimension tables. The
+# raw table's name is a view joining the strings back.
+ENCODED_TABLES = {
+    "sales_metrics": ("sales_facts", ["product", "salesperson", "country", "endpoint"]),
+    "weblogs": ("weblog_facts", ["country", "endpoint", "method", "user_agent"]),
+}
+
+# Every dimension, shared by the tables that encode a column of that name
+DIMENSIONS = sorted({column for _, columns in ENCODED_TABLES.values() for column in columns})
+
+
+def dimension_table(column):
+    """
+    Return the name of the dimension table interning `column`'s values.
+    """
+    return f"dim_{column}"
+
+
+def key_column(column):
+    """
+    Return the name of the key column that replaces `column` in a fact table.
+    """
+    return f"{column}_id"
+
+
+def fact_table(table):
+    """
+    Return the table holding `table`'s rows: its fact table if it is
+    dictionary-encoded, otherwise the table itself.
+    """
+    return ENCODED_TABLES[table][0] if table in ENCODED_TABLES else table
+
+
+def stored_columns(table, columns):
+    """
+    Return `columns` as they are named where `table`'s rows are stored, with
+    encoded columns replaced by their key columns.
+    """
+    encoded = ENCODED_TABLES[table][1] if table in ENCODED_TABLES else []
+    return [key_column(column) if column in encoded else column for column in columns]
+
+
+class DimensionEncoder:
+    """
+    In-memory value -> key cache for the dimension tables, used on the write
+    path so a batch of rows is encoded with dictionary lookups and only
+    values never seen before reach SQLite.
+
+    A new value is interned with INSERT OR IGNORE inside the caller's write
+    transaction. Until that transaction is known to have committed, the key
+    is not trusted: confirm(), run at the start of the next write
+    transaction, checks it against the table first, so a rolled-back write
+    can never leave a key in the cache that points at nothing. Dimension
+    rows are never updated or deleted, so a committed key stays valid
+    forever and is shared safely with other writers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = {column: {} for column in DIMENSIONS}
+        self._unconfirmed = []  # (column, value, key) interned by earlier writes
+        self.hits = 0
+        self.misses = 0
+
+    def confirm(self, connection):
+        """
+        Cache the keys interned by earlier writes that did commit. Call it at
+        the start of a write transaction, before anything is written, so
+        only committed dimension rows are visible.
+        """
+        with self._lock:
+            for column, value, key in self._unconfirmed:
+                row = connection.execute(f"SELECT value FROM {dimension_table(column)} WHERE id = ?", (key,)).fetchone()
+                if row is not None and row[0] == value:
+                    self._keys[column][value] = key
+            self._unconfirmed = []
+
+    def _intern(self, connection, column, value):
+        # Callers must hold self._lock
+        table = dimension_table(column)
+        connection.execute(f"INSERT OR IGNORE INTO {table} (value) VALUES (?)", (value,))
+        return connection.execute(f"SELECT id FROM {table} WHERE value = ?", (value,)).fetchone()[0]
+
+    def encode_rows(self, connection, table, columns, rows):
+        """
+        Return `rows` (tuples in `columns` order) with those of `table`'s
+        encoded columns present in `columns` replaced by their keys,
+        interning new values on `connection`. Call it inside the write
+        transaction that stores the rows.
+        """
+        positions = [(columns.index(column), column) for column in ENCODED_TABLES[table][1] if column in columns]
+        with self._lock:
+            interned = {}
+            encoded = []
+            for row in rows:
+                row = list(row)
+                for position, column in positions:
+                    value = row[position]
+                    if value is None:
+                        continue
+                    key = self._keys[column].get(value) or interned.get((column, value))
+                    if key is None:
+                        key = interned[column, value] = self._intern(connection, column, value)
+                        self._unconfirmed.append((column, value, key))
+                        self.misses += 1
+                    else:
+                        self.hits += 1
+                    row[position] = key
+                encoded.append(row)
+        return encoded
+
+    def clear(self):
+        with self._lock:
+            for keys in self._keys.values():
+                keys.clear()
+            self._unconfirmed = []
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "values": {column: len(keys) for column, keys in self._keys.items()},
+                "unconfirmed": len(self._unconfirmed),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -1,27 +1,275 @@
-from fastapi import FastAPI, HTTPException, Query
-from sqlite3 import connect
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from typing import Optional
-from datetime import datetime, timezone
 import asyncio
+import json
+import os
 import random
+import sqlite3
+import time
+from functools import lru_cache
+from db_pool import ConnectionPool
+from migrations import apply_migrations
+from rollups import rollup_source
+from date_range import date_range, timestamp_clause, timestamp_text
+from storage import add_commit_listener, dimension_encoder, insert_logs, publish_commit
+from kpi_cache import DataVersions, KPICache
+from pagination import MAX_PAGE_SIZE, csv_chunk, encode_cursor, keyset_clause, ndjson_chunk
+from change_feed import ChangeFeed
+from geoip_service import GeoIPService
+from heavy_hitters import CHECKPOINT_SECONDS, MAX_K, HeavyHitters, exact_top_query
+from latency_histograms import GRAINS as HISTOGRAM_GRAINS, RELATIVE_ERROR, bin_bounds, heatmap, histograms, percentiles
+from range_sums import RangeSums, rollup_sums
+from visitor_sketches import STANDARD_ERROR, estimate, merge, sketch_query
+from arrow_format import ARROW_STREAM_MEDIA_TYPE, PARQUET_MEDIA_TYPE, build_schema, negotiate_format, stream_batches
+from ingest_buffer import BufferFull, WriteBehindBuffer
+from writer import BUSY_RETRIES, BUSY_RETRY_DELAY_SECONDS, DatabaseWriter, is_busy_error
+from schemas import IngestAccepted, LeadsBatch, SalesBatch, WeblogsBatch
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, ROW_BUCKETS, MetricsRegistry, RequestMetricsMiddleware, statement_fingerprint
 # Database connection
 DB_FILE = "logs.db"
 
+# Shared pool: one read-only connection per worker thread plus a single writer
+pool = ConnectionPool(DB_FILE)
+
+# Every write goes through this thread, which owns the pool's writer connection
+db_writer = DatabaseWriter(pool)
+
+# Seconds between generate_logs batches; load tests raise the write rate
+# through the LOG_INTERVAL_SECONDS environment variable
+LOG_INTERVAL_SECONDS = float(os.environ.get("LOG_INTERVAL_SECONDS", "10"))
+
+# In-memory hourly prefix sums of every KPI measure (see range_sums.py). They
+# are refreshed after each write before the KPI cache below is invalidated,
+# so no result cached under the new data versions is read from stale sums.
+range_sums = RangeSums()
+
+def load_range_sums():
+    with pool.reader() as connection:
+        range_sums.refresh(connection)
+
+def track_range_sums(changes):
+    # Until they are loaded (at startup or by the first KPI request) there is nothing to keep current
+    if range_sums.loaded:
+        load_range_sums()
+
+add_commit_listener(track_range_sums)
+
+# In-memory top-K of landing pages, IPs and user agents, fed after every
+# weblogs write and checkpointed next to the database (see heavy_hitters.py).
+# Like the range sums, they are fed before the KPI cache is invalidated.
+heavy_hitters = HeavyHitters()
+
+def heavy_hitters_checkpoint():
+    return f"{DB_FILE}.heavy-hitters.json"
+
+# Helper function to restore the checkpoint of the current database, then
+# catch up with the rows written since it was taken
+def load_heavy_hitters():
+    with pool.reader() as connection:
+        heavy_hitters.restore(connection, heavy_hitters_checkpoint())
+        heavy_hitters.refresh(connection)
+
+def track_heavy_hitters(changes):
+    if "weblogs" not in changes:
+        return
+    if not heavy_hitters.loaded:
+        load_heavy_hitters()
+    else:
+        with pool.reader() as connection:
+            heavy_hitters.refresh(connection)
+    if time.time() - (heavy_hitters.checkpointed_at or 0) >= CHECKPOINT_SECONDS:
+        heavy_hitters.checkpoint(heavy_hitters_checkpoint())
+
+add_commit_listener(track_heavy_hitters)
+
+# KPI results cached until one of their source tables is written
+data_versions = DataVersions()
+kpi_cache = KPICache(data_versions)
+add_commit_listener(lambda changes: data_versions.bump(*changes))
+
+# Ring buffer of recent writes that dashboards follow through /changes
+change_feed = ChangeFeed()
+add_commit_listener(change_feed.publish)
+
+# Shared memory-mapped GeoIP lookups, so weblogs are written with their country
+geoip = GeoIPService()
+
+# Longest a /changes long-poll may wait, and the SSE keep-alive interval
+MAX_CHANGE_WAIT_SECONDS = 60
+SSE_KEEPALIVE_SECONDS = 15
+
+# Statements slower than this are logged with their query plan
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "250"))
+
+# Prometheus metrics served on /metrics (see metrics.py)
+metrics = MetricsRegistry()
+http_request_seconds = metrics.histogram(
+    "dashboard_http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+sql_query_seconds = metrics.histogram(
+    "dashboard_sql_query_duration_seconds", "Read statement latency by statement fingerprint", ("statement",))
+sql_rows_returned = metrics.histogram(
+    "dashboard_sql_rows_returned", "Rows returned per read statement", ("statement",), buckets=ROW_BUCKETS)
+sql_statement_info = metrics.gauge(
+    "dashboard_sql_statement_info", "SQL text of each statement fingerprint", ("statement", "sql"))
+sql_slow_queries = metrics.counter(
+    "dashboard_sql_slow_queries_total", "Statements slower than SLOW_QUERY_MS", ("statement",))
+sqlite_busy_retries = metrics.counter(
+    "dashboard_sqlite_busy_retries_total", "Statements retried after SQLITE_BUSY or SQLITE_LOCKED", ("role",))
+pool_wait_seconds = metrics.histogram(
+    "dashboard_pool_wait_seconds", "Time spent waiting for a pooled connection", ("role",))
+pool_open_connections = metrics.gauge("dashboard_pool_open_connections", "Open pooled SQLite connections")
+cache_hits = metrics.counter("dashboard_cache_hits_total", "Cache hits", ("cache",))
+cache_misses = metrics.counter("dashboard_cache_misses_total", "Cache misses", ("cache",))
+cache_hit_ratio = metrics.gauge("dashboard_cache_hit_ratio", "Cache hits over lookups since start", ("cache",))
+kpi_cache_bytes = metrics.gauge("dashboard_kpi_cache_bytes", "Approximate size of the cached KPI results")
+range_sums_bytes = metrics.gauge("dashboard_range_sums_bytes", "Memory held by the in-memory range-sum trees")
+ingest_rows = metrics.counter("dashboard_ingest_rows_total", "Rows committed by the ingest path", ("table",))
+ingest_batch_seconds = metrics.histogram(
+    "dashboard_ingest_batch_duration_seconds", "Time to resolve and commit one generate_logs batch")
+ingest_errors = metrics.counter("dashboard_ingest_errors_total", "generate_logs batches that failed to commit")
+change_feed_waiters = metrics.gauge("dashboard_change_feed_waiters", "Clients parked on /changes or /changes/stream")
+writer_queued_jobs = metrics.gauge("dashboard_writer_queued_jobs", "Write jobs waiting for the writer thread")
+ingest_accepted = metrics.counter("dashboard_ingest_accepted_rows_total", "Pushed rows accepted into the buffer", ("table",))
+ingest_rejected = metrics.counter(
+    "dashboard_ingest_rejected_rows_total", "Pushed rows refused by backpressure", ("table", "reason"))
+ingest_buffered = metrics.gauge("dashboard_ingest_buffered_rows", "Pushed rows waiting to be committed")
+ingest_flush_seconds = metrics.histogram(
+    "dashboard_ingest_flush_duration_seconds", "Time to commit one group of buffered rows")
+ingest_flush_rows = metrics.histogram(
+    "dashboard_ingest_flush_rows", "Rows committed per group commit", buckets=ROW_BUCKETS)
+
+# Helper function to count committed rows per table for the ingest throughput metric
+def count_ingested_rows(changes):
+    for table, change in changes.items():
+        ingest_rows.inc(change["rows"], table=table)
+
+add_commit_listener(count_ingested_rows)
+
+# Helper function to refresh the gauges mirrored from the pool and caches at scrape time
+def collect_component_stats():
+    pool_open_connections.set(pool.stats()["open_connections"])
+    kpi_stats = kpi_cache.stats()
+    geoip_info = geoip.stats()
+    dimension_stats = dimension_encoder.stats()
+    for name, hits, misses in (
+        ("kpi", kpi_stats["hits"], kpi_stats["misses"]),
+        ("geoip", geoip_info["cache_hits"], geoip_info["cache_misses"]),
+        ("dimension", dimension_stats["hits"], dimension_stats["misses"]),
+    ):
+        cache_hits.set(hits, cache=name)
+        cache_misses.set(misses, cache=name)
+        cache_hit_ratio.set(hits / (hits + misses) if hits + misses else 0.0, cache=name)
+    kpi_cache_bytes.set(kpi_stats["bytes"])
+    range_sums_bytes.set(range_sums.stats()["bytes"])
+    change_feed_waiters.set(change_feed.stats()["waiters"])
+    ingest_buffered.set(ingest_buffer.stats()["buffered_rows"])
+    writer_stats = db_writer.stats()
+    writer_queued_jobs.set(writer_stats["queued"])
+    sqlite_busy_retries.set(writer_stats["busy_retries"], role="writer")
+
+metrics.add_collector(collect_component_stats)
+
+# Helper function to record how long every pool checkout waited
+def observe_pool_wait(role, seconds):
+    pool_wait_seconds.observe(seconds, role=role)
+
+pool.set_wait_observer(observe_pool_wait)
+
+# Helper function to record the size and duration of each group commit
+def observe_flush(rows, seconds):
+    ingest_flush_rows.observe(rows)
+    ingest_flush_seconds.observe(seconds)
+
+def flush_ingested_rows(sales_logs, lead_logs, web_logs):
+    """
+    Commit one group of pushed rows, with their rollups, in a single
+    transaction. Weblogs pushed without a country get it from GeoIP here,
+    one batch lookup per flush.
+    """
+    missing = [index for index, row in enumerate(web_logs) if row[2] is None]
+    if missing:
+        web_logs = list(web_logs)
+        for index, country in zip(missing, geoip.countries([web_logs[index][1] for index in missing])):
+            row = web_logs[index]
+            web_logs[index] = row[:2] + (country,) + row[3:]
+    changes = db_writer.submit(insert_logs, sales_logs, lead_logs, web_logs).result()
+    publish_commit(changes)
+
+# Pushed rows are acknowledged once buffered and committed in groups by a
+# background thread (see ingest_buffer.py)
+ingest_buffer = WriteBehindBuffer(flush_ingested_rows, on_flush=observe_flush)
+
 app = FastAPI()
+app.add_middleware(RequestMetricsMiddleware, histogram=http_request_seconds)
 
-# Helper function to query the SQLite da
+def use_database(db_file: str):
+    """
+    Point the API at another SQLite file, closing the current pool.
+    Used by the tooling scripts that run the app against scratch databases.
+    """
+    global DB_FILE, pool
+    pool.close()
+    DB_FILE = db_file
+    pool = ConnectionPool(db_file)
+    pool.set_wait_observer(observe_pool_wait)
+    db_writer.pool = pool
+    kpi_cache.clear()
+    dimension_encoder.clear()
+    heavy_hitters.clear()
+    range_sums.clear()
+
+# Helper function to query the SQLite database
 def query_database(query: str, params: tuple = ()):
     """
-    Execute a query on the SQLite database and return the results.
+    Execute a read query on a pooled SQLite connection and return the results.
+    The statement is timed and retried with backoff while the database is busy.
+    """
+    for attempt in range(BUSY_RETRIES + 1):
+        try:
+            with pool.reader() as connection:
+                return timed_fetchall(connection, query, params)
+        except sqlite3.OperationalError as e:
+            if is_busy_error(e) and attempt < BUSY_RETRIES:
+                sqlite_busy_retries.inc(role="reader")
+                time.sleep(BUSY_RETRY_DELAY_SECONDS * 2 ** attempt)
+                continue
+            raise HTTPException(status_code=500, detail=f"Database error: {e}")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {e}")
+
+# Helper function to map a statement to its metrics label, publishing its SQL once
+@lru_cache(maxsize=1024)
+def statement_label(query):
+    statement = statement_fingerprint(query)
+    sql_statement_info.set(1, statement=statement, sql=" ".join(query.split()))
+    return statement
+
+# Helper function to run a read statement, record its latency and row count, and
+# log it with its query plan when it is slower than SLOW_QUERY_MS
+def timed_fetchall(connection, query, params):
+    started = time.perf_counter()
+    rows = connection.execute(query, params).fetchall()
+    elapsed = time.perf_counter() - started
+    statement = statement_label(query)
+    sql_query_seconds.observe(elapsed, statement=statement)
+    sql_rows_returned.observe(len(rows), statement=statement)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        sql_slow_queries.inc(statement=statement)
+        log_slow_query(connection, query, params, elapsed, len(rows))
+    return rows
+
+def log_slow_query(connection, query, params, elapsed, row_count):
+    """
+    Print a slow statement with its parameters, row count and EXPLAIN QUERY PLAN.
     """
     try:
-        with connect(DB_FILE) as connection:
-            cursor = connection.cursor()
-            cursor.execute(query, params)
-            connection.commit()
-            return cursor.fetchall()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {e}")
+        plan = [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+    except sqlite3.Error as e:
+        plan = [f"(plan unavailable: {e})"]
+    print(f"Slow query ({elapsed * 1000:.1f} ms, {row_count} rows): {' '.join(query.split())} params={params}")
+    for line in plan:
+        print(f"    {line}")
 
 # Background task to generate and insert sales, lead, and web logs
 async def generate_logs():
@@ -29,6 +277,7 @@ async def generate_logs():
     Continuously generate and insert random logs into the database.
     """
     while True:
+        batch_started = time.perf_counter()
         sales_logs = []
         lead_logs = []
         web_logs = []
@@ -36,7 +285,7 @@ async def generate_logs():
         # Generate sales logs
         for _ in range(3):
             sales_logs.append((
-                datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                int(time.time()),
                 random.choice(["AI Assistant", "Rapid Prototyping", "Demo Session", "Event Participant Package", "Enterprise AI Package"]),
                 random.choice(["Alice", "Bob", "Charlie", "Diana"]),
                 random.randint(100, 1000),
@@ -48,16 +297,18 @@ async def generate_logs():
         # Generate lead logs
         for _ in range(2):
             lead_logs.append((
-                datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                int(time.time()),
                 random.choice(["Website", "Social Media", "Email Campaign", "Referral"]),
                 random.choice(["New", "Contacted", "Closed"])
             ))
 
-        # Generate web logs
-        for _ in range(3):
+        # Generate web logs, resolving each visitor's country at ingest time
+        ips = [f"192.168.{random.randint(1, 255)}.{random.randint(1, 255)}" for _ in range(3)]  # Random IPs
+        for ip, country in zip(ips, geoip.countries(ips)):
             web_logs.append((
-                datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
-                f"192.168.{random.randint(1, 255)}.{random.randint(1, 255)}",  # Random IP
+                int(time.time()),
+                ip,
+                country,
                 random.choice(["/home", "/about", "/products", "/services", "/demo"]),
                 random.choice(["GET", "POST"]),
                 random.choice([200, 404, 500]),
@@ -65,160 +316,329 @@ async def generate_logs():
                 random.choice(["Mozilla/5.0", "curl/7.64.1", "PostmanRuntime/7.28.4"])
             ))
 
-        # Insert logs into the database
+        # Insert logs and their rollups in one transaction on the writer
+        # thread; the event loop keeps serving requests while it commits.
+        # The commit listeners read the database (and may write the
+        # heavy-hitters checkpoint), so they run off the event loop too.
         try:
-            with connect(DB_FILE) as connection:
-                cursor = connection.cursor()
-
-                # Insert sales logs
-                cursor.executemany("""
-                    INSERT INTO sales_metrics (timestamp, product, salesperson, revenue, profit, country, endpoint)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, sales_logs)
-
-                # Insert lead logs
-                cursor.executemany("""
-                    INSERT INTO leads (timestamp, lead_source, lead_status)
-                    VALUES (?, ?, ?)
-                """, lead_logs)
-
-                # Insert web logs
-                cursor.executemany("""
-                    INSERT INTO weblogs (timestamp, ip, endpoint, method, status_code, response_time_ms, user_agent)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, web_logs)
-
-                connection.commit()
+            changes = await db_writer.run(insert_logs, sales_logs, lead_logs, web_logs)
+            await asyncio.to_thread(publish_commit, changes)
+            ingest_batch_seconds.observe(time.perf_counter() - batch_started)
             print(f"Inserted {len(sales_logs)} sales logs, {len(lead_logs)} lead logs, and {len(web_logs)} web logs.")
         except Exception as e:
+            ingest_errors.inc()
             print(f"Error during log insertion: {e}")
 
-        await asyncio.sleep(10)
+        await asyncio.sleep(LOG_INTERVAL_SECONDS)
 
 @app.on_event("startup")
 async def start_log_generation():
     """
-    Start the background task to generate logs when the application starts.
+    Bring the schema up to date, load the heavy-hitters tracker and build
+    the range sums, start the writer thread and the ingest buffer, then the
+    background task to generate logs.
+    """
+    await asyncio.to_thread(apply_migrations, DB_FILE)
+    await asyncio.to_thread(load_heavy_hitters)
+    await asyncio.to_thread(load_range_sums)
+    db_writer.start()
+    ingest_buffer.start()
+    app.state.log_task = asyncio.create_task(generate_logs())
+
+@app.on_event("shutdown")
+def close_connection_pool():
+    """
+    Stop the log generator, flush the ingest buffer and finish the queued
+    writes, checkpoint the heavy-hitters tracker, then close every pooled
+    database connection and the GeoIP reader when the application stops.
+    """
+    log_task = getattr(app.state, "log_task", None)
+    if log_task is not None:
+        log_task.cancel()
+    ingest_buffer.close()
+    db_writer.close()
+    if heavy_hitters.loaded:
+        heavy_hitters.checkpoint(heavy_hitters_checkpoint())
+    pool.close()
+    geoip.close()
+
+# Columns returned by the bulk data endpoints, with their Arrow encodings
+SALES_EXPORT_SCHEMA = [
+    ("timestamp", "timestamp"), ("product", "dictionary"), ("salesperson", "dictionary"),
+    ("revenue", "int"), ("profit", "int"), ("country", "dictionary"),
+]
+WEBLOG_EXPORT_SCHEMA = [
+    ("timestamp", "timestamp"), ("ip", "string"), ("country", "dictionary"), ("endpoint", "dictionary"),
+    ("method", "dictionary"), ("status_code", "int"), ("response_time_ms", "float"), ("user_agent", "dictionary"),
+]
+SALES_EXPORT_COLUMNS = [name for name, _ in SALES_EXPORT_SCHEMA]
+WEBLOG_EXPORT_COLUMNS = [name for name, _ in WEBLOG_EXPORT_SCHEMA]
+
+# Helper function to build the WHERE clause shared by the bulk data endpoints
+def bulk_filter_clause(start_date, end_date, **equals):
+    clause, params = timestamp_clause(request_range(start_date, end_date))
+    for column, value in equals.items():
+        if value is not None and value != "":
+            clause += f" AND {column} = ?"
+            params.append(value)
+    return clause, params
+
+# Helper function to fetch one keyset page of a bulk query
+def fetch_page(table, columns, filter_clause, filter_params, cursor, limit, text_timestamps=True):
+    """
+    Return (rows, next_cursor) for the page of `table` after `cursor`, newest first.
+    Rows hold the `columns` values, with the timestamp as API text, or as
+    epoch seconds without `text_timestamps`; next_cursor is None on the last page.
     """
-    asyncio.create_task(generate_logs())
+    try:
+        keyset, keyset_params = keyset_clause(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    select = [
+        timestamp_text() if column == "timestamp" and text_timestamps else column
+        for column in columns
+    ]
+    query = (
+        f"SELECT id, timestamp, {', '.join(select)} FROM {table}"
+        " WHERE timestamp IS NOT NULL" + filter_clause + keyset +
+        " ORDER BY timestamp DESC, id DESC LIMIT ?"
+    )
+    results = query_database(query, tuple(filter_params + keyset_params + [limit]))
+    next_cursor = None
+    if len(results) == limit:
+        last = results[-1]
+        next_cursor = encode_cursor(last[1], last[0])
+    return [row[2:] for row in results], next_cursor
+
+# Helper function to walk every keyset page from `cursor` onwards
+def iter_pages(table, columns, filter_clause, filter_params, cursor, chunk_size, text_timestamps=True):
+    while True:
+        rows, cursor = fetch_page(table, columns, filter_clause, filter_params, cursor, chunk_size, text_timestamps)
+        yield rows
+        if cursor is None:
+            break
+
+# Helper function to validate a cursor before a response starts streaming
+def check_cursor(cursor):
+    try:
+        keyset_clause(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Helper function to answer a bulk query as Arrow IPC or Parquet
+def columnar_response(schema_columns, pages, fmt, filename, next_cursor=None):
+    media_type = PARQUET_MEDIA_TYPE if fmt == "parquet" else ARROW_STREAM_MEDIA_TYPE
+    extension = "parquet" if fmt == "parquet" else "arrows"
+    headers = {"Content-Disposition": f"attachment; filename={filename}.{extension}", "Vary": "Accept"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return StreamingResponse(stream_batches(build_schema(schema_columns), pages, fmt), media_type=media_type, headers=headers)
 
 @app.get("/filter-sales", summary="Filter sales metrics by date, salesperson, product, and country")
 def filter_sales(
+    request: Request,
     start_date: Optional[str] = Query(None, description="Start date in YYYY-MM-DD format"),
     end_date: Optional[str] = Query(None, description="End date in YYYY-MM-DD format"),
     salesperson: Optional[str] = Query(None, description="Salesperson name (e.g., Alice, Bob)"),
     product: Optional[str] = Query(None, description="Product name (e.g., AI Assistant)"),
     country: Optional[str] = Query(None, description="Country name (e.g., USA, UK)"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; enables keyset pagination"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the previous page's next_cursor"),
 ):
     """
     Filters the sales_metrics table based on the provided query parameters.
+    With `limit` (or `cursor`) the result is paged newest first and includes
+    a `next_cursor` for the following page. Clients sending an Accept header
+    for Arrow IPC stream or Parquet get a columnar, dictionary-encoded body.
     """
-    # Build SQL query dynamically based on filters
-    query = "SELECT timestamp, product, salesperson, revenue, profit, country FROM sales_metrics WHERE 1=1"
-    params = []
-
-    if start_date:
-        query += " AND timestamp >= ?"
-        params.append(f"{start_date} 00:00:00")
-    if end_date:
-        query += " AND timestamp <= ?"
-        params.append(f"{end_date} 23:59:59")
-    if salesperson:
-        query += " AND salesperson = ?"
-        params.append(salesperson)
-    if product:
-        query += " AND product = ?"
-        params.append(product)
-    if country:
-        query += " AND country = ?"
-        params.append(country)
+    filter_clause, params = bulk_filter_clause(
+        start_date, end_date, salesperson=salesperson, product=product, country=country
+    )
+    fmt = negotiate_format(request.headers.get("accept"))
+
+    if fmt != "json":
+        check_cursor(cursor)
+        if limit is not None:
+            rows, next_cursor = fetch_page("sales_metrics", SALES_EXPORT_COLUMNS, filter_clause, params, cursor, limit, False)
+            return columnar_response(SALES_EXPORT_SCHEMA, [rows], fmt, "filtered_sales", next_cursor)
+        pages = iter_pages("sales_metrics", SALES_EXPORT_COLUMNS, filter_clause, params, cursor, MAX_PAGE_SIZE, False)
+        return columnar_response(SALES_EXPORT_SCHEMA, pages, fmt, "filtered_sales")
+
+    if limit is not None or cursor is not None:
+        rows, next_cursor = fetch_page("sales_metrics", SALES_EXPORT_COLUMNS, filter_clause, params, cursor, limit or 1000)
+        return {
+            "results": [dict(zip(SALES_EXPORT_COLUMNS, row)) for row in rows],
+            "next_cursor": next_cursor,
+        }
 
+    # Build SQL query dynamically based on filters
+    query = f"SELECT {timestamp_text()}, product, salesperson, revenue, profit, country FROM sales_metrics WHERE 1=1"
+    query += filter_clause
     query += " ORDER BY timestamp DESC"
 
     results = query_database(query, tuple(params))
-    columns = ["timestamp", "product", "salesperson", "revenue", "profit", "country"]
-    filtered_data = [dict(zip(columns, row)) for row in results]
+    filtered_data = [dict(zip(SALES_EXPORT_COLUMNS, row)) for row in results]
 
     return {"results": filtered_data}
 
+@app.get("/filter-sales/stream", summary="Stream filtered sales metrics as NDJSON or CSV")
+def stream_filter_sales(
+    start_date: Optional[str] = Query(None, description="Start date in YYYY-MM-DD format"),
+    end_date: Optional[str] = Query(None, description="End date in YYYY-MM-DD format"),
+    salesperson: Optional[str] = Query(None, description="Salesperson name (e.g., Alice, Bob)"),
+    product: Optional[str] = Query(None, description="Product name (e.g., AI Assistant)"),
+    country: Optional[str] = Query(None, description="Country name (e.g., USA, UK)"),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="Output format: ndjson or csv"),
+    chunk_size: int = Query(1000, ge=1, le=MAX_PAGE_SIZE, description="Rows fetched per keyset page"),
+    cursor: Optional[str] = Query(None, description="Resume after this cursor"),
+):
+    """
+    Stream every matching sale, newest first, one keyset page at a time so
+    server memory stays constant regardless of the result size.
+    """
+    filter_clause, params = bulk_filter_clause(
+        start_date, end_date, salesperson=salesperson, product=product, country=country
+    )
+    check_cursor(cursor)
+
+    def generate_rows():
+        pages = iter_pages("sales_metrics", SALES_EXPORT_COLUMNS, filter_clause, params, cursor, chunk_size)
+        for index, rows in enumerate(pages):
+            if format == "csv":
+                yield csv_chunk(SALES_EXPORT_COLUMNS, rows, header=index == 0)
+            else:
+                yield ndjson_chunk(SALES_EXPORT_COLUMNS, rows)
+
+    if format == "csv":
+        return StreamingResponse(
+            generate_rows(),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=filtered_sales.csv"},
+        )
+    return StreamingResponse(generate_rows(), media_type="application/x-ndjson")
+
+@app.get("/filter-weblogs", summary="Filter web logs by date, landing page, country and status code")
+def filter_weblogs(
+    request: Request,
+    start_date: Optional[str] = Query(None, description="Start date in YYYY-MM-DD format"),
+    end_date: Optional[str] = Query(None, description="End date in YYYY-MM-DD format"),
+    endpoint: Optional[str] = Query(None, description="Landing page (e.g., /home)"),
+    country: Optional[str] = Query(None, description="Visitor country"),
+    status_code: Optional[int] = Query(None, description="HTTP status code"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size (JSON defaults to 1000)"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the previous page"),
+):
+    """
+    Page through the weblogs table newest first. JSON responses are always
+    paged; Arrow IPC stream or Parquet (via the Accept header) stream every
+    matching row unless `limit` is given.
+    """
+    filter_clause, params = bulk_filter_clause(
+        start_date, end_date, endpoint=endpoint, country=country, status_code=status_code
+    )
+    fmt = negotiate_format(request.headers.get("accept"))
+    check_cursor(cursor)
+
+    if fmt != "json" and limit is None:
+        pages = iter_pages("weblogs", WEBLOG_EXPORT_COLUMNS, filter_clause, params, cursor, MAX_PAGE_SIZE, False)
+        return columnar_response(WEBLOG_EXPORT_SCHEMA, pages, fmt, "filtered_weblogs")
+
+    rows, next_cursor = fetch_page("weblogs", WEBLOG_EXPORT_COLUMNS, filter_clause, params, cursor, limit or 1000, fmt == "json")
+    if fmt != "json":
+        return columnar_response(WEBLOG_EXPORT_SCHEMA, [rows], fmt, "filtered_weblogs", next_cursor)
+    return {
+        "results": [dict(zip(WEBLOG_EXPORT_COLUMNS, row)) for row in rows],
+        "next_cursor": next_cursor,
+    }
+
 # API Endpoints for KPIs
 @app.get("/kpis/total-revenue")
-def get_total_revenue():
+@kpi_cache.cached("sales_metrics")
+def get_total_revenue(
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None)
+):
     """
     Fetch the total revenue from sales metrics.
+    Optional date range filters can be applied.
     """
-    query = "SELECT SUM(revenue) FROM sales_metrics"
-    result = query_database(query)
-    total_revenue = result[0][0] if result and result[0][0] else 0
+    total_revenue = kpi_sums("sales_metrics", request_range(start_date, end_date))[()][0]
     return {"total_revenue": total_revenue}
 
 @app.get("/kpis/total-sales-profit")
-def get_total_sales_profit():
+@kpi_cache.cached("sales_metrics")
+def get_total_sales_profit(
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None)
+):
     """
     Fetch the total profit from sales metrics.
+    Optional date range filters can be applied.
     """
-    query = "SELECT SUM(profit) FROM sales_metrics"
-    result = query_database(query)
-    total_sales_profit = result[0][0] if result and result[0][0] else 0
+    total_sales_profit = kpi_sums("sales_metrics", request_range(start_date, end_date))[()][1]
     return {"total_sales_profit": total_sales_profit}
 
 @app.get("/kpis/profit-per-salesperson")
-def get_profit_per_salesperson():
+@kpi_cache.cached("sales_metrics")
+def get_profit_per_salesperson(
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None)
+):
     """
     Fetch total profit grouped by salesperson.
+    Optional date range filters can be applied.
     """
-    query = """
-    SELECT salesperson, SUM(profit) AS total_profit
-    FROM sales_metrics
-    GROUP BY salesperson
-    ORDER BY total_profit DESC
-    """
-    results = query_database(query)
-    return {"profit_per_salesperson": [{"salesperson": row[0], "total_profit": row[1]} for row in results]}
+    sums = kpi_sums("sales_metrics", request_range(start_date, end_date), ("salesperson",))
+    return {"profit_per_salesperson": [
+        {"salesperson": name, "total_profit": totals[1]} for name, totals in ranked(sums, 1)
+    ]}
 
 @app.get("/kpis/profit-per-product")
-def get_profit_per_product():
+@kpi_cache.cached("sales_metrics")
+def get_profit_per_product(
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None)
+):
     """
     Fetch total profit grouped by product.
+    Optional date range filters can be applied.
     """
-    query = """
-    SELECT product, SUM(profit) AS total_profit
-    FROM sales_metrics
-    GROUP BY product
-    ORDER BY total_profit DESC
-    """
-    results = query_database(query)
-    return {"profit_per_product": [{"product": row[0], "total_profit": row[1]} for row in results]}
+    sums = kpi_sums("sales_metrics", request_range(start_date, end_date), ("product",))
+    return {"profit_per_product": [
+        {"product": name, "total_profit": totals[1]} for name, totals in ranked(sums, 1)
+    ]}
 
 @app.get("/kpis/sales-per-country")
-def get_sales_per_country():
+@kpi_cache.cached("sales_metrics")
+def get_sales_per_country(
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None)
+):
     """
     Fetch total revenue grouped by country.
+    Optional date range filters can be applied.
     """
-    query = """
-    SELECT country, SUM(revenue) AS total_revenue
-    FROM sales_metrics
-    GROUP BY country
-    ORDER BY total_revenue DESC
-    """
-    results = query_database(query)
-    return {"sales_per_country": [{"country": row[0], "total_revenue": row[1]} for row in results]}
+    sums = kpi_sums("sales_metrics", request_range(start_date, end_date), ("country",))
+    return {"sales_per_country": [
+        {"country": name, "total_revenue": totals[0]} for name, totals in ranked(sums, 0)
+    ]}
 
 @app.get("/kpis/demo-requests")
-def get_demo_requests():
+@kpi_cache.cached("sales_metrics")
+def get_demo_requests(
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None)
+):
     """
     Fetch the count of demo requests.
+    Optional date range filters can be applied.
     """
-    query = """
-    SELECT COUNT(*) AS demo_requests
-    FROM sales_metrics
-    WHERE endpoint = "/demo"
-    """
-    result = query_database(query)
-    demo_requests = result[0][0] if result else 0
+    sums = kpi_sums("sales_metrics", request_range(start_date, end_date), ("endpoint",))
+    demo_requests = sums.get("/demo", [0, 0, 0])[2]
     return {"demo_requests": demo_requests}
 
 @app.get("/kpis/product-sales-per-country")
+@kpi_cache.cached("sales_metrics")
 def get_product_sales_per_country(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None)
@@ -227,21 +647,18 @@ def get_product_sales_per_country(
     Fetch total sales aggregated by country and product.
     Optional date range filters can be applied.
     """
-    query = """
-    SELECT country, product, SUM(revenue) AS total_revenue
-    FROM sales_metrics
-    WHERE 1=1
-    """
-    params = []
-    query += " GROUP BY country, product ORDER BY country, total_revenue DESC"
-    results = query_database(query, tuple(params))
+    sums = kpi_sums("sales_metrics", request_range(start_date, end_date), ("country", "product"))
     return {
         "product_sales_per_country": [
-            {"country": row[0], "product": row[1], "total_revenue": row[2]} for row in results
+            {"country": country, "product": product, "total_revenue": totals[0]}
+            for (country, product), totals in sorted(
+                sums.items(), key=lambda item: (item[0][0] is not None, item[0][0] or "", -item[1][0])
+            )
         ]
     }
 
 @app.get("/kpis/best-salesperson")
+@kpi_cache.cached("sales_metrics")
 def get_best_salesperson(
     start_date: Optional[str] = Query(None),  # Format: YYYY-MM-DD
     end_date: Optional[str] = Query(None)     # Format: YYYY-MM-DD
@@ -250,23 +667,17 @@ def get_best_salesperson(
     Fetch the best salesperson ranked by total revenue and profit.
     Optional date range filters can be applied.
     """
-    query = """
-    SELECT salesperson, SUM(revenue) AS total_revenue, SUM(profit) AS total_profit
-    FROM sales_metrics
-    WHERE 1=1
-    """
-    params = []
-    query += " GROUP BY salesperson ORDER BY total_revenue DESC LIMIT 1"
+    requested = request_range(start_date, end_date)
 
-    # Execute the query and fetch results
+    # Rank the salespeople by revenue
     try:
-        result = query_database(query, tuple(params))
+        result = ranked(kpi_sums("sales_metrics", requested, ("salesperson",)), 0)
         if result:
-            best_salesperson = result[0]
+            name, totals = result[0]
             return {
-                "salesperson": best_salesperson[0],
-                "total_revenue": best_salesperson[1],
-                "total_profit": best_salesperson[2]
+                "salesperson": name,
+                "total_revenue": totals[0],
+                "total_profit": totals[1]
             }
         else:
             # Return a default response if no salesperson data is found
@@ -280,6 +691,7 @@ def get_best_salesperson(
         raise HTTPException(status_code=500, detail=f"Error fetching best salesperson: {e}")
 
 @app.get("/kpis/most-sold-product")
+@kpi_cache.cached("sales_metrics")
 def get_most_sold_product(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None)
@@ -288,23 +700,17 @@ def get_most_sold_product(
     Fetch the most sold product based on total revenue.
     Optional date range filters can be applied.
     """
-    query = """
-    SELECT product, SUM(revenue) AS total_revenue
-    FROM sales_metrics
-    WHERE 1=1
-    """
-    params = []
-    query += " GROUP BY product ORDER BY total_revenue DESC LIMIT 1"
-    result = query_database(query, tuple(params))
+    result = ranked(kpi_sums("sales_metrics", request_range(start_date, end_date), ("product",)), 0)
     if result:
         return {
             "product": result[0][0],
-            "total_revenue": result[0][1]
+            "total_revenue": result[0][1][0]
         }
     print(f"DEBUG - Query Results: {result}")
     return {"product": None, "total_revenue": 0}
 
 @app.get("/kpis/conversion-rate")
+@kpi_cache.cached("sales_metrics", "leads")
 def get_conversion_rate(
     start_date: str = Query(None),  # Format: YYYY-MM-DD
     end_date: str = Query(None)     # Format: YYYY-MM-DD
@@ -313,22 +719,13 @@ def get_conversion_rate(
     Calculate the conversion rate based on leads turning into sales.
     Optional date range filters can be applied.
     """
-    # Fetch the total number of leads
-    lead_query = """
-    SELECT COUNT(*) FROM leads
-    WHERE 1=1
-    """
-    lead_params = []
+    requested = request_range(start_date, end_date)
 
-    total_leads = query_database(lead_query, tuple(lead_params))[0][0]
+    # Fetch the total number of leads
+    total_leads = kpi_sums("leads", requested)[()][0]
 
     # Fetch the total number of sales
-    sales_query = """
-    SELECT COUNT(*) FROM sales_metrics
-    WHERE 1=1
-    """
-    sales_params = []
-    total_sales = query_database(sales_query, tuple(sales_params))[0][0]
+    total_sales = kpi_sums("sales_metrics", requested)[()][2]
 
     # Calculate conversion rate
     if total_leads == 0:
@@ -343,6 +740,7 @@ def get_conversion_rate(
     }
 
 @app.get("/kpis/total-revenue-profit-salesperson")
+@kpi_cache.cached("sales_metrics")
 def get_total_revenue_profit_salesperson(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None)
@@ -351,25 +749,19 @@ def get_total_revenue_profit_salesperson(
     Fetch total revenue and profit per salesperson.
     Optional date range filters can be applied.
     """
-    query = """
-    SELECT salesperson, SUM(revenue) AS total_revenue, SUM(profit) AS total_profit
-    FROM sales_metrics
-    WHERE 1=1
-    """
-    params = []
-
-    query += " GROUP BY salesperson ORDER BY total_revenue DESC"
+    requested = request_range(start_date, end_date)
 
     try:
-        results = query_database(query, tuple(params))
+        results = ranked(kpi_sums("sales_metrics", requested, ("salesperson",)), 0)
         return [
-            {"salesperson": row[0], "total_revenue": row[1], "total_profit": row[2]}
-            for row in results
+            {"salesperson": name, "total_revenue": totals[0], "total_profit": totals[1]}
+            for name, totals in results
         ]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching data: {e}")
 
 @app.get("/kpis/total-revenue-profit-product")
+@kpi_cache.cached("sales_metrics")
 def get_total_revenue_profit_product(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None)
@@ -378,144 +770,563 @@ def get_total_revenue_profit_product(
     Fetch total revenue and profit per product.
     Optional date range filters can be applied.
     """
-    query = """
-    SELECT product, SUM(revenue) AS total_revenue, SUM(profit) AS total_profit
-    FROM sales_metrics
-    WHERE 1=1
-    """
-    params = []
-
-    query += " GROUP BY product ORDER BY total_revenue DESC"
+    requested = request_range(start_date, end_date)
 
     try:
-        results = query_database(query, tuple(params))
+        results = ranked(kpi_sums("sales_metrics", requested, ("product",)), 0)
         return [
-            {"product": row[0], "total_revenue": row[1], "total_profit": row[2]}
-            for row in results
+            {"product": name, "total_revenue": totals[0], "total_profit": totals[1]}
+            for name, totals in results
         ]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching data: {e}")
 
 @app.get("/kpis/total-website-visits")
+@kpi_cache.cached("weblogs")
 def total_website_visits(
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)")
 ):
-    query = "SELECT COUNT(*) FROM weblogs WHERE 1=1"
-    params = []
-    
-    result = query_database(query, tuple(params))
-    return {"total_website_visits": result[0][0]}
+    visits = kpi_sums("weblogs", request_range(start_date, end_date))[()][0]
+    return {"total_website_visits": visits}
 
 @app.get("/kpis/unique-visitors")
+@kpi_cache.cached("weblogs")
 def unique_visitors(
-    
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    exact: bool = Query(False, description="Count distinct IPs over the raw rows instead of merging the HyperLogLog sketches")
 ):
-    query = "SELECT COUNT(DISTINCT ip) FROM weblogs WHERE 1=1"
-    params = []
-    
-    result = query_database(query, tuple(params))
-    return {"unique_visitors": result[0][0]}
+    """
+    Count distinct visitor IPs over the range. By default the hourly or
+    daily HyperLogLog sketches covering it are merged, giving an estimate
+    with `standard_error` relative error (about 1.6%); `exact=true`, and
+    bounds inside an hour, count over the raw rows instead.
+    """
+    return count_unique_visitors(request_range(start_date, end_date), exact)
 
 @app.get("/kpis/top-landing-pages")
+@kpi_cache.cached("weblogs")
 def top_landing_pages(
     limit: int = Query(5, description="Number of top landing pages to return"),
-    
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    exact: bool = Query(False, description="Count from the range sums instead of the heavy-hitters tracker")
+):
+    """
+    Return the most visited landing pages. Unbounded and whole-day ranges
+    are served from the heavy-hitters tracker; `max_error` bounds how far
+    its visit counts may exceed the true ones.
+    """
+    return top_values_response("endpoint", "top_landing_pages", limit, request_range(start_date, end_date), exact)
+
+@app.get("/kpis/top-ips")
+@kpi_cache.cached("weblogs")
+def top_ips(
+    limit: int = Query(5, description="Number of top visitor IPs to return"),
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    exact: bool = Query(False, description="Count over the raw rows instead of the heavy-hitters tracker")
 ):
-    query = "SELECT endpoint, COUNT(*) as visits FROM weblogs WHERE 1=1"
-    params = []
-    
-    query += " GROUP BY endpoint ORDER BY visits DESC LIMIT ?"
-    params.append(limit)
-    result = query_database(query, tuple(params))
-    return {"top_landing_pages": [{"endpoint": row[0], "visits": row[1]} for row in result]}
+    """
+    Return the visitor IPs with the most requests, served like /kpis/top-landing-pages.
+    """
+    return top_values_response("ip", "top_ips", limit, request_range(start_date, end_date), exact)
+
+@app.get("/kpis/top-user-agents")
+@kpi_cache.cached("weblogs")
+def top_user_agents(
+    limit: int = Query(5, description="Number of top user agents to return"),
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    exact: bool = Query(False, description="Count over the raw rows instead of the heavy-hitters tracker")
+):
+    """
+    Return the user agents with the most requests, served like /kpis/top-landing-pages.
+    """
+    return top_values_response("user_agent", "top_user_agents", limit, request_range(start_date, end_date), exact)
+
+@app.get("/kpis/response-times")
+@kpi_cache.cached("weblogs")
+def response_times(
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    endpoint: Optional[str] = Query(None, description="Landing page (e.g., /home); every endpoint if omitted"),
+    interval: str = Query("hourly", description="Heatmap bucket length: minutely, hourly or daily")
+):
+    """
+    Return response-time percentiles (p50/p90/p95/p99) overall and per
+    endpoint, merged from the per-minute, hourly and daily latency
+    histograms, each within `relative_error` of the exact value. The
+    `histogram` section holds the latency bins and one row of counts per
+    `interval` bucket, ready to draw as a heatmap. A range too long for
+    the requested interval is drawn with a coarser one, reported back in
+    `histogram.interval`; `truncated` means only its latest days are drawn.
+    """
+    if interval not in HISTOGRAM_GRAINS:
+        raise HTTPException(status_code=422, detail=f"interval must be one of {', '.join(HISTOGRAM_GRAINS)}")
+    requested = request_range(start_date, end_date)
+    by_endpoint = histograms(query_database, requested, endpoint)
+    drawn, truncated, rows = heatmap(query_database, requested, interval, endpoint)
+
+    overall = {}
+    for histogram in by_endpoint.values():
+        for bin_index, count in histogram.items():
+            overall[bin_index] = overall.get(bin_index, 0) + count
+    bins = sorted({bin_index for _, counts in rows for bin_index in counts})
+    return {
+        "response_times": percentiles(overall),
+        "by_endpoint": [
+            {"endpoint": name or None, **percentiles(histogram)}
+            for name, histogram in sorted(by_endpoint.items(), key=lambda item: sum(item[1].values()), reverse=True)
+        ],
+        "relative_error": RELATIVE_ERROR,
+        "histogram": {
+            "interval": drawn,
+            "truncated": truncated,
+            "bins": [list(bin_bounds(bin_index)) for bin_index in bins],
+            "buckets": [
+                {"bucket": bucket, "counts": [counts.get(bin_index, 0) for bin_index in bins]}
+                for bucket, counts in rows
+            ],
+        },
+    }
 
 @app.get("/kpis/demo-requests")
-def demo_requests():
-    
-    query = "SELECT COUNT(*) FROM weblogs WHERE endpoint = '/demo'"
-    params = []
-    
-    result = query_database(query, tuple(params))
-    return {"demo_requests": result[0][0]}
+@kpi_cache.cached("weblogs")
+def demo_requests(
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)")
+):
+    sums = kpi_sums("weblogs", request_range(start_date, end_date), ("endpoint",))
+    return {"demo_requests": sums.get("/demo", [0])[0]}
 
 @app.get("/kpis/leads-generated")
+@kpi_cache.cached("leads")
 def leads_generated(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None)
 ):
-    query = "SELECT COUNT(*) FROM leads WHERE 1=1"
-    params = []
-    if start_date:
-        query += " AND date(timestamp) >= date(?)"
-        params.append(start_date)
-    if end_date:
-        query += " AND date(timestamp) <= date(?)"
-        params.append(end_date)
-    result = query_database(query, tuple(params))  # Only pass params if there are ?
-    return {"leads_generated": result[0][0]}
+    leads = kpi_sums("leads", request_range(start_date, end_date))[()][0]
+    return {"leads_generated": leads}
 
 @app.get("/kpis/leads-by-source")
+@kpi_cache.cached("leads")
 def leads_by_source(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None)
 ):
-    query = "SELECT lead_source, COUNT(*) as count FROM leads WHERE 1=1"
-    params = []
-    
-    query += " GROUP BY lead_source ORDER BY count DESC"
-    rows = query_database(query, tuple(params))
-    return {"leads_by_source": [{"lead_source": row[0], "count": row[1]} for row in rows]}
+    sums = kpi_sums("leads", request_range(start_date, end_date), ("lead_source",))
+    return {"leads_by_source": [{"lead_source": name, "count": totals[0]} for name, totals in ranked(sums, 0)]}
 
 @app.get("/kpis/leads-by-status")
+@kpi_cache.cached("leads")
 def leads_by_status(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None)
 ):
-    query = "SELECT lead_status, COUNT(*) as count FROM leads WHERE 1=1"
-    params = []
-    if end_date:
-        query += " AND date(timestamp) <= date(?)"
-        params.append(end_date)
-    query += " GROUP BY lead_status ORDER BY count DESC"
-    rows = query_database(query, tuple(params))
-    return {"leads_by_status": [{"lead_status": row[0], "count": row[1]} for row in rows]}
+    sums = kpi_sums("leads", request_range(start_date, end_date), ("lead_status",))
+    return {"leads_by_status": [{"lead_status": name, "count": totals[0]} for name, totals in ranked(sums, 0)]}
 
 @app.get("/kpis/lead-conversion-rate")
+@kpi_cache.cached("leads")
 def lead_conversion_rate(
-    
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None)
 ):
-    total_query = "SELECT COUNT(*) FROM leads WHERE 1=1"
-    converted_query = "SELECT COUNT(*) FROM leads WHERE lead_status = 'Closed'"
-    params = []
-    params_converted = []
-    
-    total = query_database(total_query, tuple(params))[0][0]
-    converted = query_database(converted_query, tuple(params_converted))[0][0]
+    sums = kpi_sums("leads", request_range(start_date, end_date), ("lead_status",))
+    total = sum(totals[0] for totals in sums.values())
+    converted = sums.get("Closed", [0])[0]
     rate = (converted / total) * 100 if total > 0 else 0
     return {"lead_conversion_rate": round(rate, 2)}
 
 @app.get("/kpis/leads-by-day")
+@kpi_cache.cached("leads")
 def leads_by_day(
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None)
 ):
-    query = """
-        SELECT date(timestamp) as date, COUNT(*) as count
-        FROM leads
-        WHERE 1=1
-    """
-    params = []
-    if start_date:
-        query += " AND date(timestamp) >= date(?)"
-        params.append(start_date)
-    if end_date:
-        query += " AND date(timestamp) <= date(?)"
-        params.append(end_date)
-    query += " GROUP BY date(timestamp) ORDER BY date(timestamp)"
+    source, params = kpi_source("leads", start_date, end_date)
+    query = f"""
+        SELECT date(bucket) as date, SUM(lead_count) as count
+        FROM {source}
+        GROUP BY 1 ORDER BY 1
+    """
     rows = query_database(query, tuple(params))
     return {"leads_by_day": [{"date": row[0], "count": row[1]} for row in rows]}
 
+# Helper function to parse a request's date range, answering 422 when it is malformed
+def request_range(start_date, end_date):
+    try:
+        return date_range(start_date, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+# Helper function to resolve a table's rollup (or raw rows) over a request's date range
+def kpi_source(table, start_date, end_date):
+    return rollup_source(table, request_range(start_date, end_date))
+
+# Helper function to sum a table's rollup measures over a range, overall (key
+# ()) or per value of `dimensions`, from the range sums or, for bounds inside
+# an hour, with SQL over the rollups or raw rows
+def kpi_sums(table, requested, dimensions=()):
+    if not range_sums.loaded:
+        load_range_sums()
+    sums = range_sums.sums(table, requested, dimensions)
+    if sums is None:
+        sums = rollup_sums(query_database, table, requested, dimensions)
+    return sums
+
+# Helper function to rank kpi_sums() results by one measure, largest first
+def ranked(sums, measure):
+    return sorted(sums.items(), key=lambda item: item[1][measure], reverse=True)
+
+# Helper function to count distinct visitor IPs over a range, from the merged
+# visitor sketches or, when exact or the bounds fall inside an hour, the raw rows
+def count_unique_visitors(requested, exact=False):
+    sketches = None if exact else sketch_query(requested)
+    if sketches is None:
+        range_clause, params = timestamp_clause(requested)
+        count = query_database("SELECT COUNT(DISTINCT ip) FROM weblogs WHERE 1=1" + range_clause, tuple(params))[0][0]
+        return {"unique_visitors": count, "exact": True, "standard_error": 0.0}
+    query, params = sketches
+    registers = merge([row[0] for row in query_database(query, tuple(params))])
+    return {"unique_visitors": estimate(registers), "exact": False, "standard_error": STANDARD_ERROR}
+
+# Helper function to answer a top-K request on a weblogs column from the
+# heavy-hitters tracker or, when exact, above MAX_K or for a range it does not
+# cover, from the range sums (landing pages) or the raw rows
+def top_values_response(column, key, limit, requested, exact=False):
+    tracked = None
+    if not exact and limit <= MAX_K:
+        if not heavy_hitters.loaded:
+            load_heavy_hitters()
+        tracked = heavy_hitters.top(column, limit, requested)
+    if tracked is not None:
+        rows = [(value, count) for value, count, _ in tracked]
+        max_error = max((error for _, _, error in tracked), default=0)
+    elif column == "endpoint":
+        rows = [(name, totals[0]) for name, totals in ranked(kpi_sums("weblogs", requested, ("endpoint",)), 0)[:limit]]
+        max_error = 0
+    else:
+        query, params = exact_top_query(column, limit, requested)
+        rows = query_database(query, tuple(params))
+        max_error = 0
+    return {
+        key: [{column: value, "visits": visits} for value, visits in rows],
+        "exact": tracked is None,
+        "max_error": max_error,
+    }
+
+# Summary sections and the tables each one reads; a section is recomputed
+# only after one of its tables is written
+SUMMARY_SECTIONS = {
+    "sales": ("sales_metrics",),
+    "leads": ("leads",),
+    "weblogs": ("weblogs",),
+    "conversion": ("sales_metrics", "leads"),
+}
+
+# Helper function to build the sales section of the KPI summary
+def summary_sales_section(requested):
+    # Every total as [revenue, profit, sales count], from the range sums
+    by_salesperson = kpi_sums("sales_metrics", requested, ("salesperson",))
+    by_product = kpi_sums("sales_metrics", requested, ("product",))
+    by_country = kpi_sums("sales_metrics", requested, ("country",))
+    by_country_product = kpi_sums("sales_metrics", requested, ("country", "product"))
+    total_revenue, total_profit, _ = kpi_sums("sales_metrics", requested)[()]
+    demo_requests = kpi_sums("sales_metrics", requested, ("endpoint",)).get("/demo", [0, 0, 0])[2]
+
+    salesperson_ranking = sorted(by_salesperson.items(), key=lambda item: item[1][0], reverse=True)
+    product_ranking = sorted(by_product.items(), key=lambda item: item[1][0], reverse=True)
+    if salesperson_ranking:
+        name, (revenue, profit, _) = salesperson_ranking[0]
+        best_salesperson = {"salesperson": name, "total_revenue": revenue, "total_profit": profit}
+    else:
+        best_salesperson = {
+            "salesperson": None,
+            "total_revenue": 0,
+            "total_profit": 0,
+            "message": "No sales data available for the given criteria."
+        }
+    if product_ranking:
+        most_sold_product = {"product": product_ranking[0][0], "total_revenue": product_ranking[0][1][0]}
+    else:
+        most_sold_product = {"product": None, "total_revenue": 0}
+
+    return {
+        "total_revenue": {"total_revenue": total_revenue},
+        "total_sales_profit": {"total_sales_profit": total_profit},
+        "profit_per_salesperson": {"profit_per_salesperson": [
+            {"salesperson": name, "total_profit": totals[1]}
+            for name, totals in sorted(by_salesperson.items(), key=lambda item: item[1][1], reverse=True)
+        ]},
+        "profit_per_product": {"profit_per_product": [
+            {"product": name, "total_profit": totals[1]}
+            for name, totals in sorted(by_product.items(), key=lambda item: item[1][1], reverse=True)
+        ]},
+        "sales_per_country": {"sales_per_country": [
+            {"country": name, "total_revenue": totals[0]}
+            for name, totals in sorted(by_country.items(), key=lambda item: item[1][0], reverse=True)
+        ]},
+        "product_sales_per_country": {"product_sales_per_country": [
+            {"country": country, "product": product, "total_revenue": totals[0]}
+            for (country, product), totals in sorted(
+                by_country_product.items(),
+                key=lambda item: (item[0][0] is not None, item[0][0] or "", -item[1][0]),
+            )
+        ]},
+        "best_salesperson": best_salesperson,
+        "most_sold_product": most_sold_product,
+        "total_revenue_profit_salesperson": [
+            {"salesperson": name, "total_revenue": totals[0], "total_profit": totals[1]}
+            for name, totals in salesperson_ranking
+        ],
+        "total_revenue_profit_product": [
+            {"product": name, "total_revenue": totals[0], "total_profit": totals[1]}
+            for name, totals in product_ranking
+        ],
+        "demo_requests": {"demo_requests": demo_requests},
+    }
+
+# Helper function to build the leads section of the KPI summary
+def summary_leads_section(requested):
+    # Lead counts per source and per status, from the range sums
+    leads_by_source = {name: totals[0] for name, totals in kpi_sums("leads", requested, ("lead_source",)).items()}
+    leads_by_status = {name: totals[0] for name, totals in kpi_sums("leads", requested, ("lead_status",)).items()}
+    leads_generated = kpi_sums("leads", requested)[()][0]
+    closed_leads = leads_by_status.get("Closed", 0)
+    lead_conversion = (closed_leads / leads_generated) * 100 if leads_generated > 0 else 0
+
+    return {
+        "leads_generated": {"leads_generated": leads_generated},
+        "leads_by_source": {"leads_by_source": [
+            {"lead_source": name, "count": count}
+            for name, count in sorted(leads_by_source.items(), key=lambda item: item[1], reverse=True)
+        ]},
+        "leads_by_status": {"leads_by_status": [
+            {"lead_status": name, "count": count}
+            for name, count in sorted(leads_by_status.items(), key=lambda item: item[1], reverse=True)
+        ]},
+        "lead_conversion_rate": {"lead_conversion_rate": round(lead_conversion, 2)},
+    }
+
+# Helper function to build the weblogs section of the KPI summary
+def summary_weblogs_section(requested, limit: int):
+    # The visit total from the range sums, plus the visitor sketches and the heavy-hitters tracker
+    visits = kpi_sums("weblogs", requested)[()][0]
+
+    return {
+        "total_website_visits": {"total_website_visits": visits},
+        "unique_visitors": count_unique_visitors(requested),
+        "top_landing_pages": top_values_response("endpoint", "top_landing_pages", limit, requested),
+    }
+
+# Helper function to build the sales-to-leads conversion section of the KPI summary
+def summary_conversion_section(requested):
+    total_sales = kpi_sums("sales_metrics", requested)[()][2]
+    total_leads = kpi_sums("leads", requested)[()][0]
+    conversion_rate = (total_sales / total_leads) * 100 if total_leads else 0
+
+    return {
+        "conversion_rate": {
+            "total_leads": total_leads,
+            "total_sales": total_sales,
+            "conversion_rate": round(conversion_rate, 2)
+        },
+    }
+
+@app.get("/kpis/summary", summary="Every dashboard KPI in one response")
+def kpi_summary(
+    start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD, UTC) or ISO 8601 date-time"),
+    end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD, inclusive) or exclusive ISO 8601 date-time"),
+    limit: int = Query(5, description="Number of top landing pages to return"),
+    sections: Optional[str] = Query(None, description="Comma-separated sections to return (sales, leads, weblogs, conversion); all by default"),
+):
+    """
+    Compute every KPI the dashboard renders from the range sums. Each entry
+    matches the body of the corresponding /kpis endpoint called with the same
+    date range. Sections are cached
+    independently, so a write to one table only recomputes the sections that
+    read it, and clients following /changes can ask for just those sections.
+    """
+    requested_range = request_range(start_date, end_date)
+    requested = [name.strip() for name in sections.split(",") if name.strip()] if sections else list(SUMMARY_SECTIONS)
+    unknown = [name for name in requested if name not in SUMMARY_SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown summary sections: {', '.join(unknown)}")
+
+    builders = {
+        "sales": (summary_sales_section, (requested_range,)),
+        "leads": (summary_leads_section, (requested_range,)),
+        "weblogs": (summary_weblogs_section, (requested_range, limit)),
+        "conversion": (summary_conversion_section, (requested_range,)),
+    }
+    summary = {}
+    for name in requested:
+        builder, args = builders[name]
+        key = ("kpi_summary", name, args)
+        summary.update(kpi_cache.get_or_compute(key, SUMMARY_SECTIONS[name], lambda: builder(*args)))
+    return summary
+
+# Helper function to buffer validated records, answering 429/503 when the buffer refuses them
+def buffer_records(table, records):
+    rows = [record.as_row() for record in records]
+    try:
+        buffered = ingest_buffer.submit(table, rows)
+    except BufferFull as e:
+        ingest_rejected.inc(len(rows), table=table, reason="unavailable" if e.unhealthy else "full")
+        raise HTTPException(
+            status_code=503 if e.unhealthy else 429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    ingest_accepted.inc(len(rows), table=table)
+    return {"table": table, "accepted": len(rows), "buffered_rows": buffered}
+
+@app.post("/ingest/sales", status_code=202, response_model=IngestAccepted, summary="Push a batch of sales")
+def ingest_sales(batch: SalesBatch):
+    """
+    Validate and buffer up to MAX_INGEST_RECORDS sales. They are committed
+    within a fraction of a second; 429 or 503 with Retry-After means back off.
+    """
+    return buffer_records("sales_metrics", batch.records)
+
+@app.post("/ingest/leads", status_code=202, response_model=IngestAccepted, summary="Push a batch of leads")
+def ingest_leads(batch: LeadsBatch):
+    """
+    Validate and buffer up to MAX_INGEST_RECORDS leads.
+    """
+    return buffer_records("leads", batch.records)
+
+@app.post("/ingest/weblogs", status_code=202, response_model=IngestAccepted, summary="Push a batch of web logs")
+def ingest_weblogs(batch: WeblogsBatch):
+    """
+    Validate and buffer up to MAX_INGEST_RECORDS web log records. Records
+    without a country are resolved through GeoIP when they are committed.
+    """
+    return buffer_records("weblogs", batch.records)
+
+@app.get("/stats/ingest", summary="Ingest buffer statistics")
+def ingest_stats():
+    """
+    Report buffered, accepted, rejected and flushed rows, group commit latency
+    and the dimension key cache of the write path.
+    """
+    return {**ingest_buffer.stats(), "dimensions": dimension_encoder.stats()}
+
+@app.get("/changes", summary="Writes committed after a cursor (long-poll)")
+async def list_changes(
+    since: Optional[int] = Query(None, description="Cursor returned by the previous call; omit to get the current cursor"),
+    wait: float = Query(0, ge=0, le=MAX_CHANGE_WAIT_SECONDS, description="Seconds to wait for a write when there is none yet"),
+):
+    """
+    Return the writes committed after `since`: the tables touched, the id
+    range of the new rows and the KPI totals they add. With `wait`, the
+    request is held open until a write lands or the time runs out, so idle
+    clients cost one parked request and no database work. `reset` is true
+    when `since` is no longer buffered and the client should reload.
+    """
+    if wait:
+        events, cursor, reset = await change_feed.wait(since, wait)
+    else:
+        events, cursor, reset = change_feed.since(since)
+    return {"cursor": cursor, "reset": reset, "events": events}
+
+@app.get("/changes/stream", summary="Server-sent events for every committed write")
+async def stream_changes(
+    request: Request,
+    since: Optional[int] = Query(None, description="Cursor to resume after; defaults to now"),
+):
+    """
+    Push every committed write as a server-sent event whose id is its cursor.
+    Reconnecting clients resume through the Last-Event-ID header (or `since`);
+    a `reset` event tells them the gap was too long to replay.
+    """
+    last_event_id = request.headers.get("last-event-id", "")
+    cursor = int(last_event_id) if last_event_id.isdigit() else since
+    if cursor is None:
+        cursor = change_feed.cursor
+
+    async def generate_events():
+        nonlocal cursor
+        while not await request.is_disconnected():
+            events, latest, reset = await change_feed.wait(cursor, SSE_KEEPALIVE_SECONDS)
+            if reset:
+                yield f"id: {latest}\nevent: reset\ndata: {json.dumps({'cursor': latest})}\n\n"
+            for event in events:
+                yield f"id: {event['cursor']}\nevent: change\ndata: {json.dumps(event)}\n\n"
+            if not events and not reset:
+                yield ": keep-alive\n\n"
+            cursor = latest
+
+    return StreamingResponse(
+        generate_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/stats/changes", summary="Change feed statistics")
+def change_feed_stats():
+    """
+    Report the current cursor, buffered events and parked waiters.
+    """
+    return change_feed.stats()
+
+@app.get("/stats/geoip", summary="GeoIP lookup statistics")
+def geoip_stats():
+    """
+    Report GeoIP cache hits and misses and the per-batch lookup latency of
+    the ingest path.
+    """
+    return geoip.stats()
+
+@app.get("/stats/range-sums", summary="Range-sum tree statistics")
+def range_sums_stats():
+    """
+    Report the groups folded into the range-sum trees, their series per
+    table and the memory they hold.
+    """
+    return range_sums.stats()
+
+@app.get("/stats/heavy-hitters", summary="Heavy-hitters tracker statistics")
+def heavy_hitters_stats():
+    """
+    Report the rows folded into the top-K tracker, its counters and day
+    windows, and when it was last checkpointed.
+    """
+    return heavy_hitters.stats()
+
+@app.get("/stats/cache", summary="KPI result cache statistics")
+def kpi_cache_stats():
+    """
+    Report cache hits, misses, evictions and per-table data versions.
+    """
+    return kpi_cache.stats()
+
+@app.get("/stats/writer", summary="Writer thread statistics")
+def writer_stats():
+    """
+    Report queued, completed and failed write jobs, busy retries, and how
+    long jobs waited in the queue and took to commit.
+    """
+    return db_writer.stats()
+
+@app.get("/stats/pool", summary="Connection pool statistics")
+def connection_pool_stats():
+    """
+    Report pool checkouts, wait times and open connections for monitoring.
+    """
+    return pool.stats()
+
+@app.get("/metrics", summary="Prometheus metrics", include_in_schema=False)
+def prometheus_metrics():
+    """
+    Export request, SQL, pool, cache and ingest metrics in the Prometheus
+    text format.
+    """
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 # Health Check Endpoint
 @app.get("/health")
 def health_check():
@@ -0,0 +1,316 @@
+import argparse
+import calendar
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from dimensions import ENCODED_TABLES, DimensionEncoder, fact_table, stored_columns
+from latency_histograms import rebuild_histograms
+from migrations import apply_migrations, create_secondary_indexes, drop_secondary_indexes
+from rollups import rebuild_rollups
+from visitor_sketches import rebuild_sketches
+from storage import LEAD_COLUMNS, SALES_COLUMNS, WEBLOG_COLUMNS
+
+# Rows generated and inserted per chunk
+DEFAULT_CHUNK_SIZE = 250000
+
+# Default time window the synthetic rows are spread over
+DEFAULT_START = "2025-01-01"
+DEFAULT_DAYS = 90
+
+# Relative traffic per hour of the day (UTC), peaking mid-afternoon, and per
+# weekday (Monday first)
+HOURLY_PROFILE = 1 + 0.8 * np.cos(2 * np.pi * (np.arange(24) - 14) / 24)
+WEEKDAY_PROFILE = np.array([1.0, 1.05, 1.05, 1.0, 0.95, 0.6, 0.55])
+
+# Categorical values, most popular first (see zipf_weights)
+PRODUCTS = ["AI Assistant", "Rapid Prototyping", "Demo Session", "Event Participant Package", "Enterprise AI Package"]
+PRODUCT_PRICE = np.array([300.0, 550.0, 150.0, 250.0, 900.0])   # median revenue per sale
+PRODUCT_MARGIN = np.array([0.45, 0.35, 0.6, 0.3, 0.25])         # mean profit / revenue
+SALESPEOPLE = ["Alice", "Bob", "Charlie", "Diana"]
+SALES_COUNTRIES = ["USA", "UK", "Germany", "Canada", "France"]
+ENDPOINTS = ["/home", "/products", "/demo", "/services", "/about"]
+LEAD_SOURCES = ["Website", "Social Media", "Email Campaign", "Referral"]
+LEAD_STATUSES = ["New", "Contacted", "Closed"]
+LEAD_STATUS_WEIGHTS = [0.5, 0.3, 0.2]
+METHODS = ["GET", "POST", "PUT", "DELETE"]
+METHOD_WEIGHTS = [0.8, 0.15, 0.03, 0.02]
+STATUS_CODES = [200, 201, 400, 404, 500]
+STATUS_CODE_WEIGHTS = [0.85, 0.03, 0.02, 0.07, 0.03]
+USER_AGENTS = ["Mozilla/5.0", "curl/7.64.1", "PostmanRuntime/7.28.4"]
+USER_AGENT_WEIGHTS = [0.9, 0.06, 0.04]
+
+# Visitor countries used when no GeoLite2 database is available
+FALLBACK_COUNTRIES = ["United States", "Germany", "United Kingdom", "France", "Canada", "India", "Brazil", "Japan"]
+
+# PRAGMAs for a bulk load into a fresh file: no rollback journal or fsyncs,
+# a large page cache and exclusive locking. WAL is restored afterwards.
+LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA locking_mode = EXCLUSIVE",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",
+]
+
+
+def zipf_weights(count, exponent=1.1, offset=1.0):
+    """
+    Return Zipf-like probabilities for `count` ranked values: p(k) ~ 1/(k+offset)^exponent.
+    """
+    weights = 1.0 / (np.arange(count) + offset) ** exponent
+    return weights / weights.sum()
+
+
+# Helper function to draw category codes from a cumulative distribution
+def draw(rng, cumulative, size):
+    return np.searchsorted(cumulative, rng.random(size) * cumulative[-1], side="right")
+
+
+class TimestampSampler:
+    """
+    Draws timestamps over [start, start + days) following the hourly and
+    weekday profiles. Row counts per hour are fixed up front, so chunks come
+    out in time order and consecutive ids have ascending timestamps, like
+    rows appended by the live API.
+    """
+
+    def __init__(self, rng, rows, start, days):
+        first = datetime.strptime(start, "%Y-%m-%d")
+        hours = [first + timedelta(hours=offset) for offset in range(days * 24)]
+        weights = np.array([HOURLY_PROFILE[hour.hour] * WEEKDAY_PROFILE[hour.weekday()] for hour in hours])
+        self.rng = rng
+        self.hour_counts = rng.multinomial(rows, weights / weights.sum())
+        self.cumulative_counts = np.cumsum(self.hour_counts)
+        self.hour_starts = np.array([calendar.timegm(hour.timetuple()) for hour in hours], dtype=np.int64)
+
+    def chunk(self, first_row, size):
+        """
+        Return the timestamps of rows [first_row, first_row + size) as epoch seconds.
+        Each hour's rows get stratified seconds (one jittered slot per row),
+        so timestamps never decrease, even across chunk boundaries.
+        """
+        rows = np.arange(first_row, first_row + size)
+        hours = np.searchsorted(self.cumulative_counts, rows, side="right")
+        hour_first = self.cumulative_counts[hours] - self.hour_counts[hours]
+        slots = (rows - hour_first + self.rng.random(size)) / self.hour_counts[hours]
+        seconds = (slots * 3600).astype(np.int64)
+        return (self.hour_starts[hours] + seconds).tolist()
+
+
+class DatasetGenerator:
+    """
+    Vectorized generator of sales, lead and weblog rows, one column chunk at
+    a time. Every column is drawn with NumPy from a seeded generator, so the
+    same seed and chunk size always produce the same database.
+    """
+
+    def __init__(self, rows, seed=42, start=DEFAULT_START, days=DEFAULT_DAYS, mmdb_path=None):
+        self.rows = rows
+        self.rng = np.random.default_rng(seed)
+        self.start = start
+        self.days = days
+        self.products = np.array(PRODUCTS, dtype=object)
+        self.product_cumulative = np.cumsum(zipf_weights(len(PRODUCTS)))
+        self.salesperson_cumulative = np.cumsum(zipf_weights(len(SALESPEOPLE), 0.6))
+        self.country_cumulative = np.cumsum(zipf_weights(len(SALES_COUNTRIES), 1.3))
+        self.endpoint_cumulative = np.cumsum(zipf_weights(len(ENDPOINTS), 1.2))
+        self._visitors = None
+        self.mmdb_path = mmdb_path
+
+    def timestamps(self):
+        """
+        Return a TimestampSampler for one table (each table has its own hourly counts).
+        """
+        return TimestampSampler(self.rng, self.rows, self.start, self.days)
+
+    def visitors(self):
+        """
+        Return (ips, countries, cumulative weights) for the visitor population:
+        about one visitor per 20 rows, with Zipf-skewed visit counts. Addresses
+        are sampled from the GeoIP range index when a database is given.
+        """
+        if self._visitors is None:
+            count = int(min(max(self.rows // 20, 1000), 2000000))
+            if self.mmdb_path:
+                from geoip_ranges import RangeIndex
+
+                index = RangeIndex.open(self.mmdb_path)
+                names = dict(zip(index.codes.tolist(), index.names.tolist()))
+                sample = index.sample(count, rng=self.rng)
+                ips = np.array([ip for ip, _ in sample], dtype=object)
+                countries = np.array([names[code] for _, code in sample], dtype=object)
+            else:
+                values = self.rng.integers(0x01000000, 0xDF000000, count)  # 1.0.0.0 - 222.255.255.255
+                ips = np.array([f"{v >> 24}.{(v >> 16) & 255}.{(v >> 8) & 255}.{v & 255}" for v in values.tolist()], dtype=object)
+                weights = zipf_weights(len(FALLBACK_COUNTRIES), 1.5)
+                countries = np.array(FALLBACK_COUNTRIES, dtype=object)[self.rng.choice(len(FALLBACK_COUNTRIES), count, p=weights)]
+            self._visitors = (ips, countries, np.cumsum(zipf_weights(count, 1.0, 10.0)))
+        return self._visitors
+
+    def sales_chunk(self, sampler, first_row, size):
+        """
+        Return sales rows in SALES_COLUMNS order. Revenue is log-normal around
+        each product's price and profit follows it through a per-product margin.
+        """
+        rng = self.rng
+        products = draw(rng, self.product_cumulative, size)
+        revenue = np.clip(np.rint(PRODUCT_PRICE[products] * rng.lognormal(0.0, 0.35, size)), 50, 5000)
+        margin = np.clip(rng.normal(PRODUCT_MARGIN[products], 0.08), 0.02, 0.9)
+        profit = np.rint(revenue * margin)
+        return zip(
+            sampler.chunk(first_row, size),
+            self.products[products].tolist(),
+            np.array(SALESPEOPLE, dtype=object)[draw(rng, self.salesperson_cumulative, size)].tolist(),
+            revenue.astype(np.int64).tolist(),
+            profit.astype(np.int64).tolist(),
+            np.array(SALES_COUNTRIES, dtype=object)[draw(rng, self.country_cumulative, size)].tolist(),
+            np.array(ENDPOINTS, dtype=object)[draw(rng, self.endpoint_cumulative, size)].tolist(),
+        )
+
+    def leads_chunk(self, sampler, first_row, size):
+        """
+        Return lead rows in LEAD_COLUMNS order.
+        """
+        rng = self.rng
+        return zip(
+            sampler.chunk(first_row, size),
+            np.array(LEAD_SOURCES, dtype=object)[rng.choice(len(LEAD_SOURCES), size, p=zipf_weights(len(LEAD_SOURCES), 0.8))].tolist(),
+            np.array(LEAD_STATUSES, dtype=object)[rng.choice(len(LEAD_STATUSES), size, p=LEAD_STATUS_WEIGHTS)].tolist(),
+        )
+
+    def weblogs_chunk(self, sampler, first_row, size):
+        """
+        Return weblog rows in WEBLOG_COLUMNS order. Response times are
+        log-normal, with server errors an order of magnitude slower.
+        """
+        rng = self.rng
+        ips, countries, visitor_cumulative = self.visitors()
+        visitors = draw(rng, visitor_cumulative, size)
+        status_codes = np.array(STATUS_CODES)[rng.choice(len(STATUS_CODES), size, p=STATUS_CODE_WEIGHTS)]
+        response_times = rng.lognormal(np.log(180.0), 0.6, size) * np.where(status_codes >= 500, 10.0, 1.0)
+        return zip(
+            sampler.chunk(first_row, size),
+            ips[visitors].tolist(),
+            countries[visitors].tolist(),
+            np.array(ENDPOINTS, dtype=object)[draw(rng, self.endpoint_cumulative, size)].tolist(),
+            np.array(METHODS, dtype=object)[rng.choice(len(METHODS), size, p=METHOD_WEIGHTS)].tolist(),
+            status_codes.tolist(),
+            np.minimum(np.rint(response_times), 60000).astype(np.int64).tolist(),
+            np.array(USER_AGENTS, dtype=object)[rng.choice(len(USER_AGENTS), size, p=USER_AGENT_WEIGHTS)].tolist(),
+        )
+
+
+def generate_database(db_file, rows, seed=42, chunk_size=DEFAULT_CHUNK_SIZE, defer_indexes=True,
+                      start=DEFAULT_START, days=DEFAULT_DAYS, mmdb_path=None, tables=None, overwrite=False):
+    """
+    Create `db_file` and fill each of `tables` (default: all three) with
+    `rows` synthetic rows, generated and inserted `chunk_size` rows at a time
+    with executemany, one transaction per chunk, under the bulk-load PRAGMAs.
+
+    With `defer_indexes`, the secondary indexes are dropped for the load and
+    built once afterwards; otherwise they are maintained row by row. The
+    rollups are rebuilt at the end either way.
+    Returns per-table generation/insert timings and rows per second.
+    """
+    if os.path.exists(db_file):
+        if not overwrite:
+            raise FileExistsError(f"{db_file} already exists")
+        os.remove(db_file)
+    tables = tables or ["sales_metrics", "leads", "weblogs"]
+    apply_migrations(db_file)
+
+    generator = DatasetGenerator(rows, seed, start, days, mmdb_path)
+    batches = {
+        "sales_metrics": (SALES_COLUMNS, generator.sales_chunk),
+        "leads": (LEAD_COLUMNS, generator.leads_chunk),
+        "weblogs": (WEBLOG_COLUMNS, generator.weblogs_chunk),
+    }
+    report = {"rows": rows, "seed": seed, "chunk_size": chunk_size, "defer_indexes": defer_indexes, "tables": {}}
+    started = time.perf_counter()
+    encoder = DimensionEncoder()
+
+    conn = sqlite3.connect(db_file, isolation_level=None)
+    try:
+        for pragma in LOAD_PRAGMAS:
+            conn.execute(pragma)
+        if defer_indexes:
+            drop_secondary_indexes(conn, tables)
+        for table in tables:
+            columns, make_chunk = batches[table]
+            sql = (f"INSERT INTO {fact_table(table)} ({', '.join(stored_columns(table, columns))})"
+                   f" VALUES ({', '.join('?' for _ in columns)})")
+            sampler = generator.timestamps()
+            generate_seconds = insert_seconds = 0.0
+            for first_row in range(0, rows, chunk_size):
+                size = min(chunk_size, rows - first_row)
+                tick = time.perf_counter()
+                # Columns are built here; executemany consumes the row tuples lazily
+                chunk = make_chunk(sampler, first_row, size)
+                tock = time.perf_counter()
+                conn.execute("BEGIN")
+                encoder.confirm(conn)
+                if table in ENCODED_TABLES:
+                    chunk = encoder.encode_rows(conn, table, columns, chunk)
+                conn.executemany(sql, chunk)
+                conn.execute("COMMIT")
+                generate_seconds += tock - tick
+                insert_seconds += time.perf_counter() - tock
+            report["tables"][table] = {
+                "generate_seconds": round(generate_seconds, 3),
+                "insert_seconds": round(insert_seconds, 3),
+                "generate_rows_per_second": round(rows / generate_seconds) if generate_seconds else 0,
+                "insert_rows_per_second": round(rows / insert_seconds) if insert_seconds else 0,
+            }
+            print(f"{table}: {rows} rows, generated at {report['tables'][table]['generate_rows_per_second']} rows/s, "
+                  f"inserted at {report['tables'][table]['insert_rows_per_second']} rows/s")
+    finally:
+        conn.close()
+
+    # Indexes and rollups are built once over the loaded data
+    tick = time.perf_counter()
+    conn = sqlite3.connect(db_file)
+    with conn:
+        if defer_indexes:
+            create_secondary_indexes(conn, tables)
+        rebuild_rollups(conn)
+        if "weblogs" in tables:
+            rebuild_sketches(conn)
+            rebuild_histograms(conn)
+    conn.close()
+    report["index_seconds"] = round(time.perf_counter() - tick, 3)
+
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("ANALYZE")
+    conn.close()
+
+    total = rows * len(tables)
+    report["total_seconds"] = round(time.perf_counter() - started, 3)
+    report["rows_per_second"] = round(total / report["total_seconds"]) if report["total_seconds"] else 0
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a large synthetic logs database for load testing")
+    parser.add_argument("--db", required=True, help="Path of the SQLite database to create")
+    parser.add_argument("--rows", type=int, default=1000000, help="Rows per table")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed; the same seed and chunk size give the same data")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows generated and inserted per chunk")
+    parser.add_argument("--start", default=DEFAULT_START, help="First day of the generated window (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="Length of the generated window in days")
+    parser.add_argument("--mmdb", default=None, help="GeoLite2 Country database to sample visitor IPs from")
+    parser.add_argument("--table", action="append", choices=["sales_metrics", "leads", "weblogs"], help="Only fill this table")
+    parser.add_argument("--index-during-load", action="store_true", help="Create indexes before loading instead of after")
+    parser.add_argument("--overwrite", action="store_true", help="Replace the database if it exists")
+    args = parser.parse_args()
+
+    result = generate_database(
+        args.db, args.rows, args.seed, args.chunk_size, not args.index_during_load,
+        args.start, args.days, args.mmdb, args.table, args.overwrite,
+    )
+    print(f"Loaded {args.rows * len(result['tables'])} rows in {result['total_seconds']}s "
+          f"({result['rows_per_second']} rows/s overall, indexes and rollups {result['index_seconds']}s).")
@@ -0,0 +1,179 @@
+import argparse
+import ipaddress
+import os
+
+import maxminddb
+import numpy as np
+
+from geoip_service import GEOIP_DB_PATH
+
+
+def default_index_path(mmdb_path):
+    """
+    Return the range index path kept next to `mmdb_path`.
+    """
+    return f"{os.path.splitext(mmdb_path)[0]}.ranges.npz"
+
+
+# Where the range index built from GEOIP_DB_PATH is persisted
+RANGE_INDEX_PATH = default_index_path(GEOIP_DB_PATH)
+
+
+class RangeIndex:
+    """
+    Sorted, non-overlapping IPv4 ranges (start, end, country) built in one
+    walk over a GeoLite2 Country database.
+
+    Ranges are held as parallel numpy arrays (uint32 bounds plus a uint16
+    index into the country tables), with adjacent ranges of the same country
+    merged, so every IPv4 allocation fits in a few MiB and reloads from
+    disk without touching the MMDB. Lookups are a binary search; sampling
+    draws addresses in proportion to how much address space each range
+    covers.
+    """
+
+    def __init__(self, starts, ends, country_ids, codes, names):
+        self.starts = starts
+        self.ends = ends
+        self.country_ids = country_ids
+        self.codes = codes
+        self.names = names
+        self._sizes = None
+
+    @classmethod
+    def from_mmdb(cls, mmdb_path=GEOIP_DB_PATH):
+        """
+        Walk every network in the database with maxminddb's iterator and keep
+        the public IPv4 ones that carry a country.
+        """
+        countries = {}
+        ranges = []
+        with maxminddb.open_database(mmdb_path) as reader:
+            for network, record in reader:
+                if network.version != 4 or not network.is_global:
+                    continue
+                country = (record or {}).get("country") or {}
+                code = country.get("iso_code")
+                if not code:
+                    continue
+                if code not in countries:
+                    countries[code] = (len(countries), country.get("names", {}).get("en", code))
+                ranges.append((int(network.network_address), int(network.broadcast_address), countries[code][0]))
+
+        ranges.sort()
+        merged = []
+        for start, end, country_id in ranges:
+            if merged and start <= merged[-1][1] + 1 and country_id == merged[-1][2]:
+                merged[-1][1] = max(merged[-1][1], end)
+            elif merged and start <= merged[-1][1]:
+                continue  # overlaps an earlier network; the first one wins
+            else:
+                merged.append([start, end, country_id])
+
+        ordered = sorted(countries.items(), key=lambda item: item[1][0])
+        return cls(
+            np.array([row[0] for row in merged], dtype=np.uint32),
+            np.array([row[1] for row in merged], dtype=np.uint32),
+            np.array([row[2] for row in merged], dtype=np.uint16),
+            np.array([code for code, _ in ordered]),
+            np.array([name for _, (_, name) in ordered]),
+        )
+
+    @classmethod
+    def load(cls, path=RANGE_INDEX_PATH):
+        with np.load(path) as data:
+            return cls(data["starts"], data["ends"], data["country_ids"], data["codes"], data["names"])
+
+    @classmethod
+    def open(cls, mmdb_path=GEOIP_DB_PATH, path=None):
+        """
+        Load the persisted index (by default next to the MMDB), rebuilding and
+        saving it first when it is missing or older than the MMDB.
+        """
+        path = path or default_index_path(mmdb_path)
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(mmdb_path):
+            return cls.load(path)
+        index = cls.from_mmdb(mmdb_path)
+        index.save(path)
+        return index
+
+    def save(self, path=RANGE_INDEX_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # np.savez appends .npz to names without it, so write through a handle
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                starts=self.starts,
+                ends=self.ends,
+                country_ids=self.country_ids,
+                codes=self.codes,
+                names=self.names,
+            )
+        os.replace(temp_path, path)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, ip_address):
+        """
+        Return (iso_code, country name) for an IPv4 address, or None when no
+        range covers it.
+        """
+        try:
+            value = int(ipaddress.IPv4Address(ip_address))
+        except ValueError:
+            return None
+        position = int(np.searchsorted(self.starts, value, side="right")) - 1
+        if position < 0 or value > int(self.ends[position]):
+            return None
+        country_id = self.country_ids[position]
+        return str(self.codes[country_id]), str(self.names[country_id])
+
+    def sample(self, count, country=None, rng=None):
+        """
+        Draw `count` public IPv4 addresses, weighted by address space so large
+        allocations come up more often, optionally restricted to one ISO
+        country code. Returns a list of (ip, iso_code) pairs.
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        if self._sizes is None:
+            self._sizes = self.ends.astype(np.int64) - self.starts.astype(np.int64) + 1
+        positions = np.arange(len(self.starts))
+        if country is not None:
+            matches = np.flatnonzero(self.codes == country)
+            if not len(matches):
+                raise ValueError(f"No ranges for country: {country}")
+            positions = np.flatnonzero(self.country_ids == matches[0])
+        sizes = self._sizes[positions]
+        cumulative = np.cumsum(sizes)
+        picks = np.searchsorted(cumulative, rng.integers(0, cumulative[-1], size=count), side="right")
+        chosen = positions[picks]
+        offsets = (rng.random(count) * sizes[picks]).astype(np.int64)
+        values = self.starts[chosen].astype(np.int64) + offsets
+        return [
+            (str(ipaddress.IPv4Address(int(value))), str(self.codes[country_id]))
+            for value, country_id in zip(values, self.country_ids[chosen])
+        ]
+
+    def stats(self):
+        return {
+            "ranges": len(self.starts),
+            "countries": len(self.codes),
+            "addresses": int((self.ends.astype(np.int64) - self.starts.astype(np.int64) + 1).sum()),
+            "bytes": int(self.starts.nbytes + self.ends.nbytes + self.country_ids.nbytes),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the GeoIP range index from the GeoLite2 database")
+    parser.add_argument("--mmdb", default=GEOIP_DB_PATH, help="Path to the GeoLite2 Country database")
+    parser.add_argument("--out", default=None, help="Where to save the range index (default: next to the MMDB)")
+    args = parser.parse_args()
+
+    index = RangeIndex.from_mmdb(args.mmdb)
+    out = args.out or default_index_path(args.mmdb)
+    index.save(out)
+    print(f"Saved {index.stats()} to {out}.")
@@ -0,0 +1,123 @@
+import threading
+import time
+from functools import lru_cache
+
+import geoip2.database
+import geoip2.errors
+
+# Path to the GeoLite2 database
+GEOIP_DB_PATH = "data/GeoLite2-Country.mmdb"
+
+# Country stored for addresses the database has no entry for
+UNKNOWN_COUNTRY = "Unknown Country"
+
+DEFAULT_CACHE_SIZE = 100000
+
+
+class GeoIPService:
+    """
+    IP-to-country lookups through one long-lived, memory-mapped GeoLite2
+    reader shared by every caller in the process, with a bounded LRU cache
+    in front of it and latency figures for each resolved batch.
+
+    When the database file is missing the service reports itself unavailable
+    and resolves every address to None, so writes carry on with a NULL
+    country instead of failing.
+    """
+
+    def __init__(self, db_path=GEOIP_DB_PATH, cache_size=DEFAULT_CACHE_SIZE):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._reader = None
+        self._open_error = None
+        self._lookup = lru_cache(maxsize=cache_size)(self._resolve)
+        self.batches = 0
+        self.batch_addresses = 0
+        self.batch_seconds = 0.0
+        self.last_batch_ms = 0.0
+        self.max_batch_ms = 0.0
+
+    def open(self):
+        """
+        Open the reader if it is not open yet. Raises when the database cannot
+        be read; use `available` for a non-raising check.
+        """
+        with self._lock:
+            if self._reader is None:
+                try:
+                    self._reader = geoip2.database.Reader(self.db_path, mode=geoip2.database.MODE_MMAP)
+                    self._open_error = None
+                except Exception as e:
+                    self._open_error = e
+                    raise
+            return self._reader
+
+    @property
+    def available(self):
+        if self._reader is None and self._open_error is None:
+            try:
+                self.open()
+            except Exception as e:
+                print(f"GeoIP lookups disabled: {e}")
+        return self._reader is not None
+
+    def _resolve(self, ip_address):
+        try:
+            return self._reader.country(ip_address).country.name or UNKNOWN_COUNTRY
+        except (geoip2.errors.AddressNotFoundError, ValueError):
+            return UNKNOWN_COUNTRY
+
+    def country(self, ip_address):
+        """
+        Return the country name for `ip_address`, UNKNOWN_COUNTRY when the
+        database has no entry (or the address is malformed), or None when the
+        database is unavailable.
+        """
+        if not self.available:
+            return None
+        return self._lookup(ip_address)
+
+    def countries(self, ip_addresses):
+        """
+        Resolve a batch of addresses, in order, and record how long it took.
+        """
+        started = time.perf_counter()
+        result = [self.country(ip_address) for ip_address in ip_addresses]
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.batches += 1
+            self.batch_addresses += len(result)
+            self.batch_seconds += elapsed
+            self.last_batch_ms = elapsed * 1000
+            self.max_batch_ms = max(self.max_batch_ms, self.last_batch_ms)
+        return result
+
+    def close(self):
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+            self._lookup.cache_clear()
+
+    def stats(self):
+        """
+        Report cache effectiveness and per-batch lookup latency.
+        """
+        info = self._lookup.cache_info()
+        lookups = info.hits + info.misses
+        with self._lock:
+            return {
+                "available": self._reader is not None,
+                "database": self.db_path,
+                "cache_entries": info.currsize,
+                "cache_size": info.maxsize,
+                "cache_hits": info.hits,
+                "cache_misses": info.misses,
+                "cache_hit_ratio": round(info.hits / lookups, 4) if lookups else 0.0,
+                "batches": self.batches,
+                "batch_addresses": self.batch_addresses,
+                "last_batch_ms": round(self.last_batch_ms, 3),
+                "avg_batch_ms": round(self.batch_seconds * 1000 / self.batches, 3) if self.batches else 0.0,
+                "max_batch_ms": round(self.max_batch_ms, 3),
+            }
@@ -0,0 +1,400 @@
+import argparse
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from date_range import DateRange, epoch_seconds, epoch_text, timestamp_clause
+
+# Path to the SQLite database and to the tracker's checkpoint
+DB_FILE = "logs.db"
+CHECKPOINT_PATH = "heavy_hitters.checkpoint.json"
+
+# weblogs columns tracked, each with its own summaries
+TRACKED_COLUMNS = ("endpoint", "ip", "user_agent")
+
+# Counters kept per summary: the all-time summaries answer unbounded
+# requests, the per-day windows (the last RETENTION_DAYS days seen) answer
+# whole-day ranges. Values counted more than 1/capacity of the rows are
+# never evicted, and the top values a request asks for (at most MAX_K) are
+# exact while the column has fewer distinct values than the capacity.
+TOTAL_CAPACITY = 1024
+WINDOW_CAPACITY = 256
+RETENTION_DAYS = 31
+MAX_K = 100
+
+# Raw rows read per batch when the tracker catches up with the table
+READ_CHUNK = 50000
+
+# Seconds between checkpoints written from the write path
+CHECKPOINT_SECONDS = 60
+
+DAY_SECONDS = 86400
+
+# Columns read per weblogs row: the id, the timestamp, then the tracked columns
+ROW_COLUMNS = f"id, timestamp, {', '.join(TRACKED_COLUMNS)}"
+
+
+# Helper function to fingerprint the last weblogs row folded in, so a
+# checkpoint is only restored against the database it was taken from
+def _row_digest(row):
+    if row is None:
+        return None
+    return hashlib.sha1(json.dumps(list(row)).encode()).hexdigest()
+
+
+class SpaceSaving:
+    """
+    Space-Saving summary (Metwally et al.) of the most frequent values of a
+    stream in `capacity` counters.
+
+    A value that is not counted yet takes over the counter with the
+    smallest count when all are in use, inheriting that count as its
+    error. Each counter's count is an upper bound on its value's true
+    count, and count - error a lower bound. Weighted updates keep the same
+    guarantees, so batches are pre-aggregated before they are applied.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}  # value -> [count, error]
+        self._heap = []  # (count, sequence, value); stale entries are skipped
+        self._sequence = itertools.count()
+        self._ranked = None
+
+    def __len__(self):
+        return len(self.counts)
+
+    def _push(self, value, count):
+        heapq.heappush(self._heap, (count, next(self._sequence), value))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(entry[0], next(self._sequence), key) for key, entry in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    # Helper method to drop stale heap entries and return the smallest counter
+    def _minimum(self):
+        while self._heap:
+            count, _, value = self._heap[0]
+            entry = self.counts.get(value)
+            if entry is not None and entry[0] == count:
+                return value, count
+            heapq.heappop(self._heap)
+        return None, 0
+
+    @property
+    def min_count(self):
+        """
+        The count a value not in the summary may at most have.
+        """
+        return self._minimum()[1] if len(self.counts) >= self.capacity else 0
+
+    def update(self, value, weight=1):
+        entry = self.counts.get(value)
+        if entry is not None:
+            entry[0] += weight
+        elif len(self.counts) < self.capacity:
+            entry = self.counts[value] = [weight, 0]
+        else:
+            evicted, floor = self._minimum()
+            del self.counts[evicted]
+            entry = self.counts[value] = [floor + weight, floor]
+        self._push(value, entry[0])
+        self._ranked = None
+
+    def ranked(self):
+        """
+        Return [(value, count, error)] by descending count, sorted once per
+        batch of updates so reading the top K afterwards is O(K).
+        """
+        if self._ranked is None:
+            self._ranked = sorted(
+                ((value, entry[0], entry[1]) for value, entry in self.counts.items()),
+                key=lambda item: (-item[1], str(item[0])),
+            )
+        return self._ranked
+
+    def to_list(self):
+        return [[value, entry[0], entry[1]] for value, entry in self.counts.items()]
+
+    @classmethod
+    def from_list(cls, capacity, items):
+        summary = cls(capacity)
+        for value, count, error in items:
+            summary.counts[value] = [count, error]
+            summary._push(value, count)
+        return summary
+
+    @classmethod
+    def merge(cls, summaries, capacity):
+        """
+        Combine summaries of disjoint streams. A value missing from a full
+        summary may have been counted up to its min_count there, which is
+        added to both its count and its error.
+        """
+        total_floor = 0
+        merged = {}  # value -> [count, error, floors of the summaries holding it]
+        for summary in summaries:
+            floor = summary.min_count
+            total_floor += floor
+            for value, (count, error) in summary.counts.items():
+                entry = merged.get(value)
+                if entry is None:
+                    merged[value] = [count, error, floor]
+                else:
+                    entry[0] += count
+                    entry[1] += error
+                    entry[2] += floor
+        items = [[value, count + total_floor - floors, error + total_floor - floors]
+                 for value, (count, error, floors) in merged.items()]
+        items.sort(key=lambda item: (-item[1], str(item[0])))
+        return cls.from_list(capacity, items[:capacity])
+
+
+class HeavyHitters:
+    """
+    Top-K tracker for the weblogs columns in TRACKED_COLUMNS: an all-time
+    SpaceSaving summary per column plus one per column and UTC day for the
+    last RETENTION_DAYS days seen.
+
+    refresh() folds in the rows with ids above the last one it saw, so it
+    can run after every committed write and after a restart, where it
+    resumes from the checkpoint instead of rereading the table.
+    """
+
+    def __init__(self, total_capacity=TOTAL_CAPACITY, window_capacity=WINDOW_CAPACITY, retention_days=RETENTION_DAYS):
+        self.total_capacity = total_capacity
+        self.window_capacity = window_capacity
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._reset()
+        self.rows = 0
+        self.refresh_seconds = 0.0
+        self.checkpointed_at = None
+
+    def _reset(self):
+        self.loaded = False  # True once refresh() has caught up with the table
+        self.last_id = 0
+        self.last_row = None  # _row_digest of the row at last_id
+        self.totals = {column: SpaceSaving(self.total_capacity) for column in TRACKED_COLUMNS}
+        self.windows = {}  # UTC day number -> {column: SpaceSaving}
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    # Helper method to drop the day windows that fell out of retention
+    def _expire(self):
+        if self.windows:
+            oldest = max(self.windows) - self.retention_days + 1
+            for day in [day for day in self.windows if day < oldest]:
+                del self.windows[day]
+
+    def _fold(self, rows):
+        # Callers must hold self._lock
+        oldest = max(self.windows) - self.retention_days + 1 if self.windows else None
+        totals = {column: Counter() for column in TRACKED_COLUMNS}
+        days = {}
+        for _, timestamp, *values in rows:
+            day = timestamp // DAY_SECONDS if timestamp is not None else None
+            windowed = day is not None and (oldest is None or day >= oldest)
+            if windowed:
+                counters = days.get(day)
+                if counters is None:
+                    counters = days[day] = {column: Counter() for column in TRACKED_COLUMNS}
+            for column, value in zip(TRACKED_COLUMNS, values):
+                totals[column][value] += 1
+                if windowed:
+                    counters[column][value] += 1
+        for column, counter in totals.items():
+            for value, weight in counter.items():
+                self.totals[column].update(value, weight)
+        for day, counters in days.items():
+            window = self.windows.get(day)
+            if window is None:
+                window = self.windows[day] = {column: SpaceSaving(self.window_capacity) for column in TRACKED_COLUMNS}
+            for column, counter in counters.items():
+                for value, weight in counter.items():
+                    window[column].update(value, weight)
+        self._expire()
+
+    def refresh(self, connection):
+        """
+        Fold weblogs rows added since the last refresh into the summaries.
+        Returns the number of rows read.
+        """
+        with self._lock:
+            started = time.perf_counter()
+            cursor = connection.execute(
+                f"SELECT {ROW_COLUMNS} FROM weblogs WHERE id > ? ORDER BY id",
+                (self.last_id,),
+            )
+            read = 0
+            while True:
+                rows = cursor.fetchmany(READ_CHUNK)
+                if not rows:
+                    break
+                self._fold(rows)
+                self.last_id = rows[-1][0]
+                self.last_row = _row_digest(rows[-1])
+                read += len(rows)
+            self.loaded = True
+            self.rows += read
+            self.refresh_seconds += time.perf_counter() - started
+            return read
+
+    # Helper method to pick the summary answering a range, or None
+    def _summary(self, column, requested):
+        if requested.start is None and requested.end is None:
+            return self.totals[column]
+        if requested.grain != "daily" or requested.start is None or not self.windows:
+            return None
+        first = epoch_seconds(requested.start) // DAY_SECONDS
+        last = epoch_seconds(requested.end) // DAY_SECONDS if requested.end is not None else max(self.windows) + 1
+        if first < max(self.windows) - self.retention_days + 1:
+            return None
+        summaries = [self.windows[day][column] for day in range(first, last) if day in self.windows]
+        if len(summaries) == 1:
+            return summaries[0]
+        return SpaceSaving.merge(summaries, self.window_capacity)
+
+    def top(self, column, k, requested=DateRange()):
+        """
+        Return the `k` most frequent values of `column` over a DateRange as
+        [(value, count, error)], or None when the range is neither unbounded
+        nor whole days within the retained windows. Counts are upper bounds,
+        off by at most their error.
+        """
+        with self._lock:
+            summary = self._summary(column, requested)
+            return None if summary is None else summary.ranked()[:k]
+
+    def checkpoint(self, path=CHECKPOINT_PATH):
+        """
+        Write the summaries and the last id folded in to `path` atomically.
+        """
+        with self._lock:
+            state = {
+                "last_id": self.last_id,
+                "last_row": self.last_row,
+                "total_capacity": self.total_capacity,
+                "window_capacity": self.window_capacity,
+                "totals": {column: summary.to_list() for column, summary in self.totals.items()},
+                "windows": {str(day): {column: summary.to_list() for column, summary in window.items()}
+                            for day, window in self.windows.items()},
+            }
+            self.checkpointed_at = time.time()
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(temp_path, path)
+
+    def restore(self, connection, path=CHECKPOINT_PATH):
+        """
+        Load a checkpoint written by checkpoint(). It is ignored (and False
+        returned) when missing, written with other capacities, or taken from
+        another database: the weblogs row at its last id, read through
+        `connection`, must be the one it folded in last.
+        """
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        if (state.get("total_capacity"), state.get("window_capacity")) != (self.total_capacity, self.window_capacity):
+            return False
+        row = connection.execute(f"SELECT {ROW_COLUMNS} FROM weblogs WHERE id = ?", (state["last_id"],)).fetchone()
+        if _row_digest(row) != state.get("last_row"):
+            return False
+        with self._lock:
+            self.last_id = state["last_id"]
+            self.last_row = state["last_row"]
+            self.totals = {column: SpaceSaving.from_list(self.total_capacity, state["totals"].get(column, []))
+                           for column in TRACKED_COLUMNS}
+            self.windows = {
+                int(day): {column: SpaceSaving.from_list(self.window_capacity, window.get(column, []))
+                           for column in TRACKED_COLUMNS}
+                for day, window in state["windows"].items()
+            }
+            self._expire()
+        return True
+
+    def stats(self):
+        with self._lock:
+            counters = sum(len(summary) for summary in self.totals.values())
+            counters += sum(len(summary) for window in self.windows.values() for summary in window.values())
+            return {
+                "loaded": self.loaded,
+                "last_id": self.last_id,
+                "rows": self.rows,
+                "refresh_seconds": round(self.refresh_seconds, 3),
+                "counters": counters,
+                "windows": len(self.windows),
+                "first_window": epoch_text(min(self.windows) * DAY_SECONDS)[:10] if self.windows else None,
+                "last_window": epoch_text(max(self.windows) * DAY_SECONDS)[:10] if self.windows else None,
+                "checkpointed_at": epoch_text(int(self.checkpointed_at)) if self.checkpointed_at else None,
+            }
+
+
+def exact_top_query(column, k, requested=DateRange()):
+    """
+    Return (query, params) counting `column` over the raw weblogs rows in a
+    DateRange, the `k` most frequent values first.
+    """
+    clause, params = timestamp_clause(requested)
+    query = f"SELECT {column}, COUNT(*) AS visits FROM weblogs WHERE 1=1{clause} GROUP BY {column} ORDER BY visits DESC LIMIT ?"
+    return query, params + [k]
+
+
+def verify(db_file, k, requested=DateRange()):
+    """
+    Build a tracker over the whole table and compare its top `k` values per
+    column with the exact counts: how many of the exact top values it
+    returns, and its largest count error.
+    """
+    connection = sqlite3.connect(db_file)
+    tracker = HeavyHitters()
+    try:
+        started = time.perf_counter()
+        rows = tracker.refresh(connection)
+        report = {"rows": rows, "build_seconds": round(time.perf_counter() - started, 3), "columns": {}}
+        for column in TRACKED_COLUMNS:
+            started = time.perf_counter()
+            estimated = tracker.top(column, k, requested)
+            top_ms = (time.perf_counter() - started) * 1000
+            if estimated is None:
+                report["columns"][column] = None
+                continue
+            query, params = exact_top_query(column, k, requested)
+            started = time.perf_counter()
+            exact = connection.execute(query, params).fetchall()
+            exact_ms = (time.perf_counter() - started) * 1000
+            true_counts = dict(connection.execute(
+                query.replace(" ORDER BY visits DESC LIMIT ?", ""), params[:-1]
+            ).fetchall())
+            # Values tied with the k-th exact count are all valid answers
+            threshold = exact[-1][1] if exact else 0
+            found = sum(1 for value, _, _ in estimated if true_counts.get(value, 0) >= threshold)
+            report["columns"][column] = {
+                "recall": round(found / len(exact), 4) if exact else 1.0,
+                "max_count_error": max((count - true_counts.get(value, 0) for value, count, _ in estimated), default=0),
+                "top_ms": round(top_ms, 3),
+                "exact_ms": round(exact_ms, 3),
+            }
+    finally:
+        connection.close()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the heavy-hitters tracker against exact top-K counts")
+    parser.add_argument("command", choices=["verify"])
+    parser.add_argument("--db", default=DB_FILE, help="Path to the SQLite database")
+    parser.add_argument("--k", type=int, default=10, help="Number of top values compared")
+    args = parser.parse_args()
+
+    print(json.dumps(verify(args.db, args.k), indent=2))
@@ -0,0 +1,215 @@
+import threading
+import time
+
+# Rows held in memory before pushes are refused
+DEFAULT_MAX_ROWS = 200000
+
+# A flush starts once this many rows are pending, or after FLUSH_INTERVAL_SECONDS
+DEFAULT_FLUSH_ROWS = 20000
+DEFAULT_FLUSH_INTERVAL_SECONDS = 0.25
+
+# Most rows written in one transaction; bigger backlogs take several flushes
+DEFAULT_MAX_BATCH_ROWS = 50000
+
+# Backoff between attempts while flushes fail
+RETRY_DELAY_SECONDS = 0.1
+MAX_RETRY_DELAY_SECONDS = 5.0
+
+TABLES = ("sales_metrics", "leads", "weblogs")
+
+
+class BufferFull(Exception):
+    """
+    The buffer cannot take the rows right now. `retry_after` is a hint in
+    seconds; `unhealthy` is True when flushes are failing rather than merely
+    behind, so the caller can answer 503 instead of 429.
+    """
+
+    def __init__(self, message, retry_after, unhealthy=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.unhealthy = unhealthy
+
+
+class WriteBehindBuffer:
+    """
+    In-memory write-behind buffer for pushed rows with group commit.
+
+    Requests append validated rows and return at once; a background thread
+    drains whatever has accumulated into one `flush(sales, leads, weblogs)`
+    call, so many small pushes share a single transaction. A flush starts
+    when `flush_rows` rows are pending or `flush_interval` seconds after the
+    oldest pending row arrived. Pushes that would take the buffer beyond
+    `max_rows` are refused with BufferFull, which bounds memory and tells
+    senders to back off.
+
+    Rows are acknowledged before they are durable: a crash loses whatever is
+    still buffered. A failed flush keeps its rows at the head of the queue
+    and is retried with backoff.
+    """
+
+    def __init__(self, flush, max_rows=DEFAULT_MAX_ROWS, flush_rows=DEFAULT_FLUSH_ROWS,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL_SECONDS, max_batch_rows=DEFAULT_MAX_BATCH_ROWS,
+                 on_flush=None):
+        self.flush = flush
+        self.max_rows = max_rows
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_batch_rows = max_batch_rows
+        self.on_flush = on_flush
+        self._condition = threading.Condition()
+        self._pending = {table: [] for table in TABLES}
+        self._pending_rows = 0
+        self._in_flight_rows = 0
+        self._oldest = None
+        self._failing_since = None
+        self._closing = False
+        self._thread = None
+
+        self.accepted_rows = 0
+        self.rejected_rows = 0
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.last_error = None
+
+    def start(self):
+        with self._condition:
+            if self._thread is None:
+                self._closing = False
+                self._thread = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+                self._thread.start()
+
+    def submit(self, table, rows):
+        """
+        Queue `rows` for `table` and return the number of rows now buffered.
+        Raises BufferFull when they do not fit.
+        """
+        with self._condition:
+            if self._closing or self._thread is None:
+                raise BufferFull("Ingest is not running", retry_after=1, unhealthy=True)
+            buffered = self._pending_rows + self._in_flight_rows
+            if buffered + len(rows) > self.max_rows:
+                self.rejected_rows += len(rows)
+                if self._failing_since is not None:
+                    raise BufferFull(f"Writes are failing: {self.last_error}", retry_after=5, unhealthy=True)
+                raise BufferFull(f"Ingest buffer is full ({buffered} rows buffered)", retry_after=1)
+            self._pending[table].extend(rows)
+            self._pending_rows += len(rows)
+            self.accepted_rows += len(rows)
+            # Wake the flusher when the buffer was empty (it is waiting with
+            # no deadline) or when a full batch is ready
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+                self._condition.notify()
+            elif self._pending_rows >= self.flush_rows:
+                self._condition.notify()
+            return self._pending_rows + self._in_flight_rows
+
+    def _take_batch(self):
+        # Callers must hold self._condition
+        batch = {}
+        room = self.max_batch_rows
+        for table in TABLES:
+            rows = self._pending[table]
+            if rows and room > 0:
+                batch[table] = rows[:room]
+                self._pending[table] = rows[room:]
+                room -= len(batch[table])
+        taken = self.max_batch_rows - room
+        self._pending_rows -= taken
+        self._in_flight_rows = taken
+        self._oldest = time.monotonic() if self._pending_rows else None
+        return batch, taken
+
+    def _requeue(self, batch):
+        # Callers must hold self._condition; failed rows go back to the front
+        for table, rows in batch.items():
+            self._pending[table] = rows + self._pending[table]
+        self._pending_rows += self._in_flight_rows
+        self._in_flight_rows = 0
+        self._oldest = self._oldest or time.monotonic()
+
+    def _run(self):
+        delay = RETRY_DELAY_SECONDS
+        while True:
+            with self._condition:
+                while not self._closing:
+                    if self._pending_rows >= self.flush_rows:
+                        break
+                    if self._oldest is not None:
+                        remaining = self._oldest + self.flush_interval - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                if self._closing and not self._pending_rows:
+                    return
+                batch, taken = self._take_batch()
+
+            started = time.perf_counter()
+            try:
+                self.flush(batch.get("sales_metrics", ()), batch.get("leads", ()), batch.get("weblogs", ()))
+            except Exception as e:
+                with self._condition:
+                    self._requeue(batch)
+                    self.failed_flushes += 1
+                    self.last_error = str(e)
+                    if self._failing_since is None:
+                        self._failing_since = time.monotonic()
+                    closing = self._closing
+                print(f"Error flushing {taken} buffered rows: {e}")
+                if closing:
+                    return  # give up on shutdown rather than hang
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY_SECONDS)
+                continue
+
+            elapsed = time.perf_counter() - started
+            delay = RETRY_DELAY_SECONDS
+            with self._condition:
+                self._in_flight_rows = 0
+                self._failing_since = None
+                self.flushes += 1
+                self.flushed_rows += taken
+                self.last_flush_ms = elapsed * 1000
+                self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+            if self.on_flush is not None:
+                self.on_flush(taken, elapsed)
+
+    def close(self, timeout=30):
+        """
+        Stop accepting rows, flush what is buffered and stop the thread.
+        """
+        with self._condition:
+            thread = self._thread
+            self._closing = True
+            self._condition.notify()
+        if thread is not None:
+            thread.join(timeout)
+        with self._condition:
+            self._thread = None
+
+    def stats(self):
+        with self._condition:
+            return {
+                "running": self._thread is not None and not self._closing,
+                "buffered_rows": self._pending_rows + self._in_flight_rows,
+                "pending_rows": {table: len(rows) for table, rows in self._pending.items()},
+                "max_rows": self.max_rows,
+                "flush_rows": self.flush_rows,
+                "flush_interval_seconds": self.flush_interval,
+                "accepted_rows": self.accepted_rows,
+                "rejected_rows": self.rejected_rows,
+                "flushed_rows": self.flushed_rows,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "avg_flush_rows": round(self.flushed_rows / self.flushes, 1) if self.flushes else 0.0,
+                "last_flush_ms": round(self.last_flush_ms, 3),
+                "max_flush_ms": round(self.max_flush_ms, 3),
+                "failing": self._failing_since is not None,
+                "last_error": self.last_error,
+            }
@@ -0,0 +1,160 @@
+import functools
+import json
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+class DataVersions:
+    """
+    Per-table data-version counters, bumped after every committed write.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+
+    def bump(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def get(self, tables):
+        """
+        Return the current versions of `tables` as a tuple.
+        """
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in tables)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._versions)
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class KPICache:
+    """
+    LRU cache of KPI results keyed by endpoint and normalized parameters.
+
+    Each entry remembers the data versions of the tables it was computed
+    from and is discarded as soon as one of them moves. Concurrent misses
+    for the same key share one computation, so identical requests between
+    two writes cost a single query. Memory is bounded by the approximate
+    serialized size of the cached results.
+    """
+
+    def __init__(self, versions, max_bytes=DEFAULT_MAX_BYTES):
+        self.versions = versions
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (versions, value, size)
+        self._in_flight = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get_or_compute(self, key, tables, compute):
+        """
+        Return the cached result for `key`, or call `compute()` once and cache it.
+        """
+        current = self.versions.get(tables)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == current:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(key)
+                self.invalidations += 1
+
+            flight_key = (key, current)
+            flight = self._in_flight.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[flight_key] = _InFlight()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[flight_key]
+            flight.done.set()
+
+        self._store(key, current, flight.value)
+        return flight.value
+
+    def _store(self, key, versions, value):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (versions, value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def cached(self, *tables):
+        """
+        Decorator caching an endpoint's result per normalized keyword arguments,
+        invalidated whenever one of `tables` is written.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                params = tuple(sorted((name, value) for name, value in kwargs.items() if value is not None))
+                key = (func.__name__, params)
+                return self.get_or_compute(key, tables, lambda: func(*args, **kwargs))
+            return wrapper
+        return decorator
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Return hit/miss/eviction counters and current memory use.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "data_versions": self.versions.snapshot(),
+            }
@@ -0,0 +1,263 @@
+import argparse
+import sqlite3
+from collections import Counter
+
+import numpy as np
+
+from date_range import DateRange, bucket_clause, epoch_seconds, epoch_text, timestamp_clause
+
+# Path to the SQLite database
+DB_FILE = "logs.db"
+
+# Log-linear bins: bin 0 holds response times under 1 ms, then every power
+# of two is split into SUB_BINS equal bins, so a bin is never wider than
+# 1/SUB_BINS (3.1%) of its values and a percentile read from a merged
+# histogram is off by at most that much
+SUB_BINS = 32
+RELATIVE_ERROR = 1 / SUB_BINS
+
+# Percentiles served by the latency KPI
+QUANTILES = {"p50": 0.50, "p90": 0.90, "p95": 0.95, "p99": 0.99}
+
+# Bucket length in seconds per grain, finest first. Buckets are written like
+# the rollups': UTC text in the API's timestamp format, the date for daily
+GRAINS = {"minutely": 60, "hourly": 3600, "daily": 86400}
+
+# Most time buckets one heatmap may return
+MAX_HEATMAP_BUCKETS = 2000
+
+# Raw rows read per batch when histograms are built from the weblogs table
+READ_CHUNK = 50000
+
+
+def histogram_table(grain):
+    """
+    Return the name of the latency histogram table of a grain.
+    """
+    return f"latency_histogram_{grain}"
+
+
+def create_histogram_tables(connection):
+    """
+    Create the per-minute, hourly and daily latency histogram tables: the
+    count of weblogs rows per bucket, endpoint ('' for NULL) and bin.
+    """
+    for grain in GRAINS:
+        connection.execute(f"""
+        CREATE TABLE IF NOT EXISTS {histogram_table(grain)} (
+            bucket TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            bin INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (bucket, endpoint, bin)
+        )
+        """)
+
+
+def bins_of(response_times):
+    """
+    Return the bin of each response time (a numpy array of milliseconds).
+    """
+    values = np.asarray(response_times, dtype=np.float64)
+    mantissa, exponent = np.frexp(np.maximum(values, 1.0))
+    # values = (2 * mantissa) * 2**(exponent - 1), with 2 * mantissa in [1, 2)
+    sub_bins = np.minimum(((2 * mantissa - 1) * SUB_BINS).astype(np.int64), SUB_BINS - 1)
+    return np.where(values < 1.0, 0, 1 + (exponent.astype(np.int64) - 1) * SUB_BINS + sub_bins)
+
+
+def bin_bounds(bin_index):
+    """
+    Return the [lower, upper) response times in milliseconds covered by a bin.
+    """
+    if bin_index == 0:
+        return 0.0, 1.0
+    exponent, sub_bin = divmod(bin_index - 1, SUB_BINS)
+    return 2.0 ** exponent * (1 + sub_bin / SUB_BINS), 2.0 ** exponent * (1 + (sub_bin + 1) / SUB_BINS)
+
+
+# Helper function to bucket rows of (timestamp, endpoint, response time) by grain
+def _count_rows(rows):
+    counts = {grain: Counter() for grain in GRAINS}
+    rows = [row for row in rows if row[0] is not None and row[2] is not None]
+    if not rows:
+        return counts
+    bins = bins_of([row[2] for row in rows]).tolist()
+    for (timestamp, endpoint, _), bin_index in zip(rows, bins):
+        for grain, seconds in GRAINS.items():
+            counts[grain][timestamp - timestamp % seconds, endpoint or "", bin_index] += 1
+    return counts
+
+
+def refresh_histograms(connection, after_id=0):
+    """
+    Fold weblogs rows with id > after_id into the latency histograms. Run it
+    in the same transaction as the inserts, like refresh_rollups.
+    """
+    cursor = connection.execute(
+        "SELECT timestamp, endpoint, response_time_ms FROM weblogs WHERE id > ?", (after_id,)
+    )
+    while True:
+        rows = cursor.fetchmany(READ_CHUNK)
+        if not rows:
+            break
+        for grain, counts in _count_rows(rows).items():
+            buckets = {start: epoch_text(start) for start, _, _ in counts}
+            if grain == "daily":
+                buckets = {start: bucket[:10] for start, bucket in buckets.items()}
+            connection.executemany(
+                f"""
+                INSERT INTO {histogram_table(grain)} (bucket, endpoint, bin, count) VALUES (?, ?, ?, ?)
+                ON CONFLICT (bucket, endpoint, bin) DO UPDATE SET count = count + excluded.count
+                """,
+                [(buckets[start], endpoint, bin_index, count) for (start, endpoint, bin_index), count in counts.items()],
+            )
+
+
+def rebuild_histograms(connection):
+    """
+    Regenerate the latency histograms from the raw weblogs rows.
+    """
+    for grain in GRAINS:
+        connection.execute(f"DELETE FROM {histogram_table(grain)}")
+    refresh_histograms(connection)
+
+
+# Helper function to split [start, end) epoch seconds (None for an open
+# side) into (grain, start, end) segments, whole days first, then the hours,
+# minutes and finally the raw seconds (grain None) left at either edge
+def _segments(start, end, level=0):
+    grains = list(GRAINS)[::-1]
+    if level == len(grains):
+        if start < end:
+            yield None, start, end
+        return
+    seconds = GRAINS[grains[level]]
+    inner_start = -(-start // seconds) * seconds if start is not None else None
+    inner_end = end - end % seconds if end is not None else None
+    if inner_start is not None and inner_end is not None and inner_start >= inner_end:
+        yield from _segments(start, end, level + 1)
+        return
+    yield grains[level], inner_start, inner_end
+    if start is not None and start < inner_start:
+        yield from _segments(start, inner_start, level + 1)
+    if end is not None and inner_end < end:
+        yield from _segments(inner_end, end, level + 1)
+
+
+def histograms(fetch, requested=DateRange(), endpoint=None):
+    """
+    Return {endpoint: {bin: count}} over a DateRange for every endpoint (or
+    just `endpoint`), running queries through `fetch(query, params)`.
+
+    The whole days of the range are read from the daily table, the hours and
+    minutes at its edges from the hourly and per-minute tables, and only the
+    seconds before the first and after the last whole minute from the raw
+    rows, so any range merges at most a few hundred buckets per endpoint.
+    """
+    endpoint_clause = " AND endpoint = ?" if endpoint is not None else ""
+    endpoint_params = [endpoint] if endpoint is not None else []
+    result = {}
+    start, end = (epoch_seconds(bound) if bound is not None else None for bound in requested)
+    for grain, segment_start, segment_end in _segments(start, end):
+        segment = DateRange(epoch_text(segment_start), epoch_text(segment_end))
+        if grain is None:
+            clause, params = timestamp_clause(segment)
+            rows = fetch(
+                "SELECT IFNULL(endpoint, ''), response_time_ms FROM weblogs"
+                f" WHERE response_time_ms IS NOT NULL{clause}{endpoint_clause}",
+                tuple(params + endpoint_params),
+            )
+            bins = bins_of([row[1] for row in rows]).tolist() if rows else []
+            rows = [(name, bin_index, 1) for (name, _), bin_index in zip(rows, bins)]
+        else:
+            clause, params = bucket_clause(segment, grain)
+            rows = fetch(
+                f"SELECT endpoint, bin, SUM(count) FROM {histogram_table(grain)}"
+                f" WHERE 1=1{clause}{endpoint_clause} GROUP BY endpoint, bin",
+                tuple(params + endpoint_params),
+            )
+        for name, bin_index, count in rows:
+            histogram = result.setdefault(name, Counter())
+            histogram[bin_index] += count
+    return result
+
+
+def heatmap(fetch, requested=DateRange(), grain="hourly", endpoint=None):
+    """
+    Return (grain, truncated, [(bucket, {bin: count})]) with a row for every
+    bucket overlapping a DateRange, across all endpoints or just `endpoint`:
+    the rows of a latency heatmap. Edge buckets are counted whole.
+
+    A range spanning more than MAX_HEATMAP_BUCKETS buckets of `grain` is
+    drawn at the next coarser grain that fits; when even daily buckets do
+    not fit, only the last MAX_HEATMAP_BUCKETS days are returned and
+    `truncated` is True.
+    """
+    start, end = (epoch_seconds(bound) if bound is not None else None for bound in requested)
+    if start is None or end is None:
+        table = histogram_table("daily")
+        first, last = fetch(f"SELECT MIN(bucket), MAX(bucket) FROM {table}", ())[0]
+        if first is None:
+            return grain, False, []
+        start = epoch_seconds(first) if start is None else start
+        end = epoch_seconds(last) + GRAINS["daily"] if end is None else end
+
+    coarser = list(GRAINS)[list(GRAINS).index(grain):]
+    for grain in coarser:
+        seconds = GRAINS[grain]
+        first, last = start - start % seconds, -(-end // seconds) * seconds
+        if (last - first) // seconds <= MAX_HEATMAP_BUCKETS:
+            break
+    truncated = (last - first) // seconds > MAX_HEATMAP_BUCKETS
+    if truncated:
+        first = last - MAX_HEATMAP_BUCKETS * seconds
+
+    table = histogram_table(grain)
+    clause, params = bucket_clause(DateRange(epoch_text(first), epoch_text(last)), grain)
+    if endpoint is not None:
+        clause += " AND endpoint = ?"
+        params.append(endpoint)
+    rows = fetch(f"SELECT bucket, bin, SUM(count) FROM {table} WHERE 1=1{clause} GROUP BY bucket, bin ORDER BY bucket",
+                 tuple(params))
+    buckets = {}
+    for bucket, bin_index, count in rows:
+        buckets.setdefault(bucket, {})[bin_index] = count
+    return grain, truncated, list(buckets.items())
+
+
+def percentiles(histogram, quantiles=QUANTILES):
+    """
+    Return {name: response time} for each quantile of a {bin: count}
+    histogram, interpolating linearly inside the bin holding the rank, plus
+    the row count. Percentiles are None for an empty histogram.
+    """
+    total = sum(histogram.values())
+    result = {"count": total}
+    cumulative = 0
+    ordered = sorted(histogram.items())
+    position = 0
+    for name, quantile in sorted(quantiles.items(), key=lambda item: item[1]):
+        if not total:
+            result[name] = None
+            continue
+        rank = quantile * total
+        while position < len(ordered) - 1 and cumulative + ordered[position][1] < rank:
+            cumulative += ordered[position][1]
+            position += 1
+        bin_index, count = ordered[position]
+        lower, upper = bin_bounds(bin_index)
+        result[name] = round(lower + (upper - lower) * min(max((rank - cumulative) / count, 0.0), 1.0), 2)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the latency histogram tables")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--db", default=DB_FILE, help="Path to the SQLite database")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    with conn:
+        rebuild_histograms(conn)
+    conn.close()
+    print("Rebuilt the latency histograms.")
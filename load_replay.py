@@ -0,0 +1,363 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+from generate_dataset import generate_database
+
+# Concurrent dashboard sessions to try, one level after another
+DEFAULT_SESSION_LEVELS = [1, 10, 25, 50]
+DEFAULT_DURATION_SECONDS = 60
+DEFAULT_WRITES_PER_SECOND = 0.1       # generate_logs batches; the API default is one per 10s
+
+# Seconds between legacy dashboard refreshes and the /changes long-poll window,
+# as in streamlit_dashboard.py
+REFRESH_SECONDS = 10
+CHANGE_WAIT_SECONDS = 25
+
+# A level meets the SLO when 95% of dashboard refreshes finish within this
+# and at most this fraction of requests fail
+DEFAULT_SLO_P95_MS = 1000.0
+DEFAULT_SLO_ERROR_RATE = 0.01
+
+REQUEST_TIMEOUT_SECONDS = 30
+
+# /kpis/summary sections and the tables they read (see fastapi_app.SUMMARY_SECTIONS)
+SUMMARY_SECTION_TABLES = {
+    "sales": {"sales_metrics"},
+    "leads": {"leads"},
+    "weblogs": {"weblogs"},
+    "conversion": {"sales_metrics", "leads"},
+}
+
+
+def legacy_burst(start_date, end_date):
+    """
+    The 17 KPI requests the dashboard sent one after another on every
+    10-second refresh before /kpis/summary, plus the leads timeline.
+    """
+    dates = {"start_date": start_date, "end_date": end_date}
+    return [
+        ("/kpis/total-revenue", {}),
+        ("/kpis/total-sales-profit", {}),
+        ("/kpis/profit-per-salesperson", {}),
+        ("/kpis/sales-per-country", {}),
+        ("/kpis/product-sales-per-country", dates),
+        ("/kpis/best-salesperson", dates),
+        ("/kpis/most-sold-product", dates),
+        ("/kpis/conversion-rate", dates),
+        ("/kpis/total-revenue-profit-product", dates),
+        ("/kpis/total-website-visits", dates),
+        ("/kpis/unique-visitors", dates),
+        ("/kpis/demo-requests", dates),
+        ("/kpis/top-landing-pages", {**dates, "limit": 5}),
+        ("/kpis/leads-generated", dates),
+        ("/kpis/leads-by-source", dates),
+        ("/kpis/leads-by-status", dates),
+        ("/kpis/lead-conversion-rate", dates),
+        ("/kpis/leads-by-day", {}),
+    ]
+
+
+def current_burst(start_date, end_date, changed=None):
+    """
+    The requests render_dashboard sends now: the summary sections whose tables
+    changed (all of them when `changed` is None) and, when leads changed, the
+    leads timeline.
+    """
+    sections = [
+        section for section, tables in SUMMARY_SECTION_TABLES.items()
+        if changed is None or tables & changed
+    ]
+    burst = []
+    if sections:
+        burst.append(("/kpis/summary", {"start_date": start_date, "end_date": end_date, "limit": 5, "sections": ",".join(sections)}))
+    if changed is None or "leads" in changed:
+        burst.append(("/kpis/leads-by-day", {}))
+    return burst
+
+
+class Recorder:
+    """
+    Collects request latencies, refresh (whole dashboard) latencies and
+    failures for one load level.
+    """
+
+    def __init__(self):
+        self.latencies = {}
+        self.refreshes = []
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.lock_errors = 0
+        self.status_codes = {}
+        self.long_polls = 0
+
+    def record(self, path, seconds, status_code=None, body=""):
+        self.requests += 1
+        self.latencies.setdefault(path, []).append(seconds)
+        if status_code is not None:
+            self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+            if status_code >= 400:
+                self.errors += 1
+                if "locked" in body or "busy" in body:
+                    self.lock_errors += 1
+
+    def failure(self, path, timed_out):
+        self.requests += 1
+        self.errors += 1
+        if timed_out:
+            self.timeouts += 1
+
+
+# Helper function to summarize latencies in seconds as milliseconds
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    values = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+
+async def timed_get(client, recorder, path, params):
+    """
+    GET one endpoint and record the outcome. Returns the JSON body or None.
+    """
+    started = time.perf_counter()
+    try:
+        response = await client.get(path, params=params)
+    except httpx.TimeoutException:
+        recorder.failure(path, timed_out=True)
+        return None
+    except httpx.HTTPError:
+        recorder.failure(path, timed_out=False)
+        return None
+    recorder.record(path, time.perf_counter() - started, response.status_code, response.text if response.status_code >= 400 else "")
+    return response.json() if response.status_code == 200 else None
+
+
+async def legacy_session(client, recorder, stop_at, dates):
+    """
+    A dashboard from before the change feed: the full burst, sequentially,
+    every REFRESH_SECONDS.
+    """
+    await asyncio.sleep(random.uniform(0, REFRESH_SECONDS))
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        for path, params in legacy_burst(*dates):
+            await timed_get(client, recorder, path, params)
+        elapsed = time.perf_counter() - started
+        recorder.refreshes.append(elapsed)
+        await asyncio.sleep(max(0.0, REFRESH_SECONDS - elapsed))
+
+
+async def current_session(client, recorder, stop_at, dates):
+    """
+    The current dashboard: one concurrent burst, then a /changes long-poll,
+    refetching only what the reported writes touched.
+    """
+    await asyncio.sleep(random.uniform(0, 1))
+    feed = await timed_get(client, recorder, "/changes", {})
+    cursor = feed["cursor"] if feed else None
+    changed = None
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        await asyncio.gather(*(timed_get(client, recorder, path, params) for path, params in current_burst(*dates, changed)))
+        recorder.refreshes.append(time.perf_counter() - started)
+
+        changed = set()
+        while not changed and time.perf_counter() < stop_at:
+            wait = max(0.0, min(CHANGE_WAIT_SECONDS, stop_at - time.perf_counter()))
+            params = {"wait": round(wait, 3)} if cursor is None else {"since": cursor, "wait": round(wait, 3)}
+            recorder.long_polls += 1
+            try:
+                response = await client.get("/changes", params=params, timeout=wait + REQUEST_TIMEOUT_SECONDS)
+                feed = response.json() if response.status_code == 200 else None
+            except httpx.HTTPError:
+                feed = None
+            if feed is None:
+                recorder.failure("/changes", timed_out=False)
+                changed = None
+                await asyncio.sleep(REFRESH_SECONDS)
+                break
+            if cursor is None or feed["reset"]:
+                changed = None
+            else:
+                changed = {table for event in feed["events"] for table in event["tables"]}
+            cursor = feed["cursor"]
+            if changed is None:
+                break
+
+
+async def run_level(base_url, sessions, duration, mix, dates):
+    """
+    Run `sessions` concurrent dashboards for `duration` seconds and return
+    the level's report, including the API's pool wait counters.
+    """
+    limits = httpx.Limits(max_connections=sessions * 2 + 4, max_keepalive_connections=sessions * 2 + 4)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=REQUEST_TIMEOUT_SECONDS) as client:
+        pool_before = (await client.get("/stats/pool")).json()
+        recorder = Recorder()
+        session = legacy_session if mix == "legacy" else current_session
+        stop_at = time.perf_counter() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*(session(client, recorder, stop_at, dates) for _ in range(sessions)))
+        elapsed = time.perf_counter() - started
+        pool_after = (await client.get("/stats/pool")).json()
+
+    return {
+        "sessions": sessions,
+        "seconds": round(elapsed, 3),
+        "requests": recorder.requests,
+        "requests_per_second": round(recorder.requests / elapsed, 2),
+        "errors": recorder.errors,
+        "error_rate": round(recorder.errors / recorder.requests, 4) if recorder.requests else 0.0,
+        "timeouts": recorder.timeouts,
+        "lock_errors": recorder.lock_errors,
+        "status_codes": {str(code): count for code, count in sorted(recorder.status_codes.items())},
+        "long_polls": recorder.long_polls,
+        "refresh_ms": percentiles(recorder.refreshes),
+        "endpoint_ms": {path: percentiles(samples) for path, samples in sorted(recorder.latencies.items())},
+        "pool": {
+            "writes": pool_after["writer_checkouts"] - pool_before["writer_checkouts"],
+            "reads": pool_after["reader_checkouts"] - pool_before["reader_checkouts"],
+            "lock_wait_ms": round(pool_after["total_wait_ms"] - pool_before["total_wait_ms"], 3),
+            "max_lock_wait_ms": pool_after["max_wait_ms"],
+        },
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_api(db_file, workdir, writes_per_second, port):
+    """
+    Start the API with uvicorn on a copy of `db_file`, writing a
+    generate_logs batch `writes_per_second` times per second.
+    Returns the process once /health answers.
+    """
+    shutil.copy(db_file, os.path.join(workdir, "logs.db"))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([os.path.dirname(os.path.abspath(__file__)), env.get("PYTHONPATH", "")])
+    env["LOG_INTERVAL_SECONDS"] = str(1 / writes_per_second)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "fastapi_app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir,
+        env=env,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None:
+            raise RuntimeError("The API exited during startup")
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("The API did not start within 60 seconds")
+
+
+def meets_slo(level, slo_p95_ms, slo_error_rate):
+    refresh = level["refresh_ms"]
+    return refresh.get("count", 0) > 0 and refresh["p95"] <= slo_p95_ms and level["error_rate"] <= slo_error_rate
+
+
+def print_report(report):
+    print(f"\nMix: {report['mix']}, writes/s: {report['writes_per_second']}, "
+          f"SLO: refresh p95 <= {report['slo']['refresh_p95_ms']} ms, errors <= {report['slo']['error_rate']:.1%}")
+    print(f"{'sessions':>8} {'req/s':>8} {'refresh p50':>12} {'p95':>10} {'p99':>10} {'errors':>7} {'locked':>7} "
+          f"{'lock wait ms':>13} {'SLO':>5}")
+    for level in report["levels"]:
+        refresh = level["refresh_ms"]
+        print(f"{level['sessions']:>8} {level['requests_per_second']:>8} {refresh.get('p50', 0):>12} "
+              f"{refresh.get('p95', 0):>10} {refresh.get('p99', 0):>10} {level['errors']:>7} {level['lock_errors']:>7} "
+              f"{level['pool']['lock_wait_ms']:>13} {'ok' if level['meets_slo'] else 'FAIL':>5}")
+    if report["breaking_point"] is None:
+        print("Every level met the SLO.")
+    else:
+        print(f"The SLO first failed at {report['breaking_point']} concurrent dashboards.")
+
+
+def replay(db_file, session_levels, duration, mix, writes_per_second, slo_p95_ms, slo_error_rate, url=None):
+    """
+    Run every session level against the API (started locally unless `url`
+    is given) and return the full report.
+    """
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    report = {
+        "mix": mix,
+        "writes_per_second": writes_per_second,
+        "duration_seconds": duration,
+        "slo": {"refresh_p95_ms": slo_p95_ms, "error_rate": slo_error_rate},
+        "levels": [],
+        "breaking_point": None,
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        process = None
+        if url is None:
+            port = free_port()
+            process = start_api(db_file, workdir, writes_per_second, port)
+            url = f"http://127.0.0.1:{port}"
+        try:
+            for sessions in session_levels:
+                print(f"Replaying {sessions} dashboards for {duration}s ...")
+                level = asyncio.run(run_level(url, sessions, duration, mix, (today, today)))
+                level["meets_slo"] = meets_slo(level, slo_p95_ms, slo_error_rate)
+                report["levels"].append(level)
+                if not level["meets_slo"] and report["breaking_point"] is None:
+                    report["breaking_point"] = sessions
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay concurrent dashboard sessions against a local API")
+    parser.add_argument("--db", help="Database to serve (copied first); default: a generated one")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows per table of the generated database")
+    parser.add_argument("--url", help="Target an already running API instead of starting one")
+    parser.add_argument("--sessions", type=int, nargs="+", default=DEFAULT_SESSION_LEVELS, help="Concurrent dashboards per level")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION_SECONDS, help="Seconds per level")
+    parser.add_argument("--mix", choices=["current", "legacy"], default="current",
+                        help="current: /kpis/summary plus /changes long-polls; legacy: the 17-request burst every 10s")
+    parser.add_argument("--writes-per-second", type=float, default=DEFAULT_WRITES_PER_SECOND, help="generate_logs batches per second")
+    parser.add_argument("--slo-p95-ms", type=float, default=DEFAULT_SLO_P95_MS, help="Refresh latency SLO at p95")
+    parser.add_argument("--slo-error-rate", type=float, default=DEFAULT_SLO_ERROR_RATE, help="Highest acceptable error rate")
+    parser.add_argument("--out", default="load_report.json", help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        db_file = args.db
+        if db_file is None and args.url is None:
+            db_file = os.path.join(scratch, "replay.db")
+            generate_database(db_file, args.rows)
+        result = replay(db_file, args.sessions, args.duration, args.mix, args.writes_per_second,
+                        args.slo_p95_ms, args.slo_error_rate, args.url)
+
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+    print_report(result)
+    print(f"Wrote {args.out}.")
@@ -0,0 +1,120 @@
+import argparse
+import os
+import sqlite3
+import time
+
+from migrations import (
+    DB_FILE, EPOCH_COLUMNS, apply_migrations, copy_epoch_rows, create_epoch_table, current_version,
+    drop_legacy_table, epoch_shadow, record_migration, stores_epoch_timestamps, swap_epoch_table,
+)
+
+# Schema version the online migration brings a database to
+EPOCH_VERSION = 4
+
+# Rows copied per transaction; each batch holds the write lock for a few milliseconds
+BATCH_SIZE = 20000
+
+# Pause between batches so the API's writer gets the lock in between
+PAUSE_SECONDS = 0.02
+
+
+# Helper function to run `func(connection)` in its own short write transaction
+def in_transaction(connection, func):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        result = func(connection)
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    return result
+
+
+def database_bytes(database_path):
+    """
+    Return the bytes the database file occupies, including its WAL.
+    """
+    return sum(os.path.getsize(path) for path in (database_path, f"{database_path}-wal") if os.path.exists(path))
+
+
+def migrate_online(database_path=DB_FILE, batch_size=BATCH_SIZE, pause=PAUSE_SECONDS, vacuum=False):
+    """
+    Convert a live database's raw tables to epoch-second timestamps
+    (schema version 4) without taking it offline.
+
+    Each raw table is copied, in id order and `batch_size` rows per short
+    transaction, into a new table with the version 4 layout and indexes, so
+    the API keeps reading (WAL) and writing (between batches) throughout.
+    Once the copies have caught up, one transaction copies the rows appended
+    meanwhile, swaps all three tables in and records the migration; the old
+    tables are dropped afterwards. An interrupted run resumes from the rows
+    already copied.
+
+    Rows are copied once, so nothing may update already-copied rows while it
+    runs (do not run the country backfill alongside). Restart the API on a
+    build that reads epoch timestamps right after the swap; until then the
+    tables' trigger converts the TEXT timestamps old builds still insert.
+    With `vacuum`, the file is compacted at the end, which blocks writers
+    for the duration. Returns per-table copy timings and the swap duration.
+    """
+    report = {"tables": {}, "bytes_before": database_bytes(database_path)}
+    apply_migrations(database_path, target=EPOCH_VERSION - 1)
+    connection = sqlite3.connect(database_path, isolation_level=None, timeout=30)
+    try:
+        if current_version(connection) < EPOCH_VERSION:
+            pending = [table for table in EPOCH_COLUMNS if not stores_epoch_timestamps(connection, table)]
+            for table in pending:
+                in_transaction(connection, lambda conn: create_epoch_table(conn, table, epoch_shadow(table)))
+                copied = 0
+                started = time.perf_counter()
+                while True:
+                    rows = in_transaction(connection, lambda conn: copy_epoch_rows(conn, table, batch_size))
+                    copied += rows
+                    if rows < batch_size:
+                        break
+                    print(f"{table}: copied {copied} rows")
+                    time.sleep(pause)
+                seconds = time.perf_counter() - started
+                report["tables"][table] = {
+                    "rows": copied,
+                    "seconds": round(seconds, 3),
+                    "rows_per_second": round(copied / seconds) if seconds else 0,
+                }
+                print(f"{table}: copied {copied} rows in {seconds:.1f}s")
+
+            def swap(conn):
+                for table in pending:
+                    copy_epoch_rows(conn, table)
+                    swap_epoch_table(conn, table)
+                record_migration(conn, EPOCH_VERSION)
+
+            started = time.perf_counter()
+            in_transaction(connection, swap)
+            report["swap_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            print(f"Swapped in the epoch-timestamp tables in {report['swap_ms']} ms.")
+
+        for table in EPOCH_COLUMNS:
+            in_transaction(connection, lambda conn: drop_legacy_table(conn, table))
+        if vacuum:
+            started = time.perf_counter()
+            connection.execute("VACUUM")
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            report["vacuum_seconds"] = round(time.perf_counter() - started, 3)
+    finally:
+        connection.close()
+    report["bytes_after"] = database_bytes(database_path)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert logs.db timestamps to epoch seconds while the API keeps running")
+    parser.add_argument("--db", default=DB_FILE, help="Path to the SQLite database")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows copied per transaction")
+    parser.add_argument("--pause", type=float, default=PAUSE_SECONDS, help="Seconds to wait between batches")
+    parser.add_argument("--vacuum", action="store_true", help="Compact the file afterwards (blocks writers meanwhile)")
+    args = parser.parse_args()
+
+    result = migrate_online(args.db, args.batch_size, args.pause, args.vacuum)
+    if not result["tables"] and "swap_ms" not in result:
+        print("Timestamps are already stored as epoch seconds.")
+    print(f"Database size: {result['bytes_before']} -> {result['bytes_after']} bytes.")
@@ -0,0 +1,429 @@
+import argparse
+import sqlite3
+from datetime import datetime, timezone
+
+from dimensions import DIMENSIONS, ENCODED_TABLES, dimension_table, fact_table, key_column
+from latency_histograms import create_histogram_tables, rebuild_histograms
+from rollups import create_rollup_tables, rebuild_rollups
+from visitor_sketches import create_sketch_tables, rebuild_sketches
+
+# Path to the SQLite database
+DB_FILE = "logs.db"
+
+# Registered migrations as (version, description, function), in version order
+MIGRATIONS = []
+
+# Bucket expressions over the TEXT timestamps stored by schema versions 1-3
+TEXT_GRAINS = {
+    "hourly": "strftime('%Y-%m-%d %H:00:00', timestamp)",
+    "daily": "date(timestamp)",
+}
+
+# Raw table layouts from schema version 4 on, as (column, type) in storage
+# order: timestamps are INTEGER seconds since the Unix epoch (UTC) and
+# weblogs no longer carries the access_time copy of the timestamp's time
+EPOCH_COLUMNS = {
+    "weblogs": [
+        ("id", "INTEGER PRIMARY KEY"), ("timestamp", "INTEGER"), ("ip", "TEXT"), ("country", "TEXT"),
+        ("endpoint", "TEXT"), ("method", "TEXT"), ("status_code", "INTEGER"), ("response_time_ms", "INTEGER"),
+        ("user_agent", "TEXT"),
+    ],
+    "sales_metrics": [
+        ("id", "INTEGER PRIMARY KEY"), ("timestamp", "INTEGER"), ("product", "TEXT"), ("salesperson", "TEXT"),
+        ("revenue", "INTEGER"), ("profit", "INTEGER"), ("country", "TEXT"), ("endpoint", "TEXT"),
+    ],
+    "leads": [
+        ("id", "INTEGER PRIMARY KEY"), ("timestamp", "INTEGER"), ("lead_source", "TEXT"), ("lead_status", "TEXT"),
+    ],
+}
+
+# Secondary indexes of the version 4 tables as (name, table, columns): the
+# version 2 indexes under new names, so the online migration can build them
+# on the new tables while the old ones still exist
+EPOCH_INDEXES = [
+    ("idx_sales_time", "sales_metrics", "timestamp"),
+    ("idx_sales_salesperson_time", "sales_metrics", "salesperson, timestamp, revenue, profit"),
+    ("idx_sales_product_time", "sales_metrics", "product, timestamp, revenue, profit"),
+    ("idx_sales_country_time", "sales_metrics", "country, timestamp, product, revenue, profit"),
+    ("idx_sales_endpoint_time", "sales_metrics", "endpoint, timestamp"),
+    ("idx_leads_time", "leads", "timestamp"),
+    ("idx_leads_source_time", "leads", "lead_source, timestamp"),
+    ("idx_leads_status_time", "leads", "lead_status, timestamp"),
+    ("idx_weblogs_time", "weblogs", "timestamp"),
+    ("idx_weblogs_endpoint_time", "weblogs", "endpoint, timestamp"),
+    ("idx_weblogs_country_time", "weblogs", "country, timestamp"),
+    ("idx_weblogs_visitor_ip", "weblogs", "ip"),
+]
+
+# SQL turning a TEXT timestamp into epoch seconds (NULL when unparseable)
+TEXT_TO_EPOCH = "CAST(strftime('%s', {column}) AS INTEGER)"
+
+
+# Helper function to index a dictionary-encoded column by its key
+def _stored_index_columns(table, columns):
+    encoded = ENCODED_TABLES[table][1] if table in ENCODED_TABLES else []
+    return ", ".join(key_column(column) if column in encoded else column for column in columns.split(", "))
+
+
+# Secondary indexes from schema version 5 on, as (name, table, columns over
+# the table holding its rows): the version 4 indexes, with dictionary-encoded
+# columns indexed by their keys
+INDEXES = [(name, table, _stored_index_columns(table, columns)) for name, table, columns in EPOCH_INDEXES]
+
+
+def migration(version, description):
+    """
+    Register a schema migration. The decorated function receives an open
+    connection and runs inside the migration's transaction.
+    """
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return func
+    return register
+
+
+@migration(1, "Create weblogs, sales_metrics and leads tables")
+def create_base_tables(connection):
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS weblogs (
+        id INTEGER PRIMARY KEY,
+        timestamp TEXT,
+        access_time TEXT,
+        ip TEXT,
+        country TEXT,
+        endpoint TEXT,
+        method TEXT,
+        status_code INTEGER,
+        response_time_ms INTEGER,
+        user_agent TEXT
+    )
+    """)
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS sales_metrics (
+        id INTEGER PRIMARY KEY,
+        timestamp TEXT,
+        product TEXT,
+        salesperson TEXT,
+        revenue INTEGER,
+        profit INTEGER,
+        country TEXT,
+        endpoint TEXT
+    )
+    """)
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS leads (
+        id INTEGER PRIMARY KEY,
+        timestamp TEXT,
+        lead_source TEXT,
+        lead_status TEXT
+    )
+    """)
+
+
+@migration(2, "Add covering indexes for the KPI and filter queries")
+def create_kpi_indexes(connection):
+    # sales_metrics: date ranges, per-dimension GROUP BYs and /filter-sales filters.
+    # The trailing revenue/profit columns let the aggregates run from the index alone.
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_sales_timestamp ON sales_metrics (timestamp)")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_sales_salesperson_timestamp ON sales_metrics (salesperson, timestamp, revenue, profit)")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_sales_product_timestamp ON sales_metrics (product, timestamp, revenue, profit)")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_sales_country_timestamp ON sales_metrics (country, timestamp, product, revenue, profit)")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_sales_endpoint ON sales_metrics (endpoint, timestamp)")
+
+    # leads: date ranges and the source/status breakdowns
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_leads_timestamp ON leads (timestamp)")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_leads_source_timestamp ON leads (lead_source, timestamp)")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_leads_status_timestamp ON leads (lead_status, timestamp)")
+
+    # weblogs: visits by date, landing pages, country and distinct visitors
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_weblogs_timestamp ON weblogs (timestamp)")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_weblogs_endpoint_timestamp ON weblogs (endpoint, timestamp)")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_weblogs_country_timestamp ON weblogs (country, timestamp)")
+    connection.execute("CREATE INDEX IF NOT EXISTS idx_weblogs_ip ON weblogs (ip)")
+
+
+@migration(3, "Add hourly and daily KPI rollup tables")
+def create_kpi_rollups(connection):
+    create_rollup_tables(connection)
+    rebuild_rollups(connection, grains=TEXT_GRAINS)
+
+
+# Helper function to name the table a raw table is copied into by migration 4
+def epoch_shadow(table):
+    return f"{table}_epoch"
+
+
+def stores_epoch_timestamps(connection, table):
+    """
+    Return True when `table` declares its timestamp column INTEGER.
+    """
+    for row in connection.execute(f"PRAGMA table_info({table})"):
+        if row[1] == "timestamp":
+            return row[2].upper() == "INTEGER"
+    return False
+
+
+def create_epoch_indexes(connection, table, name=None):
+    """
+    Create the version 4 secondary indexes of `table` on table `name`
+    (default: `table` itself).
+    """
+    for index, indexed_table, columns in EPOCH_INDEXES:
+        if indexed_table == table:
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {index} ON {name or table} ({columns})")
+
+
+def drop_epoch_indexes(connection, tables=None):
+    """
+    Drop the version 4 secondary indexes of `tables` (default: all), e.g.
+    ahead of a bulk load that rebuilds them afterwards.
+    """
+    for index, table, _ in EPOCH_INDEXES:
+        if tables is None or table in tables:
+            connection.execute(f"DROP INDEX IF EXISTS {index}")
+
+
+def create_epoch_table(connection, table, name=None):
+    """
+    Create table `name` (default: `table`) with the version 4 layout of
+    `table`, its indexes, and a trigger converting TEXT timestamps written
+    by older clients into epoch seconds.
+    """
+    name = name or table
+    columns = ", ".join(f"{column} {column_type}" for column, column_type in EPOCH_COLUMNS[table])
+    connection.execute(f"CREATE TABLE IF NOT EXISTS {name} ({columns})")
+    create_epoch_indexes(connection, table, name)
+    connection.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_text_timestamp AFTER INSERT ON {name}
+    WHEN typeof(NEW.timestamp) = 'text'
+    BEGIN
+        UPDATE {name} SET timestamp = {TEXT_TO_EPOCH.format(column="NEW.timestamp")} WHERE id = NEW.id;
+    END
+    """)
+
+
+def copy_epoch_rows(connection, table, limit=None):
+    """
+    Copy the next rows of TEXT-timestamp `table`, in id order, into its
+    shadow table (see epoch_shadow), converting the timestamps and leaving
+    access_time behind. Copies at most `limit` rows (default: all the rest)
+    and returns how many were copied; the shadow's highest id is the resume
+    point, so repeated calls pick up rows appended in the meantime.
+    """
+    shadow = epoch_shadow(table)
+    columns = [column for column, _ in EPOCH_COLUMNS[table]]
+    select = [TEXT_TO_EPOCH.format(column=column) if column == "timestamp" else column for column in columns]
+    after_id = connection.execute(f"SELECT IFNULL(MAX(id), 0) FROM {shadow}").fetchone()[0]
+    query = f"INSERT INTO {shadow} ({', '.join(columns)}) SELECT {', '.join(select)} FROM {table} WHERE id > ? ORDER BY id"
+    params = [after_id]
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+    return connection.execute(query, params).rowcount
+
+
+def swap_epoch_table(connection, table):
+    """
+    Put the filled shadow table in place of `table`. The old table is kept
+    as <table>_legacy until drop_legacy_table.
+    """
+    connection.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+    connection.execute(f"ALTER TABLE {epoch_shadow(table)} RENAME TO {table}")
+
+
+def drop_legacy_table(connection, table):
+    connection.execute(f"DROP TABLE IF EXISTS {table}_legacy")
+
+
+@migration(4, "Store raw timestamps as INTEGER epoch seconds and drop weblogs.access_time")
+def store_epoch_timestamps(connection):
+    # Rollup buckets are the same text either way, so they are kept as they are.
+    # Large live databases can be converted beforehand with migrate_timestamps.py.
+    for table in EPOCH_COLUMNS:
+        if not stores_epoch_timestamps(connection, table):
+            create_epoch_table(connection, table, epoch_shadow(table))
+            copy_epoch_rows(connection, table)
+            swap_epoch_table(connection, table)
+        drop_legacy_table(connection, table)
+
+
+def create_secondary_indexes(connection, tables=None):
+    """
+    Create the current secondary indexes of `tables` (default: all).
+    """
+    for index, table, columns in INDEXES:
+        if tables is None or table in tables:
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {index} ON {fact_table(table)} ({columns})")
+
+
+def drop_secondary_indexes(connection, tables=None):
+    """
+    Drop the current secondary indexes of `tables` (default: all), e.g.
+    ahead of a bulk load that recreates them afterwards.
+    """
+    for index, table, _ in INDEXES:
+        if tables is None or table in tables:
+            connection.execute(f"DROP INDEX IF EXISTS {index}")
+
+
+# Helper function to create the view presenting a fact table under the raw
+# table's name and columns, and the trigger that lets plain INSERTs through it.
+# Tables are not aliased, so query plans name the fact and dimension tables.
+def _create_decoding_view(connection, table):
+    fact, encoded = ENCODED_TABLES[table]
+    columns = [column for column, _ in EPOCH_COLUMNS[table]]
+    select = [f"{dimension_table(column)}.value AS {column}" if column in encoded else f"{fact}.{column} AS {column}"
+              for column in columns]
+    joins = [f"LEFT JOIN {dimension_table(column)} ON {dimension_table(column)}.id = {fact}.{key_column(column)}"
+             for column in encoded]
+    connection.execute(f"CREATE VIEW {table} AS SELECT {', '.join(select)} FROM {fact} {' '.join(joins)}")
+
+    stored = [key_column(column) if column in encoded else column for column in columns]
+    values = [
+        f"(SELECT id FROM {dimension_table(column)} WHERE value = NEW.{column})" if column in encoded
+        else f"CASE WHEN typeof(NEW.timestamp) = 'text' THEN {TEXT_TO_EPOCH.format(column='NEW.timestamp')} ELSE NEW.timestamp END"
+        if column == "timestamp" else f"NEW.{column}"
+        for column in columns
+    ]
+    interns = "".join(
+        f"INSERT OR IGNORE INTO {dimension_table(column)} (value) SELECT NEW.{column} WHERE NEW.{column} IS NOT NULL;\n"
+        for column in encoded
+    )
+    connection.execute(f"""
+    CREATE TRIGGER {table}_insert INSTEAD OF INSERT ON {table}
+    BEGIN
+        {interns}INSERT INTO {fact} ({', '.join(stored)}) VALUES ({', '.join(values)});
+    END
+    """)
+
+
+@migration(5, "Dictionary-encode the low-cardinality columns of sales_metrics and weblogs")
+def encode_dimensions(connection):
+    for column in DIMENSIONS:
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {dimension_table(column)} (id INTEGER PRIMARY KEY, value TEXT NOT NULL UNIQUE)"
+        )
+    for table, (fact, encoded) in ENCODED_TABLES.items():
+        # The most frequent values get the smallest keys
+        for column in encoded:
+            connection.execute(f"""
+            INSERT OR IGNORE INTO {dimension_table(column)} (value)
+            SELECT {column} FROM {table} WHERE {column} IS NOT NULL GROUP BY {column} ORDER BY COUNT(*) DESC
+            """)
+        columns = [(key_column(column), "INTEGER") if column in encoded else (column, column_type)
+                   for column, column_type in EPOCH_COLUMNS[table]]
+        connection.execute(f"CREATE TABLE {fact} ({', '.join(f'{column} {column_type}' for column, column_type in columns)})")
+        select = [f"{column}.id" if column in encoded else f"t.{column}" for column, _ in EPOCH_COLUMNS[table]]
+        joins = [f"LEFT JOIN {dimension_table(column)} {column} ON {column}.value = t.{column}" for column in encoded]
+        connection.execute(f"""
+        INSERT INTO {fact} ({', '.join(column for column, _ in columns)})
+        SELECT {', '.join(select)} FROM {table} t {' '.join(joins)} ORDER BY t.id
+        """)
+        connection.execute(f"DROP TABLE {table}")
+        create_secondary_indexes(connection, [table])
+        _create_decoding_view(connection, table)
+
+
+@migration(6, "Add hourly and daily HyperLogLog sketches of the visitors' IPs")
+def create_visitor_sketches(connection):
+    create_sketch_tables(connection)
+    rebuild_sketches(connection)
+
+
+@migration(7, "Add per-minute, hourly and daily latency histograms per endpoint")
+def create_latency_histograms(connection):
+    create_histogram_tables(connection)
+    rebuild_histograms(connection)
+
+
+def ensure_version_table(connection):
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )
+    """)
+
+
+def current_version(connection):
+    """
+    Return the highest applied schema version, or 0 for an unversioned database.
+    """
+    ensure_version_table(connection)
+    row = connection.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+def record_migration(connection, version):
+    """
+    Mark `version` as applied; call it inside the transaction that applied it.
+    """
+    description = next(entry[1] for entry in MIGRATIONS if entry[0] == version)
+    connection.execute(
+        "INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)",
+        (version, description, datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")),
+    )
+
+
+def apply_migrations(db_file=DB_FILE, target=None):
+    """
+    Apply every pending migration up to `target` (default: latest), each in
+    its own transaction, and record it in schema_migrations.
+    Returns the list of versions that were applied.
+    """
+    applied = []
+    connection = sqlite3.connect(db_file, isolation_level=None)
+    try:
+        version = current_version(connection)
+        for migration_version, description, func in MIGRATIONS:
+            if migration_version <= version or (target is not None and migration_version > target):
+                continue
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                func(connection)
+                record_migration(connection, migration_version)
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            applied.append(migration_version)
+    finally:
+        connection.close()
+    return applied
+
+
+def migration_status(db_file=DB_FILE):
+    """
+    Return (version, description, applied_at) for every known migration;
+    applied_at is None for pending ones.
+    """
+    connection = sqlite3.connect(db_file)
+    try:
+        ensure_version_table(connection)
+        applied = {
+            row[0]: row[1]
+            for row in connection.execute("SELECT version, applied_at FROM schema_migrations")
+        }
+    finally:
+        connection.close()
+    return [(version, description, applied.get(version)) for version, description, _ in MIGRATIONS]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply or inspect schema migrations for logs.db")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=["upgrade", "status"])
+    parser.add_argument("--db", default=DB_FILE, help="Path to the SQLite database")
+    parser.add_argument("--target", type=int, default=None, help="Stop at this schema version")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        for version, description, applied_at in migration_status(args.db):
+            print(f"{version:>4}  {'applied ' + applied_at if applied_at else 'pending':<28}  {description}")
+    else:
+        versions = apply_migrations(args.db, args.target)
+        if versions:
+            print(f"Applied migrations: {', '.join(str(v) for v in versions)}")
+        else:
+            print("Database schema is up to date.")
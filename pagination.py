@@ -0,0 +1,68 @@
+import base64
+import csv
+import io
+import json
+
+from date_range import epoch_seconds
+
+# Upper bound on rows per page / streamed chunk
+MAX_PAGE_SIZE = 10000
+
+
+def encode_cursor(timestamp, row_id):
+    """
+    Encode the (timestamp, id) keyset position of the last row returned as an
+    opaque URL-safe cursor.
+    """
+    raw = json.dumps([timestamp, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor into (epoch-seconds timestamp, id).
+    Cursors carrying a text timestamp, issued before timestamps were stored
+    as epoch seconds, are converted. Raises ValueError for anything that is
+    not a valid cursor.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, row_id = json.loads(base64.b64decode(padded.encode(), altchars=b"-_", validate=True))
+        if isinstance(timestamp, str):
+            timestamp = epoch_seconds(timestamp)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if type(timestamp) is not int or type(row_id) is not int:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return timestamp, row_id
+
+
+def keyset_clause(cursor):
+    """
+    Return the SQL predicate and params selecting rows after `cursor` in
+    (timestamp DESC, id DESC) order, so pages are index range scans rather
+    than OFFSET scans.
+    """
+    if not cursor:
+        return "", []
+    timestamp, row_id = decode_cursor(cursor)
+    return " AND (timestamp, id) < (?, ?)", [timestamp, row_id]
+
+
+def ndjson_chunk(columns, rows):
+    """
+    Serialize rows as newline-delimited JSON objects.
+    """
+    return "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+
+
+def csv_chunk(columns, rows, header=False):
+    """
+    Serialize rows as CSV, optionally preceded by the header line.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows(rows)
+    return buffer.getvalue()
@@ -0,0 +1,374 @@
+import argparse
+import json
+import math
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from date_range import DateRange, date_range, epoch_seconds, epoch_text
+from dimensions import fact_table
+from rollups import ROLLUPS, rollup_source, rollup_table
+
+# Path to the SQLite database
+DB_FILE = "logs.db"
+
+# Seconds per tree position: sums are kept per UTC hour, the grain of the
+# hourly rollups they are first loaded from, so any range whose bounds fall
+# on the hour is answered from the trees
+RESOLUTION = 3600
+
+# Dimension groups summed per table besides the overall totals: one series
+# of the table's rollup measures per value of a single dimension, or per
+# pair of values for a group of two
+TRACKED = {
+    "sales_metrics": [("salesperson",), ("product",), ("country",), ("endpoint",), ("country", "product")],
+    "leads": [("lead_source",), ("lead_status",)],
+    "weblogs": [("endpoint",), ("country",)],
+}
+
+# Fixed-point scale of the summed measures: revenue and profit are kept in
+# millionths, so fractional amounts add up exactly in int64 (to about 9.2
+# trillion per column); counts are kept as they are
+SUM_SCALE = 10 ** 6
+SCALES = {
+    table: [1 if expression == "COUNT(*)" else SUM_SCALE for expression in rollup["measures"].values()]
+    for table, rollup in ROLLUPS.items()
+}
+
+# Hours per tree segment, a power of two. A segment takes 8 bytes per hour
+# per column, one column per measure per series: with 45 sales series (135
+# columns) 1024 hours, about six weeks, take 1.1 MB. Only the segments that
+# hold rows are allocated, so a stray old row costs one segment.
+SEGMENT_HOURS = 1024
+
+
+class FenwickTree:
+    """
+    Fenwick (binary indexed) tree over int64 vectors: every position holds
+    one value per column, and add() and prefix() touch O(log n) positions,
+    so the column sums over any range of positions cost two prefix() calls
+    whatever the capacity.
+
+    The capacity is a power of two, so the last node covers every position
+    and holds the tree's total. New columns start at zero, which is a valid
+    tree of their own; they are allocated in blocks that double the width,
+    so adding them one at a time copies each stored value O(1) times.
+    """
+
+    def __init__(self, capacity=SEGMENT_HOURS, columns=0):
+        self.columns = columns  # columns in use, the first ones of self.tree
+        self.tree = np.zeros((capacity + 1, columns), np.int64)  # row 0 is unused
+
+    @property
+    def capacity(self):
+        return len(self.tree) - 1
+
+    def add_columns(self, count):
+        self.columns += count
+        allocated = self.tree.shape[1]
+        if self.columns > allocated:
+            tree = np.zeros((len(self.tree), max(self.columns, 2 * allocated)), np.int64)
+            tree[:, :allocated] = self.tree
+            self.tree = tree
+
+    def add(self, position, deltas):
+        """
+        Add a vector of per-column deltas to a position.
+        """
+        node = position + 1
+        while node < len(self.tree):
+            self.tree[node, :self.columns] += deltas
+            node += node & -node
+
+    def prefix(self, position):
+        """
+        Return the column sums of positions [0, position).
+        """
+        total = np.zeros(self.columns, np.int64)
+        node = min(position, self.capacity)
+        while node > 0:
+            total += self.tree[node, :self.columns]
+            node &= node - 1
+        return total
+
+    def range_sum(self, start, end):
+        """
+        Return the column sums of positions [start, end).
+        """
+        return self.prefix(end) - self.prefix(start)
+
+    def total(self):
+        """
+        Return the column sums of every position.
+        """
+        return self.tree[self.capacity, :self.columns].copy()
+
+
+class RangeSums:
+    """
+    In-memory prefix sums of the rollup measures - revenue, profit and sales
+    count, lead count, visits - per hour, overall and per value of the
+    TRACKED dimensions. Each table's hours are split into segments of
+    SEGMENT_HOURS, one FenwickTree each, allocated when a row first falls in
+    them. The sums over any range whose bounds fall on the hour take
+    O(log n) vector additions in the two segments holding its bounds and
+    one root read per segment in between, instead of a SUM over rollup or
+    raw rows.
+
+    refresh() folds in the rows with ids above the last ones it saw, so it
+    builds the trees at startup and keeps them current when run after every
+    committed write, whatever hours the new rows fall in.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        self.groups = 0
+        self.refresh_seconds = 0.0
+        self.queries = 0
+
+    def _reset(self):
+        self.loaded = False  # True once refresh() has caught up with the tables
+        self.last_ids = {table: 0 for table in TRACKED}
+        # table -> {segment: FenwickTree}; segment n holds the hours from n * SEGMENT_HOURS on
+        self.trees = {table: {} for table in TRACKED}
+        self.columns = {table: len(ROLLUPS[table]["measures"]) for table in TRACKED}
+        # table -> {(dimensions, values): first column}; the overall series is ((), ())
+        self.series = {table: {((), ()): 0} for table in TRACKED}
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    # Helper method to return the first column of a series, adding its
+    # columns to the table's trees the first time a value is seen
+    def _column(self, table, key):
+        column = self.series[table].get(key)
+        if column is None:
+            measures = len(ROLLUPS[table]["measures"])
+            column = self.series[table][key] = self.columns[table]
+            self.columns[table] += measures
+            for tree in self.trees[table].values():
+                tree.add_columns(measures)
+        return column
+
+    def _fold(self, table, rows):
+        # Callers must hold self._lock. Rows are (hour, *dimensions, *measures)
+        # with the dimensions in ROLLUPS order and NULLs read as ''
+        dimensions = ROLLUPS[table]["dimensions"]
+        measures = len(ROLLUPS[table]["measures"])
+        hours = np.array([row[0] // RESOLUTION for row in rows], np.int64)
+        measured = np.array([row[1 + len(dimensions):] for row in rows], np.float64).reshape(len(rows), measures)
+        values = np.rint(measured * np.array(SCALES[table], np.float64)).astype(np.int64)
+        # Resolve the series of each distinct combination of dimension values once
+        combinations = {}
+        combination_ids = np.array([combinations.setdefault(row[1:1 + len(dimensions)], len(combinations))
+                                    for row in rows], np.int64)
+        columns = [np.zeros(len(rows), np.int64)]
+        for group in TRACKED[table]:
+            indexes = [dimensions.index(column) for column in group]
+            lookup = np.array([self._column(table, (group, tuple(combination[index] for index in indexes)))
+                               for combination in combinations], np.int64)
+            columns.append(lookup[combination_ids])
+
+        distinct, inverse = np.unique(hours, return_inverse=True)
+        deltas = np.zeros((len(distinct), self.columns[table]), np.int64)
+        for first_columns in columns:
+            for measure in range(measures):
+                np.add.at(deltas, (inverse, first_columns + measure), values[:, measure])
+        trees = self.trees[table]
+        for hour, delta in zip(distinct.tolist(), deltas):
+            segment, position = divmod(hour, SEGMENT_HOURS)
+            tree = trees.get(segment)
+            if tree is None:
+                tree = trees[segment] = FenwickTree(SEGMENT_HOURS, self.columns[table])
+            tree.add(position, delta)
+
+    # Helper method to read (last id, rows to fold) for one table. The first
+    # read takes the hourly rollup, which holds the same sums, together with
+    # the last id in one read transaction; later reads sum the new raw rows
+    # up to a fixed id, so rows committed meanwhile wait for the next refresh.
+    def _read(self, connection, table):
+        rollup = ROLLUPS[table]
+        max_id = f"SELECT IFNULL(MAX(id), 0) FROM {fact_table(table)}"
+        if self.last_ids[table] == 0:
+            connection.execute("BEGIN")
+            try:
+                last_id = connection.execute(max_id).fetchone()[0]
+                rows = connection.execute(
+                    f"SELECT bucket, {', '.join(rollup['dimensions'])}, {', '.join(rollup['measures'])} "
+                    f"FROM {rollup_table(table, 'hourly')}"
+                ).fetchall()
+            finally:
+                connection.execute("COMMIT")
+            return last_id, [(epoch_seconds(row[0]),) + row[1:] for row in rows]
+
+        last_id = connection.execute(max_id).fetchone()[0]
+        if last_id <= self.last_ids[table]:
+            return last_id, []
+        dimensions = ", ".join(f"IFNULL({column}, '')" for column in rollup["dimensions"])
+        rows = connection.execute(f"""
+        SELECT timestamp - timestamp % {RESOLUTION}, {dimensions}, {", ".join(rollup["measures"].values())}
+        FROM {table}
+        WHERE id > ? AND id <= ? AND timestamp IS NOT NULL
+        GROUP BY 1, {", ".join(str(i + 2) for i in range(len(rollup["dimensions"])))}
+        """, (self.last_ids[table], last_id)).fetchall()
+        return last_id, rows
+
+    def refresh(self, connection):
+        """
+        Fold rows added to every table since the last refresh into the trees,
+        pre-summed per hour and dimension values. Returns the number of
+        groups folded.
+        """
+        with self._lock:
+            started = time.perf_counter()
+            folded = 0
+            for table in TRACKED:
+                last_id, rows = self._read(connection, table)
+                if rows:
+                    self._fold(table, rows)
+                self.last_ids[table] = last_id
+                folded += len(rows)
+            self.loaded = True
+            self.groups += folded
+            self.refresh_seconds += time.perf_counter() - started
+            return folded
+
+    # Helper method to sum a table's columns over the hours [start, end),
+    # either bound None for unbounded: whole segments are read from their root
+    def _range_sum(self, table, start, end):
+        total = np.zeros(self.columns[table], np.int64)
+        for segment, tree in self.trees[table].items():
+            first = segment * SEGMENT_HOURS
+            low = 0 if start is None else min(max(start - first, 0), SEGMENT_HOURS)
+            high = SEGMENT_HOURS if end is None else min(max(end - first, 0), SEGMENT_HOURS)
+            if low >= high:
+                continue
+            total += tree.total() if (low, high) == (0, SEGMENT_HOURS) else tree.range_sum(low, high)
+        return total
+
+    def sums(self, table, requested=DateRange(), dimensions=()):
+        """
+        Return the sums of `table`'s rollup measures (in ROLLUPS order) over a
+        DateRange as {key: [measures]}: key () for the overall totals, the
+        value for one dimension, a tuple of values for a pair, with '' read
+        back as None. Values without rows in the range are left out.
+
+        Returns None for bounds inside an hour, for dimensions that are not
+        TRACKED, and before the first refresh: callers then fall back to SQL.
+        """
+        dimensions = tuple(dimensions)
+        if requested.grain is None or (dimensions and dimensions not in TRACKED[table]):
+            return None
+        with self._lock:
+            if not self.loaded:
+                return None
+            self.queries += 1
+            measures = len(ROLLUPS[table]["measures"])
+            scales = SCALES[table]
+            count = list(ROLLUPS[table]["measures"].values()).index("COUNT(*)")
+            start = epoch_seconds(requested.start) // RESOLUTION if requested.start is not None else None
+            end = epoch_seconds(requested.end) // RESOLUTION if requested.end is not None else None
+            totals = self._range_sum(table, start, end)
+            result = {}
+            for (group, values), column in self.series[table].items():
+                if group != dimensions or (dimensions and totals[column + count] == 0):
+                    continue
+                values = tuple(value if value != "" else None for value in values)
+                key = values[0] if len(values) == 1 else values
+                result[key] = [value // scale if value % scale == 0 else value / scale
+                               for value, scale in zip(totals[column:column + measures].tolist(), scales)]
+            return result
+
+    def stats(self):
+        with self._lock:
+            segments = [segment for trees in self.trees.values() for segment in trees]
+            return {
+                "loaded": self.loaded,
+                "last_ids": dict(self.last_ids),
+                "groups": self.groups,
+                "refresh_seconds": round(self.refresh_seconds, 3),
+                "queries": self.queries,
+                "first_segment": epoch_text(min(segments) * SEGMENT_HOURS * RESOLUTION) if segments else None,
+                "resolution_seconds": RESOLUTION,
+                "segment_hours": SEGMENT_HOURS,
+                "tables": {
+                    table: {"segments": len(trees), "series": len(self.series[table]), "columns": self.columns[table],
+                            "bytes": sum(tree.tree.nbytes for tree in trees.values())}
+                    for table, trees in self.trees.items()
+                },
+                "bytes": sum(tree.tree.nbytes for trees in self.trees.values() for tree in trees.values()),
+            }
+
+
+def rollup_sums(fetch, table, requested=DateRange(), dimensions=()):
+    """
+    Return the sums RangeSums.sums() would, computed with SQL over the
+    rollups (or the raw rows for bounds inside an hour), running the query
+    through `fetch(query, params)`.
+    """
+    source, params = rollup_source(table, requested)
+    measures = ", ".join(f"SUM({measure})" for measure in ROLLUPS[table]["measures"])
+    if not dimensions:
+        row = fetch(f"SELECT {measures} FROM {source}", tuple(params))[0]
+        return {(): [value or 0 for value in row]}
+    keys = ", ".join(f"NULLIF({column}, '')" for column in dimensions)
+    rows = fetch(f"SELECT {keys}, {measures} FROM {source} GROUP BY {', '.join(dimensions)}", tuple(params))
+    return {(row[0] if len(dimensions) == 1 else tuple(row[:len(dimensions)])): list(row[len(dimensions):]) for row in rows}
+
+
+# Helper function to compare two sums() results, allowing for the rounding
+# of SQLite's floating-point SUM over fractional amounts
+def _same_sums(indexed, expected):
+    return indexed.keys() == expected.keys() and all(
+        math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+        for key in indexed for a, b in zip(indexed[key], expected[key])
+    )
+
+
+def verify(db_file, requested=DateRange()):
+    """
+    Build the trees over the whole database and compare every tracked sum
+    over a DateRange with the same sum from the rollups, timing both.
+    """
+    connection = sqlite3.connect(db_file)
+    sums = RangeSums()
+
+    def fetch(query, params):
+        return connection.execute(query, params).fetchall()
+
+    try:
+        started = time.perf_counter()
+        groups = sums.refresh(connection)
+        report = {"groups": groups, "build_seconds": round(time.perf_counter() - started, 3), "sums": {}}
+        for table, tracked in TRACKED.items():
+            for dimensions in [()] + tracked:
+                started = time.perf_counter()
+                indexed = sums.sums(table, requested, dimensions)
+                indexed_ms = (time.perf_counter() - started) * 1000
+                started = time.perf_counter()
+                expected = rollup_sums(fetch, table, requested, dimensions)
+                sql_ms = (time.perf_counter() - started) * 1000
+                report["sums"][f"{table}:{','.join(dimensions) or 'total'}"] = {
+                    "matches": _same_sums(indexed, expected),
+                    "tree_ms": round(indexed_ms, 3),
+                    "sql_ms": round(sql_ms, 3),
+                }
+        report["memory"] = sums.stats()
+    finally:
+        connection.close()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the in-memory range sums against the rollups")
+    parser.add_argument("command", choices=["verify"])
+    parser.add_argument("--db", default=DB_FILE, help="Path to the SQLite database")
+    parser.add_argument("--start-date", help="Start of the compared range (YYYY-MM-DD or ISO 8601, on the hour)")
+    parser.add_argument("--end-date", help="End of the compared range")
+    args = parser.parse_args()
+
+    print(json.dumps(verify(args.db, date_range(args.start_date, args.end_date)), indent=2))
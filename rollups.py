@@ -0,0 +1,141 @@
+import argparse
+import re
+import sqlite3
+
+from date_range import DateRange, bucket_clause, timestamp_clause, timestamp_text
+
+# Path to the SQLite database
+DB_FILE = "logs.db"
+
+# Bucket expressions per grain over the epoch-seconds timestamps; buckets are
+# UTC text in the API's timestamp format
+GRAINS = {
+    "hourly": "strftime('%Y-%m-%d %H:00:00', timestamp, 'unixepoch')",
+    "daily": "date(timestamp, 'unixepoch')",
+}
+
+# Rollup definitions per raw table: table prefix, dimension columns and measures
+ROLLUPS = {
+    "sales_metrics": {
+        "prefix": "sales",
+        "dimensions": ["salesperson", "product", "country", "endpoint"],
+        "measures": {"revenue": "SUM(revenue)", "profit": "SUM(profit)", "sales_count": "COUNT(*)"},
+    },
+    "leads": {
+        "prefix": "leads",
+        "dimensions": ["lead_source", "lead_status"],
+        "measures": {"lead_count": "COUNT(*)"},
+    },
+    "weblogs": {
+        "prefix": "weblogs",
+        "dimensions": ["endpoint", "country"],
+        "measures": {"visits": "COUNT(*)"},
+    },
+}
+
+
+def rollup_table(table, grain="daily"):
+    """
+    Return the name of the rollup table for a raw table at the given grain.
+    """
+    return f"{ROLLUPS[table]['prefix']}_rollup_{grain}"
+
+
+def create_rollup_tables(connection):
+    """
+    Create the hourly and daily rollup tables for every raw table.
+    Dimension values are stored as '' instead of NULL so they can be part of the key.
+    """
+    for table, rollup in ROLLUPS.items():
+        for grain in GRAINS:
+            dimensions = ", ".join(f"{column} TEXT NOT NULL" for column in rollup["dimensions"])
+            measures = ", ".join(f"{measure} INTEGER NOT NULL DEFAULT 0" for measure in rollup["measures"])
+            key = ", ".join(["bucket"] + rollup["dimensions"])
+            connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS {rollup_table(table, grain)} (
+                bucket TEXT NOT NULL,
+                {dimensions},
+                {measures},
+                PRIMARY KEY ({key})
+            )
+            """)
+
+
+def refresh_rollups(connection, table, after_id=0, grains=GRAINS):
+    """
+    Fold raw rows of `table` with id > after_id into its rollup tables.
+    Run it in the same transaction as the inserts to keep rollups consistent.
+    `grains` maps each grain to its bucket expression over the raw rows.
+    """
+    rollup = ROLLUPS[table]
+    dimensions = rollup["dimensions"]
+    measures = list(rollup["measures"])
+    for grain, bucket in grains.items():
+        select_dimensions = ", ".join(f"IFNULL({column}, '')" for column in dimensions)
+        select_measures = ", ".join(rollup["measures"].values())
+        updates = ", ".join(f"{measure} = {measure} + excluded.{measure}" for measure in measures)
+        connection.execute(f"""
+        INSERT INTO {rollup_table(table, grain)} (bucket, {", ".join(dimensions)}, {", ".join(measures)})
+        SELECT {bucket}, {select_dimensions}, {select_measures}
+        FROM {table}
+        WHERE id > ? AND timestamp IS NOT NULL
+        GROUP BY 1, {", ".join(str(i + 2) for i in range(len(dimensions)))}
+        ON CONFLICT ({", ".join(["bucket"] + dimensions)}) DO UPDATE SET {updates}
+        """, (after_id,))
+
+
+def rebuild_rollups(connection, tables=None, grains=GRAINS):
+    """
+    Regenerate the rollup tables for `tables` (default: all) from raw data.
+    """
+    for table in tables or ROLLUPS:
+        for grain in grains:
+            connection.execute(f"DELETE FROM {rollup_table(table, grain)}")
+        refresh_rollups(connection, table, grains=grains)
+
+
+# Helper function to turn a rollup measure into the per-row value it aggregates
+def raw_measure(expression):
+    argument = re.fullmatch(r"(?:SUM|COUNT)\((.*)\)", expression).group(1)
+    return "1" if argument == "*" else argument
+
+
+def rollup_source(table, requested=DateRange()):
+    """
+    Return (source, params) for reading `table`'s measures over a DateRange.
+
+    The source is a FROM-clause expression with the rollup's columns
+    (bucket, dimensions, measures): the coarsest rollup whose buckets the
+    bounds align to, narrowed on its bucket key, or, for bounds inside an
+    hour, a subquery presenting the raw rows in the same shape (each row its
+    own bucket, its timestamp as text, NULL dimensions as '', COUNT measures
+    as 1) bounded on the indexed timestamp column. Queries written against it - SUM(measure),
+    GROUP BY dimension - give the same answer either way.
+    """
+    grain = requested.grain
+    if grain is not None:
+        if requested.start is None and requested.end is None:
+            return rollup_table(table, grain), []
+        clause, params = bucket_clause(requested, grain)
+        return f"(SELECT * FROM {rollup_table(table, grain)} WHERE 1=1{clause})", params
+
+    rollup = ROLLUPS[table]
+    columns = [f"{timestamp_text()} AS bucket"]
+    columns += [f"IFNULL({column}, '') AS {column}" for column in rollup["dimensions"]]
+    columns += [f"{raw_measure(expression)} AS {measure}" for measure, expression in rollup["measures"].items()]
+    clause, params = timestamp_clause(requested)
+    return f"(SELECT {', '.join(columns)} FROM {table} WHERE 1=1{clause})", params
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the KPI rollup tables")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--db", default=DB_FILE, help="Path to the SQLite database")
+    parser.add_argument("--table", action="append", choices=list(ROLLUPS), help="Only rebuild rollups for this raw table")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    with conn:
+        rebuild_rollups(conn, args.table)
+    conn.close()
+    print(f"Rebuilt rollups for {', '.join(args.table or ROLLUPS)}.")
@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, IPvAnyAddress, field_validator
+
+from date_range import epoch_seconds
+
+# Most records one ingest request may carry; larger pushes are split by the sender
+MAX_INGEST_RECORDS = 10000
+
+
+class IngestRecord(BaseModel):
+    """
+    Base for one pushed row. Unknown fields are rejected so a typo in a
+    sender's payload fails loudly instead of silently dropping a column.
+    """
+
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
+    timestamp: datetime
+
+    @field_validator("timestamp")
+    @classmethod
+    def timestamp_not_in_future(cls, value):
+        now = datetime.now(timezone.utc)
+        aware = value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+        if (aware - now).total_seconds() > 300:
+            raise ValueError("timestamp is more than 5 minutes in the future")
+        return value
+
+
+class SaleRecord(IngestRecord):
+    product: str = Field(min_length=1, max_length=100)
+    salesperson: str = Field(min_length=1, max_length=100)
+    revenue: float = Field(ge=0)
+    profit: float
+    country: Optional[str] = Field(None, max_length=100)
+    endpoint: Optional[str] = Field(None, max_length=200)
+
+    def as_row(self):
+        """
+        Return the row in storage.SALES_COLUMNS order.
+        """
+        return (epoch_seconds(self.timestamp), self.product, self.salesperson, self.revenue, self.profit, self.country, self.endpoint)
+
+
+class LeadRecord(IngestRecord):
+    lead_source: str = Field(min_length=1, max_length=100)
+    lead_status: str = Field(min_length=1, max_length=50)
+
+    def as_row(self):
+        """
+        Return the row in storage.LEAD_COLUMNS order.
+        """
+        return (epoch_seconds(self.timestamp), self.lead_source, self.lead_status)
+
+
+class WeblogRecord(IngestRecord):
+    ip: IPvAnyAddress
+    country: Optional[str] = Field(None, max_length=100, description="Resolved from the IP at flush time when omitted")
+    endpoint: str = Field(min_length=1, max_length=200)
+    method: Literal["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"]
+    status_code: int = Field(ge=100, le=599)
+    response_time_ms: float = Field(ge=0)
+    user_agent: str = Field("", max_length=500)
+
+    def as_row(self):
+        """
+        Return the row in storage.WEBLOG_COLUMNS order.
+        """
+        return (epoch_seconds(self.timestamp), str(self.ip), self.country, self.endpoint, self.method,
+                self.status_code, self.response_time_ms, self.user_agent)
+
+
+class SalesBatch(BaseModel):
+    records: List[SaleRecord] = Field(min_length=1, max_length=MAX_INGEST_RECORDS)
+
+
+class LeadsBatch(BaseModel):
+    records: List[LeadRecord] = Field(min_length=1, max_length=MAX_INGEST_RECORDS)
+
+
+class WeblogsBatch(BaseModel):
+    records: List[WeblogRecord] = Field(min_length=1, max_length=MAX_INGEST_RECORDS)
+
+
+class IngestAccepted(BaseModel):
+    table: str
+    accepted: int
+    buffered_rows: int
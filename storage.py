@@ -0,0 +1,106 @@
+from date_range import epoch_seconds
+from dimensions import ENCODED_TABLES, DimensionEncoder, fact_table, stored_columns
+from latency_histograms import refresh_histograms
+from rollups import refresh_rollups
+from visitor_sketches import refresh_sketches
+
+# Column order of the row tuples accepted by insert_logs
+SALES_COLUMNS = ("timestamp", "product", "salesperson", "revenue", "profit", "country", "endpoint")
+LEAD_COLUMNS = ("timestamp", "lead_source", "lead_status")
+WEBLOG_COLUMNS = ("timestamp", "ip", "country", "endpoint", "method", "status_code", "response_time_ms", "user_agent")
+
+# Value -> key cache of the dimension tables, shared by every write path
+dimension_encoder = DimensionEncoder()
+
+# Callbacks notified with the insert_logs summary after each committed write
+_commit_listeners = []
+
+
+def add_commit_listener(callback):
+    """
+    Register `callback(changes)` to run after every committed write, where
+    `changes` maps each written table to its insert_logs summary.
+    """
+    _commit_listeners.append(callback)
+
+
+def publish_commit(changes):
+    """
+    Notify the commit listeners. Call it only after the transaction committed.
+    """
+    if not changes:
+        return
+    for callback in _commit_listeners:
+        callback(changes)
+
+
+# Helper function to store each row's timestamp (its first column) as epoch seconds
+def _epoch_rows(rows):
+    return [row if type(row[0]) is int else (epoch_seconds(row[0]),) + tuple(row[1:]) for row in rows]
+
+
+def _insert(connection, table, columns, rows):
+    placeholders = ", ".join("?" for _ in columns)
+    connection.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+        rows,
+    )
+
+
+# Helper function to compute the KPI totals a batch of rows adds to
+def _kpi_deltas(table, rows):
+    if table == "sales_metrics":
+        return {
+            "sales": len(rows),
+            "revenue": sum(row[3] or 0 for row in rows),
+            "profit": sum(row[4] or 0 for row in rows),
+            "demo_requests": sum(1 for row in rows if row[6] == "/demo"),
+        }
+    if table == "leads":
+        return {
+            "leads": len(rows),
+            "closed": sum(1 for row in rows if row[2] == "Closed"),
+        }
+    return {"visits": len(rows)}
+
+
+def insert_logs(connection, sales_logs=(), lead_logs=(), web_logs=()):
+    """
+    Insert sales, lead and web log rows and fold them into the rollup tables
+    (and web log visitors into the visitor sketches).
+    Must run inside the caller's write transaction, so raw rows and rollups
+    commit together. Rows are tuples in SALES_COLUMNS / LEAD_COLUMNS /
+    WEBLOG_COLUMNS order; timestamps may be epoch seconds, datetimes or
+    ISO 8601 text and are stored as epoch seconds. Dictionary-encoded
+    columns are stored as keys, interned through dimension_encoder.
+    Returns, for publish_commit, {table: summary} where the summary holds
+    the row count, the id range of the new rows and the KPI totals they add.
+    """
+    batches = [
+        ("sales_metrics", SALES_COLUMNS, sales_logs),
+        ("leads", LEAD_COLUMNS, lead_logs),
+        ("weblogs", WEBLOG_COLUMNS, web_logs),
+    ]
+    changes = {}
+    if any(rows for _, _, rows in batches):
+        dimension_encoder.confirm(connection)
+    for table, columns, rows in batches:
+        if not rows:
+            continue
+        # The writer holds the write lock, so every id above this mark is ours
+        last_id = connection.execute(f"SELECT IFNULL(MAX(id), 0) FROM {fact_table(table)}").fetchone()[0]
+        stored = _epoch_rows(rows)
+        if table in ENCODED_TABLES:
+            stored = dimension_encoder.encode_rows(connection, table, columns, stored)
+        _insert(connection, fact_table(table), stored_columns(table, columns), stored)
+        refresh_rollups(connection, table, last_id)
+        if table == "weblogs":
+            refresh_sketches(connection, last_id)
+            refresh_histograms(connection, last_id)
+        changes[table] = {
+            "rows": len(rows),
+            "first_id": last_id + 1,
+            "last_id": last_id + len(rows),
+            "deltas": _kpi_deltas(table, rows),
+        }
+    return changes
@@ -1,14 +1,34 @@
 import streamlit as st
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 from datetime import datetime
 import time
 import plotly.io as pio
+import pyarrow as pa
 from fpdf import fpdf
 
 API_BASE_URL = "https://m-dashboard-dqs0.onrender.com"
 
+# Fetch layer tuning
+FETCH_WORKERS = 8              # concurrent API requests per dashboard process
+FETCH_CACHE_TTL_SECONDS = 60   # safety net; the change feed decides what to refetch
+FETCH_CACHE_SIZE = 256
+CHANGE_WAIT_SECONDS = 25       # how long one /changes long-poll stays parked
+
+# /kpis/summary sections and the tables they are computed from
+SUMMARY_SECTION_TABLES = {
+    "sales": {"sales_metrics"},
+    "leads": {"leads"},
+    "weblogs": {"weblogs"},
+    "conversion": {"sales_metrics", "leads"},
+}
+
 st.set_page_config(page_title="AI-SOLUTIONS SALES DASHBOARD", layout="wide")
 st.markdown("""
     <style>
@@ -21,15 +41,99 @@ st.markdown("""
 
 st.title("📊 AI-SOLUTIONS SALES DASHBOARD")
 
-# API Fetch Function
-def fetch_data(endpoint, params=None):
+# Shared keep-alive session, reused across reruns and worker threads
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# Thread pool for issuing independent API requests concurrently
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="api-fetch")
+
+# TTL cache of JSON responses keyed by endpoint and params
+@st.cache_resource
+def get_response_cache():
+    return TTLCache(maxsize=FETCH_CACHE_SIZE, ttl=FETCH_CACHE_TTL_SECONDS), threading.Lock()
+
+# API Fetch Function (fresh=True skips the cached copy, e.g. after a write)
+def fetch_data(endpoint, params=None, fresh=False):
+    cache, lock = get_response_cache()
+    key = (endpoint, tuple(sorted((params or {}).items())))
+    with lock:
+        if not fresh and key in cache:
+            return cache[key]
     try:
-        response = requests.get(f"{API_BASE_URL}{endpoint}", params=params)
+        response = get_session().get(f"{API_BASE_URL}{endpoint}", params=params)
         response.raise_for_status()
-        return response.json()
+        data = response.json()
     except requests.RequestException as e:
         print("API request failed", e)
         return None
+    with lock:
+        cache[key] = data
+    return data
+
+# Fetch several endpoints at once: {name: (endpoint, params)} -> {name: data}
+def fetch_many(requests_by_name, fresh=False):
+    executor = get_executor()
+    futures = {
+        name: executor.submit(fetch_data, endpoint, params, fresh)
+        for name, (endpoint, params) in requests_by_name.items()
+    }
+    return {name: future.result() for name, future in futures.items()}
+
+# Bulk fetch: ask for an Arrow IPC stream and read it straight into pandas
+def fetch_frame(endpoint, params=None):
+    try:
+        response = get_session().get(
+            f"{API_BASE_URL}{endpoint}",
+            params=params,
+            headers={"Accept": "application/vnd.apache.arrow.stream"},
+        )
+        response.raise_for_status()
+        return pa.ipc.open_stream(response.content).read_pandas()
+    except (requests.RequestException, pa.ArrowInvalid) as e:
+        print("API request failed", e)
+        return None
+
+# Streamed export: write the response to disk chunk by chunk
+def download_stream(endpoint, params, file_path):
+    try:
+        with get_session().get(f"{API_BASE_URL}{endpoint}", params=params, stream=True) as response:
+            response.raise_for_status()
+            with open(file_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+        return True
+    except requests.RequestException as e:
+        print("API request failed", e)
+        return False
+
+# Long-poll the change feed. Returns the tables written since the previous call,
+# an empty set when nothing was written within `wait` seconds, or None when the
+# dashboard should reload everything (first call, feed reset or API error)
+def poll_changes(wait):
+    cursor = st.session_state.get("change_cursor")
+    params = {"wait": wait}
+    if cursor is not None:
+        params["since"] = cursor
+    try:
+        response = get_session().get(f"{API_BASE_URL}/changes", params=params, timeout=wait + 10)
+        response.raise_for_status()
+        feed = response.json()
+    except requests.RequestException as e:
+        print("API request failed", e)
+        time.sleep(10)
+        return None
+    st.session_state["change_cursor"] = feed["cursor"]
+    if cursor is None or feed["reset"]:
+        return None
+    return {table for event in feed["events"] for table in event["tables"]}
 
 # Metric Renderer
 def render_metric(title, value):
@@ -62,9 +166,8 @@ def render_dashboard():
 
     if apply_filter:
         with st.spinner("Fetching filtered sales data..."):
-            data = fetch_data("/filter-sales", params=params)
-            if data and "results" in data and data["results"]:
-                df = pd.DataFrame(data["results"])
+            df = fetch_frame("/filter-sales", params=params)
+            if df is not None and not df.empty:
                 st.session_state["filtered_df"] = df  # Store in session
                 st.dataframe(df)
 
@@ -93,22 +196,32 @@ def render_dashboard():
         # Add title
         pdf.cell(200, 10, "Sales Dashboard Report", ln=True, align='C')
 
+        # Fetch the selected metrics concurrently
+        report_endpoints = {
+            "Total Revenue": "/kpis/total-revenue",
+            "Total Profit": "/kpis/total-sales-profit",
+            "Best Salesperson": "/kpis/best-salesperson",
+            "Most Sold Product": "/kpis/most-sold-product",
+            "Sales by Country": "/kpis/sales-per-country",
+        }
+        report_data = fetch_many({metric: (report_endpoints[metric], None) for metric in selected_metrics}, fresh=True)
+
         # Add selected metrics
         for metric in selected_metrics:
             if metric == "Total Revenue":
-                total_revenue = fetch_data("/kpis/total-revenue")
+                total_revenue = report_data[metric]
                 pdf.cell(200, 10, f"Total Revenue: ${total_revenue['total_revenue']:,}" if total_revenue else "N/A", ln=True)
             elif metric == "Total Profit":
-                total_profit = fetch_data("/kpis/total-sales-profit")
+                total_profit = report_data[metric]
                 pdf.cell(200, 10, f"Total Profit: ${total_profit['total_sales_profit']:,}" if total_profit else "N/A", ln=True)
             elif metric == "Best Salesperson":
-                best_salesperson = fetch_data("/kpis/best-salesperson")
+                best_salesperson = report_data[metric]
                 pdf.cell(200, 10, f"Best Salesperson: {best_salesperson['salesperson']}" if best_salesperson else "N/A", ln=True)
             elif metric == "Most Sold Product":
-                most_sold_product = fetch_data("/kpis/most-sold-product")
+                most_sold_product = report_data[metric]
                 pdf.cell(200, 10, f"Most Sold Product: {most_sold_product['product']}" if most_sold_product else "N/A", ln=True)
             elif metric == "Sales by Country":
-                sales_per_country = fetch_data("/kpis/sales-per-country")
+                sales_per_country = report_data[metric]
                 if sales_per_country and "sales_per_country" in sales_per_country:
                     sales_by_country_str = "\n".join([f"{row['country']}: ${row['total_revenue']:,}" for row in sales_per_country["sales_per_country"]])
                     pdf.multi_cell(0, 10, f"Sales by Country:\n{sales_by_country_str}", align='L')
@@ -131,13 +244,9 @@ def render_dashboard():
             #Download CSV Report
     st.sidebar.markdown("### 📥 Download CSV Report")
     if st.sidebar.button("Download CSV Report"):
-        # Fetch the data again
-        data = fetch_data("/filter-sales", params=params)
-        if data and "results" in data and data["results"]:
-            df = pd.DataFrame(data["results"])
-            csv_file_path = "sales_dashboard_report.csv"
-            df.to_csv(csv_file_path, index=False)
-
+        # Stream the filtered rows straight to disk as CSV
+        csv_file_path = "sales_dashboard_report.csv"
+        if download_stream("/filter-sales/stream", {**params, "format": "csv"}, csv_file_path):
             # Provide download link
             with open(csv_file_path, "rb") as f:
                 st.sidebar.download_button(
@@ -151,24 +260,45 @@ def render_dashboard():
 
 
 
-    # Fetch data from the API
-    total_revenue = fetch_data("/kpis/total-revenue")
-    total_profit = fetch_data("/kpis/total-sales-profit")
-    profit_per_salesperson = fetch_data("/kpis/profit-per-salesperson")
-    sales_per_country = fetch_data("/kpis/sales-per-country")
-    product_sales_per_country = fetch_data("/kpis/product-sales-per-country", params={"start_date": start_date, "end_date": end_date})
-    best_salesperson = fetch_data("/kpis/best-salesperson", params={"start_date": start_date, "end_date": end_date})
-    most_sold_product = fetch_data("/kpis/most-sold-product", params={"start_date": start_date, "end_date": end_date})
-    conversion_rate_data = fetch_data("/kpis/conversion-rate", params={"start_date": start_date, "end_date": end_date})
-    product_data = fetch_data("/kpis/total-revenue-profit-product", params={"start_date": start_date, "end_date": end_date})
-    website_visits_data = fetch_data("/kpis/total-website-visits", params={"start_date": start_date, "end_date": end_date})
-    unique_visitors_data = fetch_data("/kpis/unique-visitors", params={"start_date": start_date, "end_date": end_date})
-    demo_requests_data = fetch_data("/kpis/demo-requests", params={"start_date": start_date, "end_date": end_date})
-    top_landing_pages_data = fetch_data("/kpis/top-landing-pages", {**params, "limit": 5})
-    leads_generated_data = fetch_data("/kpis/leads-generated", params)
-    leads_by_source_data = fetch_data("/kpis/leads-by-source", params)
-    leads_by_status_data = fetch_data("/kpis/leads-by-status", params)
-    lead_conversion_rate_data = fetch_data("/kpis/lead-conversion-rate", params)
+    # Refetch only the summary sections whose tables the change feed reported
+    # (everything on first load, new dates or a feed reset), in one round trip,
+    # concurrently with the leads timeline rendered by render_leads_by_day
+    # (its response lands in the TTL cache)
+    summary_params = {"start_date": start_date, "end_date": end_date, "limit": 5}
+    changed = st.session_state.pop("changed_tables", set())
+    if st.session_state.get("summary_params") != summary_params:
+        changed = None
+    stale_sections = [
+        section for section, tables in SUMMARY_SECTION_TABLES.items()
+        if changed is None or tables & changed
+    ]
+    to_fetch = {}
+    if stale_sections:
+        to_fetch["summary"] = ("/kpis/summary", {**summary_params, "sections": ",".join(stale_sections)})
+    if changed is None or "leads" in changed:
+        to_fetch["leads_by_day"] = ("/kpis/leads-by-day", {})
+    fetched = fetch_many(to_fetch, fresh=True)
+    summary = st.session_state.setdefault("summary", {})
+    if fetched.get("summary") is not None:
+        summary.update(fetched["summary"])
+        st.session_state["summary_params"] = summary_params
+    total_revenue = summary.get("total_revenue")
+    total_profit = summary.get("total_sales_profit")
+    profit_per_salesperson = summary.get("profit_per_salesperson")
+    sales_per_country = summary.get("sales_per_country")
+    product_sales_per_country = summary.get("product_sales_per_country")
+    best_salesperson = summary.get("best_salesperson")
+    most_sold_product = summary.get("most_sold_product")
+    conversion_rate_data = summary.get("conversion_rate")
+    product_data = summary.get("total_revenue_profit_product")
+    website_visits_data = summary.get("total_website_visits")
+    unique_visitors_data = summary.get("unique_visitors")
+    demo_requests_data = summary.get("demo_requests")
+    top_landing_pages_data = summary.get("top_landing_pages")
+    leads_generated_data = summary.get("leads_generated")
+    leads_by_source_data = summary.get("leads_by_source")
+    leads_by_status_data = summary.get("leads_by_status")
+    lead_conversion_rate_data = summary.get("lead_conversion_rate")
     
 
     # Set the background color
@@ -397,7 +527,6 @@ def render_dashboard():
 
     with col3:
         if lead_conversion_rate_data and isinstance(lead_conversion_rate_data.get("lead_conversion_rate"), (int, float, float)):
-         import plotly.graph_objects as go
          lead_conversion_rate = lead_conversion_rate_data["lead_conversion_rate"]
          fig_gauge = go.Figure(go.Indicator(
             mode="gauge+number",
@@ -514,16 +643,47 @@ def render_leads_by_day(params):
     else:
         st.info("No data for Leads per Day in this period.")
 
+# --- Response Times: Latency Heatmap ---
+def render_response_times(params):
+    response_times = fetch_data("/kpis/response-times", {**params, "interval": "daily"})
+    if response_times and response_times["histogram"]["buckets"]:
+        overall = response_times["response_times"]
+        histogram = response_times["histogram"]
+        fig_heatmap = go.Figure(go.Heatmap(
+            x=[bucket["bucket"] for bucket in histogram["buckets"]],
+            y=[f"{lower:g}-{upper:g} ms" for lower, upper in histogram["bins"]],
+            z=[list(row) for row in zip(*(bucket["counts"] for bucket in histogram["buckets"]))],
+            colorscale="Viridis",
+        ))
+        fig_heatmap.update_layout(
+            title=f"Response Times (p50 {overall['p50']} ms, p95 {overall['p95']} ms, p99 {overall['p99']} ms)",
+            paper_bgcolor="#061007", plot_bgcolor="#061007", font_color="#D1CFC9", height=400,
+            margin=dict(l=5, r=5, t=35, b=0),
+        )
+        st.plotly_chart(fig_heatmap, use_container_width=True)
+    else:
+        st.info("No data for Response Times in this period.")
+
 # --- Download PDF Report ---
 # Allow user to select which metrics to export
 
 
-# Auto-refresh every 10 seconds
+# Take the change-feed cursor before the first fetch so no write is missed
+if "change_cursor" not in st.session_state:
+    poll_changes(0)
+
+render_dashboard()
+# Use the same params as in render_dashboard
+params = {}
+# Optionally, set default params or retrieve from session state if needed
+render_leads_by_day(params)
+render_response_times(params)
+
+# Auto-refresh when the API reports a write; an idle dashboard just keeps one
+# long-poll parked on /changes
 while True:
-    render_dashboard()
-    # Use the same params as in render_dashboard
-    params = {}
-    # Optionally, set default params or retrieve from session state if needed
-    render_leads_by_day(params)
-    time.sleep(10)
-    st.rerun()
+    changed = poll_changes(CHANGE_WAIT_SECONDS)
+    if changed != set():
+        break
+st.session_state["changed_tables"] = changed
+st.rerun()
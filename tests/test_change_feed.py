@@ -0,0 +1,51 @@
+import asyncio
+
+from change_feed import ChangeFeed
+
+
+def test_since_returns_the_events_after_a_cursor():
+    feed = ChangeFeed()
+    start = feed.cursor
+    first = feed.publish({"weblogs": {"rows": 1}})
+    second = feed.publish({"sales_metrics": {"rows": 2}})
+
+    events, latest, reset = feed.since(start)
+    assert [event["cursor"] for event in events] == [first["cursor"], second["cursor"]] == [start + 1, start + 2]
+    assert (latest, reset) == (start + 2, False)
+    assert feed.since(first["cursor"])[0] == [second]
+    assert feed.since(latest) == ([], latest, False)
+
+
+def test_no_cursor_returns_the_current_one():
+    feed = ChangeFeed()
+    feed.publish({"leads": {"rows": 1}})
+    assert feed.since(None) == ([], feed.cursor, False)
+
+
+def test_unknown_or_evicted_cursor_resets():
+    feed = ChangeFeed(capacity=3)
+    start = feed.cursor
+    for rows in range(5):
+        feed.publish({"weblogs": {"rows": rows}})
+    latest = feed.cursor
+
+    # Two events fell out of the buffer: a client behind them must reload
+    assert feed.since(start) == ([], latest, True)
+    assert feed.since(start + 1) == ([], latest, True)
+    assert len(feed.since(start + 2)[0]) == 3
+    assert feed.since(latest + 1) == ([], latest, True)
+    assert feed.since(-1) == ([], latest, True)
+
+
+def test_wait_wakes_on_publish():
+    feed = ChangeFeed()
+    cursor = feed.cursor
+
+    async def scenario():
+        waiting = asyncio.create_task(feed.wait(cursor, 5))
+        await asyncio.sleep(0.05)
+        await asyncio.to_thread(feed.publish, {"weblogs": {"rows": 1}})
+        return await asyncio.wait_for(waiting, 2)
+
+    events, latest, reset = asyncio.run(scenario())
+    assert (len(events), latest, reset) == (1, cursor + 1, False)
@@ -0,0 +1,56 @@
+import pytest
+
+from date_range import DateRange, date_range, epoch_seconds, epoch_text, timestamp_clause
+
+
+@pytest.mark.parametrize("start_date, end_date, expected", [
+    (None, None, DateRange(None, None)),
+    ("2025-05-01", None, DateRange("2025-05-01 00:00:00", None)),
+    # An end date includes that whole day
+    ("2025-05-01", "2025-05-31", DateRange("2025-05-01 00:00:00", "2025-06-01 00:00:00")),
+    ("2025-05-01", "2025-05-01", DateRange("2025-05-01 00:00:00", "2025-05-02 00:00:00")),
+    # Date-times are exclusive ends, converted to UTC, naive ones taken as UTC
+    ("2025-05-01T06:30:00", "2025-05-01 18:15:00", DateRange("2025-05-01 06:30:00", "2025-05-01 18:15:00")),
+    ("2025-05-01T06:00:00Z", "2025-05-31T18:00:00+02:00", DateRange("2025-05-01 06:00:00", "2025-05-31 16:00:00")),
+    ("2025-05-01T00:30:00-01:00", None, DateRange("2025-05-01 01:30:00", None)),
+    ("2025-05-01T06:00:00.750", None, DateRange("2025-05-01 06:00:00", None)),
+])
+def test_date_range_parsing(start_date, end_date, expected):
+    assert date_range(start_date, end_date) == expected
+
+
+@pytest.mark.parametrize("start_date, end_date", [
+    ("2025-13-01", None),
+    ("yesterday", None),
+    (None, "2025-05-01 25:00"),
+    ("2025-05-02", "2025-05-01"),
+    ("2025-05-01T10:00:00", "2025-05-01T10:00:00"),
+])
+def test_malformed_or_inverted_bounds_are_rejected(start_date, end_date):
+    with pytest.raises(ValueError):
+        date_range(start_date, end_date)
+
+
+@pytest.mark.parametrize("requested, grain", [
+    (DateRange(), "daily"),
+    (date_range("2025-05-01", "2025-05-31"), "daily"),
+    (date_range("2025-05-01T06:00:00Z", None), "hourly"),
+    (date_range("2025-05-01", "2025-05-01T18:00:00"), "hourly"),
+    (date_range("2025-05-01T06:30:00", None), None),
+])
+def test_grain_is_the_coarsest_the_bounds_align_to(requested, grain):
+    assert requested.grain == grain
+
+
+def test_epoch_conversions_round_trip():
+    assert epoch_seconds("2025-05-09 08:59:46") == 1746781186
+    assert epoch_seconds("2025-05-09T10:59:46+02:00") == 1746781186
+    assert epoch_seconds(1746781186) == 1746781186
+    assert epoch_text(1746781186) == "2025-05-09 08:59:46"
+    assert epoch_seconds(None) is None and epoch_text(None) is None
+
+
+def test_timestamp_clause_bounds_the_bare_column():
+    clause, params = timestamp_clause(date_range("2025-05-01", "2025-05-01"))
+    assert clause == " AND timestamp >= ? AND timestamp < ?"
+    assert params == [epoch_seconds("2025-05-01 00:00:00"), epoch_seconds("2025-05-02 00:00:00")]
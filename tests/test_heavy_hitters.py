@@ -0,0 +1,109 @@
+import random
+import sqlite3
+from collections import Counter
+
+import pytest
+
+from heavy_hitters import HeavyHitters, SpaceSaving
+from migrations import apply_migrations
+
+
+# Helper function to draw a skewed stream: value n appears about 1/n as often as value 1
+def skewed_stream(count, values, seed):
+    rng = random.Random(seed)
+    return rng.choices([f"v{n}" for n in range(1, values + 1)], weights=[1 / n for n in range(1, values + 1)], k=count)
+
+
+# Helper function to check Space-Saving's guarantees against the exact counts
+def assert_bounds(summary, true_counts, total):
+    for value, count, error in summary.ranked():
+        assert count - error <= true_counts[value] <= count
+    for value, count in true_counts.items():
+        if count > total / summary.capacity:
+            assert value in summary.counts
+        if value not in summary.counts:
+            assert count <= summary.min_count
+
+
+def test_space_saving_bounds():
+    stream = skewed_stream(20000, 500, seed=1)
+    summary = SpaceSaving(50)
+    for value in stream:
+        summary.update(value)
+    assert len(summary) == 50
+    assert_bounds(summary, Counter(stream), len(stream))
+
+
+def test_weighted_updates_match_single_updates():
+    stream = skewed_stream(5000, 100, seed=2)
+    single, weighted = SpaceSaving(20), SpaceSaving(20)
+    for value in stream:
+        single.update(value)
+    for value, weight in Counter(stream).items():
+        weighted.update(value, weight)
+    assert_bounds(weighted, Counter(stream), len(stream))
+    assert [value for value, _, _ in single.ranked()[:3]] == [value for value, _, _ in weighted.ranked()[:3]]
+
+
+def test_merge_keeps_bounds_over_disjoint_streams():
+    streams = [skewed_stream(8000, 300, seed=seed) for seed in (3, 4, 5)]
+    summaries = []
+    for stream in streams:
+        summary = SpaceSaving(40)
+        for value in stream:
+            summary.update(value)
+        summaries.append(summary)
+    merged = SpaceSaving.merge(summaries, 40)
+    true_counts = Counter(value for stream in streams for value in stream)
+    assert len(merged) == 40
+    assert_bounds(merged, true_counts, sum(len(stream) for stream in streams))
+    assert merged.ranked()[0][0] == true_counts.most_common(1)[0][0]
+
+
+# Helper function to create a database with weblogs rows from these IPs
+def weblogs_database(db_file, ips):
+    apply_migrations(db_file)
+    connection = sqlite3.connect(db_file)
+    with connection:
+        connection.executemany(
+            "INSERT INTO weblogs (timestamp, ip, endpoint, method, status_code, response_time_ms, user_agent)"
+            " VALUES (?, ?, '/home', 'GET', 200, 100, 'curl/7.64.1')",
+            [(1746057600 + index, ip) for index, ip in enumerate(ips)],
+        )
+    return connection
+
+
+@pytest.fixture
+def databases(tmp_path):
+    first = weblogs_database(str(tmp_path / "first.db"), ["8.8.8.8", "1.1.1.1", "9.9.9.9"])
+    second = weblogs_database(str(tmp_path / "second.db"), ["4.4.4.4", "2.2.2.2", "3.3.3.3", "5.5.5.5"])
+    yield first, second
+    first.close()
+    second.close()
+
+
+def test_checkpoint_restores_on_its_own_database(tmp_path, databases):
+    first, _ = databases
+    path = str(tmp_path / "hh.json")
+    tracker = HeavyHitters()
+    tracker.refresh(first)
+    tracker.checkpoint(path)
+
+    restored = HeavyHitters()
+    assert restored.restore(first, path)
+    assert restored.last_id == 3
+    assert restored.top("ip", 3) == tracker.top("ip", 3)
+
+
+def test_checkpoint_from_another_database_is_rejected(tmp_path, databases):
+    first, second = databases
+    path = str(tmp_path / "hh.json")
+    tracker = HeavyHitters()
+    tracker.refresh(first)
+    tracker.checkpoint(path)
+
+    restored = HeavyHitters()
+    assert not restored.restore(second, path)
+    assert restored.last_id == 0
+    restored.refresh(second)
+    assert {value for value, _, _ in restored.top("ip", 10)} == {"4.4.4.4", "2.2.2.2", "3.3.3.3", "5.5.5.5"}
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import fastapi_app
+from ingest_buffer import WriteBehindBuffer
+
+RECORD = {"timestamp": "2025-05-01T10:00:00Z", "lead_source": "Website", "lead_status": "New"}
+
+
+# Helper function to wait for a condition the flush thread sets
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def client():
+    # No startup events: each test installs its own buffer
+    return TestClient(fastapi_app.app)
+
+
+def push(client, records):
+    return client.post("/ingest/leads", json={"records": [RECORD] * records})
+
+
+def test_full_buffer_answers_429(client, monkeypatch):
+    release = threading.Event()
+    flushed = []
+    buffer = WriteBehindBuffer(lambda sales, leads, weblogs: release.wait(5) and flushed.append(len(leads)),
+                               max_rows=3, flush_rows=1, flush_interval=0.01)
+    monkeypatch.setattr(fastapi_app, "ingest_buffer", buffer)
+    buffer.start()
+    try:
+        assert push(client, 2).status_code == 202
+        response = push(client, 2)
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+        assert buffer.stats()["rejected_rows"] == 2
+    finally:
+        release.set()
+        buffer.close()
+    assert flushed == [2]
+
+
+def test_failing_flushes_answer_503(client, monkeypatch):
+    def flush(sales, leads, weblogs):
+        raise RuntimeError("disk I/O error")
+
+    buffer = WriteBehindBuffer(flush, max_rows=3, flush_rows=1, flush_interval=0.01)
+    monkeypatch.setattr(fastapi_app, "ingest_buffer", buffer)
+    buffer.start()
+    try:
+        assert push(client, 2).status_code == 202
+        wait_until(lambda: buffer.stats()["failing"])
+        response = push(client, 2)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+        assert "disk I/O error" in response.json()["detail"]
+    finally:
+        buffer.close(timeout=1)
+
+
+def test_stopped_buffer_answers_503(client, monkeypatch):
+    monkeypatch.setattr(fastapi_app, "ingest_buffer", WriteBehindBuffer(lambda *batch: None))
+    response = push(client, 1)
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+
+def test_small_push_is_flushed_after_the_interval(monkeypatch):
+    flushed = []
+    buffer = WriteBehindBuffer(lambda sales, leads, weblogs: flushed.append(len(leads)),
+                               flush_rows=1000, flush_interval=0.05)
+    buffer.start()
+    try:
+        buffer.submit("leads", [("2025-05-01 10:00:00", "Website", "New")])
+        wait_until(lambda: flushed)
+    finally:
+        buffer.close()
+    assert flushed == [1]
@@ -0,0 +1,53 @@
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+
+import fastapi_app
+from date_range import date_range
+from generate_dataset import generate_database
+from latency_histograms import MAX_HEATMAP_BUCKETS, heatmap
+
+
+@pytest.fixture(scope="module")
+def db_file(tmp_path_factory):
+    # 92 days: 2208 hourly buckets, more than one heatmap may hold
+    db_file = str(tmp_path_factory.mktemp("histograms") / "histograms.db")
+    generate_database(db_file, 5000, start="2025-01-01", days=92, tables=["weblogs"])
+    return db_file
+
+
+@pytest.fixture(scope="module")
+def client(db_file):
+    fastapi_app.use_database(db_file)
+    yield TestClient(fastapi_app.app)
+    fastapi_app.pool.close()
+
+
+def test_default_request_falls_back_to_daily_buckets(client):
+    response = client.get("/kpis/response-times")
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["response_times"]["count"] == 5000
+    assert body["response_times"]["p50"] is not None
+    assert body["histogram"]["interval"] == "daily"
+    assert body["histogram"]["truncated"] is False
+    assert 90 <= len(body["histogram"]["buckets"]) <= 93
+
+
+def test_interval_that_fits_is_kept(client):
+    response = client.get("/kpis/response-times", params={"start_date": "2025-01-01", "end_date": "2025-01-08",
+                                                          "interval": "hourly"})
+    assert response.status_code == 200, response.text
+    assert response.json()["histogram"]["interval"] == "hourly"
+
+
+def test_range_too_long_for_daily_buckets_is_truncated(db_file):
+    connection = sqlite3.connect(db_file)
+    try:
+        grain, truncated, rows = heatmap(lambda query, params: connection.execute(query, params).fetchall(),
+                                         date_range("2020-01-01", "2026-01-01"), "minutely")
+    finally:
+        connection.close()
+    assert (grain, truncated) == ("daily", True)
+    assert 0 < len(rows) <= MAX_HEATMAP_BUCKETS
@@ -0,0 +1,80 @@
+import sqlite3
+
+from date_range import epoch_seconds
+from latency_histograms import histogram_table
+from migrations import MIGRATIONS, apply_migrations, current_version
+from rollups import rollup_table
+from visitor_sketches import estimate, merge, sketch_table
+
+LATEST = max(version for version, description, func in MIGRATIONS)
+
+# Both text formats version 1 databases were written with
+WEBLOGS = [
+    ("2025-05-09 08:59:46", "2025-05-09 08:59:46", "10.0.0.1", "DE", "/api/products", "GET", 200, 120, "curl"),
+    ("2025-05-09T09:15:00", "2025-05-09T09:15:00", "10.0.0.2", None, "/api/orders", "POST", 500, 2400, "curl"),
+    ("2025-05-10 23:59:59", "2025-05-10 23:59:59", "10.0.0.1", "FR", "/api/products", "GET", 404, 35, None),
+]
+SALES = [
+    ("2025-05-09 08:59:46", "Laptop", "Alice", 1200, 300, "DE", "/api/orders"),
+    ("2025-05-10T12:00:00", "Phone", "Bob", 800, -50, None, "/api/orders"),
+]
+LEADS = [
+    ("2025-05-09 08:59:46", "Website", "New"),
+    ("2025-05-11T00:00:00", "Referral", "Won"),
+]
+
+
+# Helper function to build a version 1 database holding text timestamps
+def legacy_database(db_file):
+    assert apply_migrations(db_file, target=1) == [1]
+    connection = sqlite3.connect(db_file)
+    connection.executemany(
+        "INSERT INTO weblogs (timestamp, access_time, ip, country, endpoint, method, status_code, "
+        "response_time_ms, user_agent) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", WEBLOGS)
+    connection.executemany(
+        "INSERT INTO sales_metrics (timestamp, product, salesperson, revenue, profit, country, endpoint) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)", SALES)
+    connection.executemany("INSERT INTO leads (timestamp, lead_source, lead_status) VALUES (?, ?, ?)", LEADS)
+    connection.commit()
+    connection.close()
+
+
+def test_legacy_database_migrates_to_the_latest_version(tmp_path):
+    db_file = str(tmp_path / "legacy.db")
+    legacy_database(db_file)
+
+    assert apply_migrations(db_file) == list(range(2, LATEST + 1))
+    assert apply_migrations(db_file) == []
+
+    connection = sqlite3.connect(db_file)
+    try:
+        assert current_version(connection) == LATEST
+        weblogs = connection.execute(
+            "SELECT timestamp, ip, country, endpoint, method, status_code, response_time_ms, user_agent "
+            "FROM weblogs ORDER BY id").fetchall()
+        assert weblogs == [(epoch_seconds(row[0]),) + row[2:] for row in WEBLOGS]
+        sales = connection.execute(
+            "SELECT timestamp, product, salesperson, revenue, profit, country, endpoint "
+            "FROM sales_metrics ORDER BY id").fetchall()
+        assert sales == [(epoch_seconds(row[0]),) + row[1:] for row in SALES]
+        leads = connection.execute("SELECT timestamp, lead_source, lead_status FROM leads ORDER BY id").fetchall()
+        assert leads == [(epoch_seconds(row[0]),) + row[1:] for row in LEADS]
+        assert "access_time" not in [column[1] for column in connection.execute("PRAGMA table_info(weblogs)")]
+
+        for table, rows in (("weblogs", WEBLOGS), ("sales_metrics", SALES), ("leads", LEADS)):
+            for grain in ("hourly", "daily"):
+                count_column = {"weblogs": "visits", "sales_metrics": "sales_count", "leads": "lead_count"}[table]
+                total = connection.execute(f"SELECT SUM({count_column}) FROM {rollup_table(table, grain)}").fetchone()
+                assert total == (len(rows),)
+        revenue = connection.execute(f"SELECT SUM(revenue), SUM(profit) FROM {rollup_table('sales_metrics')}").fetchone()
+        assert revenue == (2000, 250)
+
+        daily = connection.execute(f"SELECT DISTINCT bucket FROM {rollup_table('weblogs')} ORDER BY bucket").fetchall()
+        assert daily == [("2025-05-09",), ("2025-05-10",)]
+
+        blobs = [blob for blob, in connection.execute(f"SELECT registers FROM {sketch_table('daily')}")]
+        assert round(estimate(merge(blobs))) == 2
+        histogram = connection.execute(f"SELECT SUM(count) FROM {histogram_table('daily')}").fetchone()
+        assert histogram == (len(WEBLOGS),)
+    finally:
+        connection.close()
@@ -0,0 +1,45 @@
+import base64
+import json
+
+import pytest
+
+from date_range import epoch_seconds
+from pagination import decode_cursor, encode_cursor, keyset_clause
+
+
+# Helper function to encode any JSON value the way encode_cursor does
+def raw_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("timestamp, row_id", [(1746780000, 1), (0, 0), (1746780000, 123456789), (1, 10 ** 12)])
+def test_cursor_round_trip(timestamp, row_id):
+    cursor = encode_cursor(timestamp, row_id)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (timestamp, row_id)
+    assert keyset_clause(cursor) == (" AND (timestamp, id) < (?, ?)", [timestamp, row_id])
+
+
+def test_cursor_with_text_timestamp_is_converted():
+    assert decode_cursor(raw_cursor(["2025-05-09 08:59:46", 7])) == (epoch_seconds("2025-05-09 08:59:46"), 7)
+
+
+def test_no_cursor_reads_from_the_newest_row():
+    assert keyset_clause(None) == ("", [])
+    assert keyset_clause("") == ("", [])
+
+
+@pytest.mark.parametrize("cursor", [
+    encode_cursor(1746780000, 42)[:-3],
+    encode_cursor(1746780000, 42) + "!!",
+    "not-a-cursor",
+    raw_cursor([1746780000]),
+    raw_cursor([1746780000, 42, 1]),
+    raw_cursor([1746780000, "42"]),
+    raw_cursor([1746780000.5, 42]),
+    raw_cursor({"timestamp": 1746780000, "id": 42}),
+    raw_cursor(["yesterday", 42]),
+])
+def test_tampered_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
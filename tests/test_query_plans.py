@@ -0,0 +1,69 @@
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+import fastapi_app
+from check_query_plans import DATE_RANGE, HOUR_RANGE, RANGED_TABLES, RAW_RANGE, kpi_routes, seed_sample_database
+
+# Whole days, whole hours and bounds inside an hour, each served by a different table
+RANGE_SHAPES = {"days": DATE_RANGE, "hours": HOUR_RANGE, "raw": RAW_RANGE}
+
+# A plan line that reads a table through one of its indexes
+INDEX_SEARCH = re.compile(r"^SEARCH (\w+) USING (?:COVERING )?(?:INDEX \w+|INTEGER PRIMARY KEY|PRIMARY KEY)")
+
+# A plan line that reads a whole table, with or without an index
+ANY_SCAN = re.compile(r"^SCAN (\w+)")
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    db_file = str(tmp_path_factory.mktemp("plans") / "plans.db")
+    seed_sample_database(db_file)
+    fastapi_app.use_database(db_file)
+    yield TestClient(fastapi_app.app)
+    fastapi_app.pool.close()
+
+
+@pytest.fixture
+def sql_paths(monkeypatch):
+    # Keep the in-memory range sums and heavy hitters out of the way (without
+    # loading them) so every answer comes from SQL, and clear the cache so an
+    # earlier test cannot answer
+    for tracker, method in ((fastapi_app.range_sums, "sums"), (fastapi_app.heavy_hitters, "top")):
+        monkeypatch.setattr(tracker, "loaded", True)
+        monkeypatch.setattr(tracker, method, lambda *args: None)
+    fastapi_app.kpi_cache.clear()
+
+
+# Helper function to call one endpoint and return the plan lines of every
+# SELECT it ran
+def request_plans(client, path, params):
+    statements = []
+
+    def trace(sql):
+        if sql.lstrip().upper().startswith(("SELECT", "WITH")):
+            statements.append(sql)
+
+    fastapi_app.pool.set_trace_callback(trace)
+    try:
+        response = client.get(path, params=params)
+    finally:
+        fastapi_app.pool.set_trace_callback(None)
+    assert response.status_code == 200, response.text
+
+    with fastapi_app.pool.reader() as connection:
+        return [[row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}")] for sql in statements]
+
+
+@pytest.mark.parametrize("shape", RANGE_SHAPES)
+@pytest.mark.parametrize("path", kpi_routes())
+def test_ranged_request_searches_an_index(client, sql_paths, path, shape):
+    plans = request_plans(client, path, RANGE_SHAPES[shape])
+    lines = [detail for plan in plans for detail in plan]
+
+    scans = [detail for detail in lines if ANY_SCAN.match(detail) and ANY_SCAN.match(detail).group(1) in RANGED_TABLES]
+    assert not scans, f"{path} scans a whole table: {scans}"
+
+    searches = [detail for detail in lines if INDEX_SEARCH.match(detail) and INDEX_SEARCH.match(detail).group(1) in RANGED_TABLES]
+    assert searches, f"{path} reads no ranged table through an index: {lines}"
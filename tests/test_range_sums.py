@@ -0,0 +1,119 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from date_range import DateRange, date_range, epoch_text
+from migrations import apply_migrations
+from range_sums import RESOLUTION, SEGMENT_HOURS, TRACKED, FenwickTree, RangeSums, rollup_sums
+from storage import insert_logs
+
+# First second of a segment: rows are written on both sides of it
+BOUNDARY = 490 * SEGMENT_HOURS * RESOLUTION
+
+
+# Helper function to write rows an hour apart around BOUNDARY, cycling
+# through the given dimension values
+def write_rows(connection, hours, products, countries):
+    sales, leads, weblogs = [], [], []
+    for index, hour in enumerate(hours):
+        timestamp = BOUNDARY + hour * RESOLUTION + index % 60
+        product, country = products[index % len(products)], countries[index % len(countries)]
+        sales.append((timestamp, product, ["Alice", "Bob"][index % 2], 100 + index, 10.5 + index, country, "/demo"))
+        leads.append((timestamp, ["Website", "Referral"][index % 2], "New"))
+        weblogs.append((timestamp, "8.8.8.8", country, "/home", "GET", 200, 120, "curl/7.64.1"))
+    connection.execute("BEGIN")
+    insert_logs(connection, sales, leads, weblogs)
+    connection.execute("COMMIT")
+
+
+def fetch_with(connection):
+    return lambda query, params: connection.execute(query, params).fetchall()
+
+
+@pytest.fixture
+def connection(tmp_path):
+    db_file = str(tmp_path / "sums.db")
+    apply_migrations(db_file)
+    connection = sqlite3.connect(db_file, isolation_level=None)
+    yield connection
+    connection.close()
+
+
+# Ranges inside one segment, across the boundary, and open on either side
+RANGES = [
+    DateRange(),
+    DateRange(epoch_text(BOUNDARY - 48 * RESOLUTION), epoch_text(BOUNDARY + 48 * RESOLUTION)),
+    DateRange(epoch_text(BOUNDARY - 5 * RESOLUTION), epoch_text(BOUNDARY - 2 * RESOLUTION)),
+    DateRange(epoch_text(BOUNDARY), None),
+    DateRange(None, epoch_text(BOUNDARY + 3 * RESOLUTION)),
+    date_range(epoch_text(BOUNDARY - 40 * 86400)[:10], epoch_text(BOUNDARY + 40 * 86400)[:10]),
+]
+
+
+# Helper function to compare every tracked sum with the rollups'
+def assert_matches_rollups(connection, sums):
+    for requested in RANGES:
+        for table, groups in TRACKED.items():
+            for dimensions in [()] + groups:
+                assert sums.sums(table, requested, dimensions) == rollup_sums(
+                    fetch_with(connection), table, requested, dimensions
+                ), (table, dimensions, requested)
+
+
+def test_fenwick_tree_range_sums():
+    rng = np.random.default_rng(7)
+    points = rng.integers(-50, 100, (64, 3))
+    tree = FenwickTree(64, 3)
+    for position, values in enumerate(points):
+        tree.add(position, values)
+    for start, end in [(0, 64), (0, 1), (5, 17), (31, 33), (63, 64), (10, 10)]:
+        assert tree.range_sum(start, end).tolist() == points[start:end].sum(axis=0).tolist()
+    assert tree.total().tolist() == points.sum(axis=0).tolist()
+
+
+def test_fenwick_tree_add_columns_keeps_sums():
+    tree = FenwickTree(16, 2)
+    tree.add(3, np.array([5, 7]))
+    for added in range(1, 6):
+        tree.add_columns(added)
+        assert tree.columns == 2 + sum(range(1, added + 1))
+        assert tree.tree.shape[1] >= tree.columns
+        assert tree.range_sum(0, 16).tolist() == [5, 7] + [0] * (tree.columns - 2)
+    tree.add(9, np.arange(tree.columns))
+    assert tree.range_sum(4, 16).tolist() == list(range(tree.columns))
+    assert tree.total()[:2].tolist() == [5, 8]
+
+
+def test_sums_match_rollups_across_segments(connection):
+    write_rows(connection, range(-60, 60), ["AI Assistant", "Demo Session"], ["USA", None])
+    sums = RangeSums()
+    sums.refresh(connection)
+    assert sums.stats()["tables"]["sales_metrics"]["segments"] == 2
+    assert_matches_rollups(connection, sums)
+
+
+def test_sums_match_rollups_after_new_values(connection):
+    write_rows(connection, range(-10, 10), ["AI Assistant"], ["USA"])
+    sums = RangeSums()
+    sums.refresh(connection)
+    # New products and countries add columns to trees already holding sums,
+    # and a row far in the past allocates a segment of its own
+    write_rows(connection, range(-30, 30, 3), ["Rapid Prototyping", "Demo Session", "AI Assistant"], ["UK", "France"])
+    write_rows(connection, [-20 * SEGMENT_HOURS], ["Enterprise AI Package"], ["Germany"])
+    sums.refresh(connection)
+    assert sums.stats()["tables"]["sales_metrics"]["segments"] == 3
+    assert_matches_rollups(connection, sums)
+
+    fresh = RangeSums()
+    fresh.refresh(connection)
+    for table, groups in TRACKED.items():
+        for dimensions in [()] + groups:
+            assert sums.sums(table, DateRange(), dimensions) == fresh.sums(table, DateRange(), dimensions)
+
+
+def test_bounds_inside_an_hour_are_left_to_sql(connection):
+    write_rows(connection, range(2), ["AI Assistant"], ["USA"])
+    sums = RangeSums()
+    sums.refresh(connection)
+    assert sums.sums("sales_metrics", DateRange(epoch_text(BOUNDARY + 90), None)) is None
@@ -0,0 +1,46 @@
+import sqlite3
+
+import pytest
+
+from migrations import apply_migrations
+from update_weblogs_country import _row_digest, checkpoint_path_for, load_checkpoint, save_checkpoint
+
+
+# Helper function to create a database with weblogs rows from these IPs
+def weblogs_database(db_file, ips):
+    apply_migrations(db_file)
+    conn = sqlite3.connect(db_file)
+    with conn:
+        conn.executemany(
+            "INSERT INTO weblogs (timestamp, ip, endpoint, method, status_code, response_time_ms, user_agent)"
+            " VALUES (?, ?, '/home', 'GET', 200, 100, 'curl/7.64.1')",
+            [(1746057600 + index, ip) for index, ip in enumerate(ips)],
+        )
+    return conn
+
+
+@pytest.fixture
+def databases(tmp_path):
+    first = weblogs_database(str(tmp_path / "first.db"), ["8.8.8.8", "1.1.1.1", "9.9.9.9"])
+    second = weblogs_database(str(tmp_path / "second.db"), ["4.4.4.4", "2.2.2.2", "3.3.3.3"])
+    yield first, second
+    first.close()
+    second.close()
+
+
+def test_checkpoint_resumes_on_its_own_database(tmp_path, databases):
+    first, _ = databases
+    path = str(tmp_path / "progress.json")
+    save_checkpoint(path, {"last_id": 2, "last_row": _row_digest(first, 2), "rollups_stale": True})
+    assert load_checkpoint(path, first)["last_id"] == 2
+
+
+def test_checkpoint_from_another_database_is_ignored(tmp_path, databases):
+    first, second = databases
+    path = str(tmp_path / "progress.json")
+    save_checkpoint(path, {"last_id": 2, "last_row": _row_digest(first, 2), "rollups_stale": True})
+    assert load_checkpoint(path, second) == {"last_id": 0, "last_row": None, "rollups_stale": False}
+
+
+def test_default_checkpoint_is_per_database():
+    assert checkpoint_path_for("a/logs.db") != checkpoint_path_for("b/logs.db")
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from visitor_sketches import REGISTERS, STANDARD_ERROR, _hash_value, _register_ranks, estimate, merge
+
+
+# Helper function to build one sketch's registers from IP strings
+def sketch(ips):
+    registers = np.zeros(REGISTERS, np.uint8)
+    indexes, ranks = _register_ranks(np.fromiter((_hash_value(ip) for ip in ips), np.uint64))
+    np.maximum.at(registers, indexes, ranks)
+    return registers
+
+
+def ips(first, last):
+    return [f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}" for n in range(first, last)]
+
+
+def test_empty_sketch_estimates_zero():
+    assert estimate(np.zeros(REGISTERS, np.uint8)) == 0
+    assert estimate(merge([])) == 0
+
+
+@pytest.mark.parametrize("distinct", [10, 1000, 50000, 300000])
+def test_estimate_is_within_three_standard_errors(distinct):
+    assert abs(estimate(sketch(ips(0, distinct))) - distinct) <= 3 * STANDARD_ERROR * distinct + 1
+
+
+def test_repeated_values_do_not_count_twice():
+    values = ips(0, 2000)
+    assert estimate(sketch(values * 5)) == estimate(sketch(values))
+
+
+def test_merge_is_the_sketch_of_the_union():
+    first, second = sketch(ips(0, 30000)), sketch(ips(20000, 60000))
+    merged = merge([first.tobytes(), second.tobytes()])
+    assert np.array_equal(merged, sketch(ips(0, 60000)))
+    assert abs(estimate(merged) - 60000) <= 3 * STANDARD_ERROR * 60000
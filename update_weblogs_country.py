@@ -1,42 +1,218 @@
+import argparse
+import hashlib
+import json
+import os
 import sqlite3
-import geoip2.database
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from dimensions import DimensionEncoder, fact_table, key_column
+from geoip_service import GEOIP_DB_PATH, GeoIPService
+from rollups import rebuild_rollups
 
 # Path to your SQLite database
 DATABASE_PATH = "./logs.db"
 
-# Path to the GeoLite2 database
-GEOIP_DB_PATH = "data/GeoLite2-Country.mmdb"
+# The backfill writes straight to the database, outside the API's writer, so a
+# running API never hears about it: its range sums, heavy hitters and KPI cache
+# keep serving the old countries until the API is restarted.
+
+# Suffix of the file next to the database where progress is recorded, so an
+# interrupted backfill resumes where it stopped
+CHECKPOINT_SUFFIX = ".country-backfill.json"
+
+# Batch tuning
+CHUNK_SIZE = 5000         # NULL-country rows read and updated per executemany
+COMMIT_EVERY = 50000      # rows written between commits (and checkpoints)
+IP_CACHE_SIZE = 100000    # distinct IPs remembered per process
+
+# Shared mmap lookup service (one per process; forked workers inherit it)
+geoip = GeoIPService(GEOIP_DB_PATH, IP_CACHE_SIZE)
+
 
 # Function to convert IP address to country
 def ip_to_country(ip_address):
+    return geoip.country(ip_address)
+
+
+# Helper function to point a pool worker at the parent's GeoLite2 file, for
+# start methods that re-import this module instead of forking
+def _init_worker(geoip_path):
+    geoip.db_path = geoip_path
+
+
+# Helper function to resolve one chunk of (id, ip) rows into UPDATE parameters
+def resolve_chunk(rows):
+    countries = geoip.countries([ip_address for _, ip_address in rows])
+    return [(country, weblog_id) for country, (weblog_id, _) in zip(countries, rows)]
+
+
+# Helper function to stream NULL-country rows in id order, one chunk at a time.
+# NOT INDEXED keeps SQLite walking the rowid range from `after_id`; through the
+# country index every chunk would sort all remaining NULL rows again.
+def iter_null_chunks(conn, after_id, chunk_size):
+    while True:
+        rows = conn.execute(
+            f"SELECT id, ip FROM {fact_table('weblogs')} NOT INDEXED WHERE {key_column('country')} IS NULL"
+            " AND id > ? ORDER BY id LIMIT ?",
+            (after_id, chunk_size),
+        ).fetchall()
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1][0]
+
+
+def checkpoint_path_for(database_path):
+    """
+    Return the default checkpoint path of a database: beside it, named after it.
+    """
+    return f"{database_path}{CHECKPOINT_SUFFIX}"
+
+
+# Helper function to fingerprint the weblogs row a checkpoint stopped at by
+# its id, timestamp and IP, which the backfill never changes
+def _row_digest(conn, weblog_id):
+    row = conn.execute(f"SELECT id, timestamp, ip FROM {fact_table('weblogs')} WHERE id = ?", (weblog_id,)).fetchone()
+    return None if row is None else hashlib.sha1(json.dumps(list(row)).encode()).hexdigest()
+
+
+def load_checkpoint(path, conn):
+    """
+    Return the saved progress ({"last_id", "last_row", "rollups_stale"}), or
+    a fresh start when there is none or it was saved for another database:
+    the row at its last id, read through `conn`, must be the one it recorded.
+    """
+    fresh = {"last_id": 0, "last_row": None, "rollups_stale": False}
     try:
-        with geoip2.database.Reader(GEOIP_DB_PATH) as reader:
-            response = reader.country(ip_address)
-            return response.country.name  # Returns the country name
-    except geoip2.errors.AddressNotFoundError:
-        return "Unknown Country"
-    except Exception as e:
-        return f"Error: {str(e)}"
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return fresh
+    if checkpoint["last_id"] and _row_digest(conn, checkpoint["last_id"]) != checkpoint.get("last_row"):
+        print(f"Ignoring {path}: it was saved for another database.")
+        return fresh
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(temp_path, path)
+
 
 # Update the `weblogs` table
-def update_weblogs_with_country():
-    # Connect to SQLite database
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+def update_weblogs_with_country(database_path=DATABASE_PATH, checkpoint_path=None,
+                                workers=0, chunk_size=CHUNK_SIZE, commit_every=COMMIT_EVERY,
+                                restart=False):
+    """
+    Fill in weblogs.country for every row where it is NULL.
+
+    Rows are read in id-ordered chunks (never the whole table at once),
+    resolved through the shared GeoIPService, encoded to country keys, and
+    written back with
+    executemany, committing every `commit_every` rows. After each commit the
+    last id written is saved to `checkpoint_path` (default: beside the
+    database), so a rerun against the same database resumes from there. With `workers` > 1, chunks (contiguous id ranges) are resolved by a
+    process pool while this process keeps the single SQLite write connection.
+    The weblogs rollups are rebuilt once at the end.
+    Returns {"rows", "seconds", "rows_per_second"}.
+    """
+    # Fail fast rather than writing NULL countries back when the database is missing
+    geoip.open()
+    if checkpoint_path is None:
+        checkpoint_path = checkpoint_path_for(database_path)
+    conn = sqlite3.connect(database_path, timeout=30)
+    checkpoint = load_checkpoint(checkpoint_path, conn) if not restart else {
+        "last_id": 0, "last_row": None, "rollups_stale": False,
+    }
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(geoip.db_path,))
+    started = time.perf_counter()
+    updated = 0
+    uncommitted = 0
+    encoder = DimensionEncoder()
 
-    # Query all IP addresses in `weblogs` where country is NULL
-    cursor.execute("SELECT id, ip FROM weblogs WHERE country IS NULL")
-    rows = cursor.fetchall()
+    def commit(last_id):
+        nonlocal uncommitted
+        conn.commit()
+        encoder.confirm(conn)
+        checkpoint.update(last_id=last_id, last_row=_row_digest(conn, last_id), rollups_stale=True)
+        save_checkpoint(checkpoint_path, checkpoint)
+        uncommitted = 0
+        elapsed = time.perf_counter() - started
+        print(f"{updated} rows updated through id {last_id} ({updated / elapsed:.0f} rows/s)")
 
-    for row in rows:
-        weblog_id, ip_address = row
-        country = ip_to_country(ip_address)  # Convert IP to country
-        cursor.execute("UPDATE weblogs SET country = ? WHERE id = ?", (country, weblog_id))
+    try:
+        chunks = iter_null_chunks(conn, checkpoint["last_id"], chunk_size)
+        if executor is None:
+            resolved = ((rows[-1][0], resolve_chunk(rows)) for rows in chunks)
+        else:
+            resolved = _resolve_in_pool(executor, chunks, workers * 2)
+
+        last_id = checkpoint["last_id"]
+        for last_id, params in resolved:
+            params = encoder.encode_rows(conn, "weblogs", ("country", "id"), params)
+            conn.executemany(f"UPDATE {fact_table('weblogs')} SET {key_column('country')} = ? WHERE id = ?", params)
+            updated += len(params)
+            uncommitted += len(params)
+            if uncommitted >= commit_every:
+                commit(last_id)
+        if uncommitted:
+            commit(last_id)
+
+        # Countries feed the weblogs rollups, so regenerate them once at the end
+        if checkpoint["rollups_stale"]:
+            with conn:
+                rebuild_rollups(conn, ["weblogs"])
+            checkpoint["rollups_stale"] = False
+            save_checkpoint(checkpoint_path, checkpoint)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": updated,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(updated / elapsed) if elapsed else 0,
+    }
+
+
+# Helper function to resolve chunks in a process pool, keeping at most
+# `ahead` chunks in flight and yielding (last id, params) in id order
+def _resolve_in_pool(executor, chunks, ahead):
+    pending = deque()
+    for rows in chunks:
+        pending.append((rows[-1][0], executor.submit(resolve_chunk, rows)))
+        if len(pending) >= ahead:
+            last_id, future = pending.popleft()
+            yield last_id, future.result()
+    while pending:
+        last_id, future = pending.popleft()
+        yield last_id, future.result()
 
-    # Commit changes and close connection
-    conn.commit()
-    conn.close()
 
 if __name__ == "__main__":
-    update_weblogs_with_country()
-    print("Weblogs table updated with country names.")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Backfill weblogs.country from the GeoLite2 database")
+    parser.add_argument("--db", default=DATABASE_PATH, help="Path to the SQLite database")
+    parser.add_argument("--geoip", default=GEOIP_DB_PATH, help="Path to the GeoLite2 Country database")
+    parser.add_argument("--checkpoint", help=f"Progress file used to resume (default: <db>{CHECKPOINT_SUFFIX})")
+    parser.add_argument("--workers", type=int, default=0, help="Resolve chunks in this many processes")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows per read/update batch")
+    parser.add_argument("--commit-every", type=int, default=COMMIT_EVERY, help="Rows between commits")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first row")
+    args = parser.parse_args()
+
+    geoip.db_path = args.geoip
+    result = update_weblogs_with_country(
+        args.db, args.checkpoint, args.workers, args.chunk_size, args.commit_every, args.restart
+    )
+    print(f"Weblogs table updated with country names: {result['rows']} rows in "
+          f"{result['seconds']}s ({result['rows_per_second']} rows/s).")
+    if result["rows"]:
+        print("Restart the dashboard API so its in-memory KPI state picks up the new countries.")
@@ -0,0 +1,220 @@
+import argparse
+import hashlib
+import math
+import sqlite3
+from functools import lru_cache
+
+import numpy as np
+
+from date_range import DateRange, bucket_clause, epoch_seconds, epoch_text
+from dimensions import fact_table
+
+# Path to the SQLite database
+DB_FILE = "logs.db"
+
+# HyperLogLog precision: 2**12 one-byte registers (4 KiB) per sketch. The
+# estimate's standard error is 1.04 / sqrt(registers), about 1.6%, whatever
+# the range or the number of sketches merged; 99.7% of estimates fall
+# within three standard errors (about 4.9%) of the exact count.
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+STANDARD_ERROR = round(1.04 / math.sqrt(REGISTERS), 4)
+
+# Bucket length in seconds per grain, the same grains as the KPI rollups
+GRAINS = {"hourly": 3600, "daily": 86400}
+
+# Raw rows read per batch when sketches are built from the weblogs table
+READ_CHUNK = 50000
+
+
+def sketch_table(grain):
+    """
+    Return the name of the table holding the visitor sketches of a grain.
+    """
+    return f"visitor_sketch_{grain}"
+
+
+def create_sketch_tables(connection):
+    """
+    Create the hourly and daily visitor sketch tables: one HyperLogLog of
+    the visitors' IPs per bucket, its registers stored as a BLOB.
+    """
+    for grain in GRAINS:
+        connection.execute(f"""
+        CREATE TABLE IF NOT EXISTS {sketch_table(grain)} (
+            bucket TEXT PRIMARY KEY,
+            registers BLOB NOT NULL
+        )
+        """)
+
+
+# Helper function to hash one IP to 64 bits, stable across processes
+@lru_cache(maxsize=65536)
+def _hash_value(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "little")
+
+
+# Helper function to split 64-bit hashes into register indexes (the top
+# PRECISION bits) and ranks (1 + leading zeros of the low 32 bits)
+def _register_ranks(hashes):
+    indexes = (hashes >> np.uint64(64 - PRECISION)).astype(np.intp)
+    low = (hashes & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    _, bit_length = np.frexp(low)
+    ranks = np.where(low > 0, 33 - bit_length, 33).astype(np.uint8)
+    return indexes, ranks
+
+
+# Highest rank a register can hold: 1 + the 32 bits the ranks are drawn from
+MAX_RANK = 33
+
+
+# Helper functions of the estimator below, correcting for registers that are
+# still empty (sigma) and for those at the highest rank (tau)
+def _sigma(x):
+    if x == 1:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous, z = z, z + x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x):
+    if x == 0 or x == 1:
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        y *= 0.5
+        previous, z = z, z - (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+def estimate(registers):
+    """
+    Estimate the number of distinct values added to a sketch's registers.
+
+    Uses Ertl's improved estimator over the histogram of register values
+    ("New cardinality estimation algorithms for HyperLogLog sketches",
+    2017), which stays unbiased from empty sketches up to billions of values
+    without the small-range switch and bias tables of the original.
+    """
+    counts = np.bincount(registers, minlength=MAX_RANK + 1)
+    z = REGISTERS * _tau(1 - counts[MAX_RANK] / REGISTERS)
+    for rank in range(MAX_RANK - 1, 0, -1):
+        z = 0.5 * (z + counts[rank])
+    z += REGISTERS * _sigma(counts[0] / REGISTERS)
+    return round(REGISTERS * REGISTERS / (2 * math.log(2) * z))
+
+
+def merge(blobs):
+    """
+    Merge stored sketches into one array of registers (their union).
+    """
+    if not blobs:
+        return np.zeros(REGISTERS, np.uint8)
+    return np.frombuffer(b"".join(blobs), np.uint8).reshape(-1, REGISTERS).max(axis=0)
+
+
+# Helper function to fold (timestamp, ip) rows into the stored sketches of one grain
+def _fold(connection, grain, timestamps, hashes):
+    starts, positions = np.unique(timestamps - timestamps % GRAINS[grain], return_inverse=True)
+    buckets = [epoch_text(int(start)) for start in starts]
+    if grain == "daily":
+        buckets = [bucket[:10] for bucket in buckets]
+    registers = np.zeros((len(buckets), REGISTERS), np.uint8)
+    indexes, ranks = _register_ranks(hashes)
+    np.maximum.at(registers, (positions, indexes), ranks)
+
+    table = sketch_table(grain)
+    for row, bucket in enumerate(buckets):
+        stored = connection.execute(f"SELECT registers FROM {table} WHERE bucket = ?", (bucket,)).fetchone()
+        if stored is not None:
+            np.maximum(registers[row], np.frombuffer(stored[0], np.uint8), out=registers[row])
+    connection.executemany(
+        f"INSERT OR REPLACE INTO {table} (bucket, registers) VALUES (?, ?)",
+        [(bucket, registers[row].tobytes()) for row, bucket in enumerate(buckets)],
+    )
+
+
+def refresh_sketches(connection, after_id=0):
+    """
+    Fold weblogs rows with id > after_id into the visitor sketches. Run it
+    in the same transaction as the inserts, like refresh_rollups.
+    """
+    cursor = connection.execute(
+        f"SELECT timestamp, ip FROM {fact_table('weblogs')} WHERE id > ? AND timestamp IS NOT NULL AND ip IS NOT NULL",
+        (after_id,),
+    )
+    timestamps, hashes = [], []
+    while True:
+        rows = cursor.fetchmany(READ_CHUNK)
+        if not rows:
+            break
+        timestamps.append(np.fromiter((row[0] for row in rows), np.int64, len(rows)))
+        hashes.append(np.fromiter((_hash_value(row[1]) for row in rows), np.uint64, len(rows)))
+    if not timestamps:
+        return
+    timestamps = np.concatenate(timestamps)
+    hashes = np.concatenate(hashes)
+    for grain in GRAINS:
+        _fold(connection, grain, timestamps, hashes)
+
+
+def rebuild_sketches(connection):
+    """
+    Regenerate the visitor sketches from the raw weblogs rows.
+    """
+    for grain in GRAINS:
+        connection.execute(f"DELETE FROM {sketch_table(grain)}")
+    refresh_sketches(connection)
+
+
+def sketch_query(requested=DateRange()):
+    """
+    Return (query, params) selecting the registers of the sketches that
+    cover a DateRange, or None for bounds inside an hour, which sketches
+    cannot answer. The whole days of the range come from the daily sketches
+    and only the hours before its first and after its last midnight from the
+    hourly ones, so a long range merges a few sketches per day at most.
+    """
+    grain = requested.grain
+    if grain is None:
+        return None
+    day = GRAINS["daily"]
+    start, end = (epoch_seconds(bound) if bound is not None else None for bound in requested)
+    first_day = -(-start // day) * day if start is not None else None
+    last_day = end - end % day if end is not None else None
+    if grain == "daily" or first_day is None or last_day is None or first_day < last_day:
+        segments = [("daily", first_day, last_day)]
+        if start is not None and start < first_day:
+            segments.append(("hourly", start, first_day))
+        if end is not None and last_day < end:
+            segments.append(("hourly", last_day, end))
+    else:
+        segments = [("hourly", start, end)]
+
+    selects = []
+    params = []
+    for segment_grain, segment_start, segment_end in segments:
+        clause, segment_params = bucket_clause(DateRange(epoch_text(segment_start), epoch_text(segment_end)), segment_grain)
+        selects.append(f"SELECT registers FROM {sketch_table(segment_grain)} WHERE 1=1{clause}")
+        params += segment_params
+    return " UNION ALL ".join(selects), params
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the unique-visitor HyperLogLog sketches")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--db", default=DB_FILE, help="Path to the SQLite database")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    with conn:
+        rebuild_sketches(conn)
+    conn.close()
+    print("Rebuilt the visitor sketches.")
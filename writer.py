@@ -0,0 +1,141 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+# Retries for jobs that still find the database busy or locked after the
+# busy timeout, with exponential backoff starting at BUSY_RETRY_DELAY_SECONDS
+BUSY_RETRIES = 3
+BUSY_RETRY_DELAY_SECONDS = 0.05
+
+_STOP = object()
+
+
+# Helper function to tell SQLITE_BUSY/SQLITE_LOCKED apart from other errors
+def is_busy_error(error):
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+class DatabaseWriter:
+    """
+    The one thread that writes to the database.
+
+    Callers hand it jobs, `job(connection, *args)`, and get a
+    concurrent.futures.Future back (or await `run`). The thread takes jobs
+    off a FIFO queue one at a time and runs each inside its own transaction
+    on the pool's writer connection, so every write in the process is
+    serialized here: no two writers ever race for the SQLite write lock,
+    and the event loop only ever waits on a future. The future resolves
+    after the commit, with the job's return value or its exception.
+
+    Jobs that hit SQLITE_BUSY (another process holding the lock past the
+    busy timeout) are rolled back and retried with backoff.
+    """
+
+    def __init__(self, pool, retries=BUSY_RETRIES, retry_delay=BUSY_RETRY_DELAY_SECONDS):
+        self.pool = pool
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_retries = 0
+        self.total_queue_seconds = 0.0
+        self.total_run_seconds = 0.0
+        self.max_queue_seconds = 0.0
+        self.max_run_seconds = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, job, *args):
+        """
+        Queue `job(connection, *args)` and return a Future for its result.
+        """
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                raise RuntimeError("The database writer is not running")
+            self.submitted += 1
+            self._queue.put((job, args, future, time.perf_counter()))
+        return future
+
+    async def run(self, job, *args):
+        """
+        Await `job(connection, *args)` from the event loop without blocking it.
+        """
+        return await asyncio.wrap_future(self.submit(job, *args))
+
+    def _execute(self, job, args):
+        for attempt in range(self.retries + 1):
+            try:
+                with self.pool.writer() as connection:
+                    return job(connection, *args)
+            except sqlite3.OperationalError as e:
+                if not is_busy_error(e) or attempt == self.retries:
+                    raise
+                with self._lock:
+                    self.busy_retries += 1
+                time.sleep(self.retry_delay * 2 ** attempt)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            job, args, future, queued_at = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            try:
+                result = self._execute(job, args)
+            except BaseException as e:
+                future.set_exception(e)
+                outcome = "failed"
+            else:
+                future.set_result(result)
+                outcome = "completed"
+            finished = time.perf_counter()
+            with self._lock:
+                setattr(self, outcome, getattr(self, outcome) + 1)
+                self.total_queue_seconds += started - queued_at
+                self.total_run_seconds += finished - started
+                self.max_queue_seconds = max(self.max_queue_seconds, started - queued_at)
+                self.max_run_seconds = max(self.max_run_seconds, finished - started)
+
+    def close(self, timeout=30):
+        """
+        Run the jobs already queued, then stop the thread.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(_STOP)
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            done = self.completed + self.failed
+            return {
+                "running": self._thread is not None,
+                "queued": self._queue.qsize(),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "busy_retries": self.busy_retries,
+                "avg_queue_ms": round(self.total_queue_seconds * 1000 / done, 3) if done else 0.0,
+                "max_queue_ms": round(self.max_queue_seconds * 1000, 3),
+                "avg_run_ms": round(self.total_run_seconds * 1000 / done, 3) if done else 0.0,
+                "max_run_ms": round(self.max_run_seconds * 1000, 3),
+            }